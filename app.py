@@ -1,129 +1,695 @@
 import streamlit as st
+import functools
 import io
 import os
-import json
 import re
-from openai import OpenAI
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from audio_recorder_streamlit import audio_recorder
+from components.audio_recorder import audio_recorder
+from core.meeting_context import MeetingContext
+from core.summarizer import IncrementalSummarizer
+from core.pipeline import STATE_LABELS
+from core.cache import ResultCache
+from core.prefilter import TsukkomiGate
+from core.prompts import PromptRegistry
+from core.transcript import TranscriptStore
+from core.search import TranscriptIndex
+from core.journal import MeetingJournal
+from core.scheduler import ChunkScheduler
+from core.metrics import MetricsRecorder, RollingLog
+from core.services import MeetingServices, create_asr_backend, create_openai_client
 
-# OpenAIクライアント初期化
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# OpenAIクライアント初期化（プロセス内の全セッションで共有）
+@st.cache_resource
+def get_openai_client():
+    """レート制限・再試行付きのOpenAIクライアントを取得（openaiの読み込みは初回だけ）"""
+    return create_openai_client()
 
-# プロンプト読み込み
-def load_prompt(filename):
-    """プロンプトファイルを読み込む"""
+client = get_openai_client()
+
+# プロンプトレジストリ（起動時に prompts/*.txt をまとめて読み込んで実行時の形にコンパイルし、更新時刻が変わったら読み直す）
+@st.cache_resource
+def get_prompt_registry():
+    """プロンプトレジストリを取得"""
+    return PromptRegistry("prompts")
+
+prompt_registry = get_prompt_registry()
+
+# キャラクター画像（読み込みと縮小は初回だけ）
+@st.cache_resource
+def load_character_image(image_path, max_width=480):
+    """表示サイズに縮小したPNGバイト列を返す（画像が無ければNone）"""
+    if not os.path.exists(image_path):
+        return None
+    from PIL import Image
+    with Image.open(image_path) as image:
+        image.thumbnail((max_width, max_width * 4))
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+# 処理状況フラグメントの定期実行間隔（秒）。完了したチャンクを取り込んだときはページ全体を描画し直す
+STATUS_REFRESH_SECONDS = 1.0
+
+# 描画時間を計測するパネル
+PANEL_LABELS = {
+    "recorder": "録音",
+    "status": "処理状況",
+    "tsukkomi": "ツッコミ",
+    "transcript": "文字起こし",
+    "summary": "要約",
+    "sidebar": "サイドバー統計",
+}
+
+# 計測する処理段階
+STAGE_LABELS = {
+    "receive": "受信",
+    "hash": "ハッシュ",
+    "preprocess": "音声前処理",
+    "transcribe": "文字起こし",
+    "tsukkomi": "ツッコミ生成",
+    "parse": "ツッコミ解析",
+    "summary": "要約",
+    "render": "描画",
+    "chunk": "チャンク全体",
+}
+
+# セッションに残す直近の件数（全件は会議ジャーナルにある）
+TRANSCRIPT_TAIL = 50
+TSUKKOMI_TAIL = 20
+# 処理状態をジャーナルに保存する間隔（チャンク数）。再開時に読み直すのはこれ以下の件数
+CHECKPOINT_EVERY = 20
+# API呼び出し・音声圧縮の記録をセッションに残す件数（それより前は累計だけ）
+LOG_WINDOW = 100
+
+# 発言検索で表示する件数と、話題の要約に渡す関連チャンクのトークン上限
+SEARCH_LIMIT = 20
+TOPIC_CONTEXT_TOKENS = 3000
+
+NO_TSUKKOMI_TEXT = "ツッコミは不要みたい！"
+
+# ツッコミ吹き出しのCSS（ツッコミ無しのときは .no-tsukkomi で色を変える）
+TSUKKOMI_CSS = """
+<style>
+.tsukkomi-bubble {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: white;
+    padding: 20px;
+    border-radius: 20px;
+    margin: 10px 0;
+    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+}
+.tsukkomi-bubble.no-tsukkomi {
+    background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%);
+}
+.tsukkomi-time {
+    font-size: 0.85em;
+    opacity: 0.9;
+    margin-bottom: 8px;
+}
+.tsukkomi-text {
+    font-size: 1.1em;
+    font-weight: bold;
+    margin: 10px 0;
+}
+</style>
+"""
+
+# API結果キャッシュ（プロセス内の全セッションで共有）
+@st.cache_resource
+def get_result_cache():
+    """文字起こし・ツッコミ・要約結果のディスクキャッシュを取得"""
+    return ResultCache(os.environ.get("OTOKOMAE_CACHE_PATH", ".cache/results.sqlite3"))
+
+result_cache = get_result_cache()
+
+# 会議ジャーナル（全セッションで共有）
+@st.cache_resource
+def get_meeting_journal():
+    """文字起こしとツッコミを追記する会議ジャーナルを取得"""
+    return MeetingJournal(os.environ.get("OTOKOMAE_JOURNAL_PATH", ".cache/meetings.sqlite3"))
+
+meeting_journal = get_meeting_journal()
+
+# 文字起こしエンジン（OTOKOMAE_ASR_BACKEND: remote / local / auto）
+@st.cache_resource
+def get_asr_backend():
+    """設定に応じたASRバックエンドを取得（autoはAPIが遅い・失敗したときにローカルへ切り替える）"""
+    return create_asr_backend(client)
+
+asr_backend = get_asr_backend()
+
+# 処理段階ごとの計測（OTOKOMAE_METRICS_PATH にチャンクごとの記録を追記、OTOKOMAE_METRICS_PORT で /metrics を公開）
+@st.cache_resource
+def get_metrics():
+    """プロセス共有の計測器を取得"""
+    metrics = MetricsRecorder(path=os.environ.get("OTOKOMAE_METRICS_PATH"))
+    port = os.environ.get("OTOKOMAE_METRICS_PORT")
+    if port:
+        metrics.serve(int(port), host=os.environ.get("OTOKOMAE_METRICS_HOST", "127.0.0.1"))
+    return metrics
+
+metrics = get_metrics()
+
+# 文字起こし・ツッコミ・要約の生成処理（batch.py と共通）
+@st.cache_resource
+def get_meeting_services():
+    """API呼び出しをまとめた生成器を取得"""
+    return MeetingServices(client, result_cache, prompt_registry, asr_backend, metrics)
+
+services = get_meeting_services()
+
+# 音声を文字起こし（ワーカースレッドから呼ばれるため、エラーは呼び出し側で表示する）
+transcribe_audio = services.transcribe_audio
+
+# ツッコミ生成（ワーカースレッドから呼ばれるため、エラーは呼び出し側で表示する）
+generate_tsukkomi = services.generate_tsukkomi
+
+# 部分要約生成（バックグラウンドスレッドから呼ばれるためst.*は使わない）
+generate_partial_summary = services.generate_partial_summary
+
+# 要約生成
+def generate_summary(transcript_text, on_delta=None, token_log=None, focus=None):
+    """文字起こしテキストから要約を生成（on_deltaを渡すと受信途中のテキストで呼ばれる）"""
     try:
-        with open(f"prompts/{filename}", "r", encoding="utf-8") as f:
-            return f.read()
+        return services.generate_summary(transcript_text, on_delta=on_delta, token_log=token_log, focus=focus)
     except Exception as e:
-        st.error(f"プロンプト読み込みエラー: {e}")
-        return ""
+        st.error(f"要約生成エラー: {e}")
+        return None
 
-# 音声を文字起こし
-def transcribe_audio(audio_bytes):
-    """音声バイトデータをWhisperで文字起こし"""
-    try:
-        # 音声ファイルとして送信
-        audio_file = io.BytesIO(audio_bytes)
-        audio_file.name = "audio.wav"
+
+# チャンク処理パイプライン作成（会議コンテキスト・要約器・ツッコミ判定と連携する）
+create_pipeline = services.create_pipeline
+
+
+# 完了したチャンクを履歴に反映
+def apply_finished_jobs(jobs):
+    """パイプラインから回収したジョブの結果をセッション状態に記録"""
+    backlog = len(st.session_state.pipeline.active_jobs())
+    for job in jobs:
+        # 処理時間と処理待ちの件数から次のチャンク長を決める
+        st.session_state.chunk_scheduler.finished(job.chunk, backlog)
+        metrics.record_chunk(
+            st.session_state.meeting_id,
+            job.chunk,
+            time.perf_counter() - job.submitted_at,
+            transcribe_seconds=job.transcribe_seconds,
+            comment_seconds=job.comment_seconds,
+            usage=job.usage
+        )
+        
+        if job.error:
+            stage, error = job.error
+            label = "文字起こしエラー" if stage == "transcribe" else "ツッコミ生成エラー"
+            st.session_state.pipeline_errors.append(f"チャンク #{job.chunk} {label}: {error}")
+        
+        if not job.transcript:
+            continue
+        
+        # 記録（メモリには直近分だけ残し、全件はジャーナルに追記する）
+        segment = st.session_state.transcripts.append(job.chunk, job.timestamp, job.transcript)
         
-        # Whisper APIで文字起こし
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            language="ja"
+        # 最初のチャンクで会議開始時刻を記録
+        if st.session_state.meeting_start_time is None:
+            st.session_state.meeting_start_time = time.time()
+        
+        meeting_journal.record_chunk(
+            st.session_state.meeting_id,
+            segment,
+            tsukkomi=job.tsukkomi,
+            no_tsukkomi=not job.error and not job.tsukkomi,
+            transcribe_seconds=job.transcribe_seconds,
+            comment_seconds=job.comment_seconds
         )
         
-        return transcript.text
-    except Exception as e:
-        st.error(f"文字起こしエラー: {e}")
-        return None
+        if job.error:
+            continue
+        
+        if job.tsukkomi:
+            st.session_state.tsukkomi_history.append({
+                "chunk": job.chunk,
+                "time": job.timestamp,
+                "text": job.tsukkomi,
+                "no_tsukkomi": False
+            })
+        else:
+            # ツッコミ不要の場合も履歴に記録
+            st.session_state.tsukkomi_history.append({
+                "chunk": job.chunk,
+                "time": job.timestamp,
+                "text": NO_TSUKKOMI_TEXT,
+                "no_tsukkomi": True
+            })
+        del st.session_state.tsukkomi_history[:-TSUKKOMI_TAIL]
+
+
+# 再開用の処理状態を保存
+def save_checkpoint(meeting_id, meeting_context, summarizer, transcript_index, chunk):
+    """会議コンテキスト・要約器・検索索引の状態を CHECKPOINT_EVERY 件ごとにジャーナルへ保存
 
-# ツッコミ生成
-def generate_tsukkomi(transcript_text, prompt_type="otokomae"):
-    """文字起こしテキストからツッコミを生成"""
+    パイプラインのワーカースレッドからチャンク順に呼ばれる（セッション状態には触れない）。
+    ここでは状態の複製だけを取り、圧縮と書き込みはジャーナルのバックグラウンドスレッドに任せる。
+    """
+    if meeting_context.chunk_count % CHECKPOINT_EVERY:
+        return
+    state = {
+        "context": meeting_context.state(),
+        "summarizer": summarizer.state(),
+        "index": transcript_index.state(),
+    }
+    meeting_journal.record_checkpoint_async(meeting_id, chunk, state)
+
+
+# 新しい会議を開始
+def start_meeting(meeting_id=None):
+    """会議単位のセッション状態を作り直す（meeting_idを省略するとジャーナルに新しい会議を登録）"""
+    if "pipeline" in st.session_state:
+        st.session_state.pipeline.close()
+        st.session_state.summarizer.close()
+    threshold = st.session_state.tsukkomi_gate.threshold if "tsukkomi_gate" in st.session_state else 0.45
+    
+    st.session_state.meeting_id = meeting_id or meeting_journal.create_meeting()
+    st.query_params["meeting"] = st.session_state.meeting_id
+    st.session_state.transcripts = TranscriptStore(max_segments=TRANSCRIPT_TAIL)
+    st.session_state.tsukkomi_history = []
+    st.session_state.chunk_counter = 0
+    st.session_state.meeting_start_time = None
+    st.session_state.meeting_end_time = None
+    # 発言検索の索引（会議コンテキストがチャンクを取り込むたびに差分更新され、本文はジャーナルから読む）
+    meeting_id = st.session_state.meeting_id
+    st.session_state.transcript_index = TranscriptIndex(
+        fetch=lambda chunks: meeting_journal.chunk_texts(meeting_id, chunks)
+    )
+    st.session_state.meeting_context = MeetingContext(index=st.session_state.transcript_index)
+    # 呼び出しごとの記録は直近の分と累計だけを持つ（長時間の会議でもセッションのメモリを一定に保つ）
+    st.session_state.tsukkomi_token_log = RollingLog(maxlen=LOG_WINDOW)
+    st.session_state.audio_stats_log = RollingLog(maxlen=LOG_WINDOW)
+    st.session_state.summary_token_log = RollingLog(maxlen=LOG_WINDOW)
+    st.session_state.tsukkomi_gate = TsukkomiGate(threshold=threshold, max_log=LOG_WINDOW)
+    st.session_state.chunk_scheduler = ChunkScheduler()
+    st.session_state.summarizer = IncrementalSummarizer(generate_partial_summary, generate_summary)
+    st.session_state.pipeline = create_pipeline(
+        st.session_state.meeting_context,
+        st.session_state.summarizer,
+        st.session_state.tsukkomi_gate,
+        st.session_state.tsukkomi_token_log,
+        st.session_state.audio_stats_log,
+        # ワーカースレッドから呼ばれるので、セッション状態ではなくこの会議のオブジェクトを渡す
+        checkpoint=functools.partial(
+            save_checkpoint,
+            meeting_id,
+            st.session_state.meeting_context,
+            st.session_state.summarizer,
+            st.session_state.transcript_index
+        )
+    )
+    st.session_state.pipeline_errors = []
+    if hasattr(st.session_state, 'summary_result'):
+        del st.session_state.summary_result
+    st.session_state.pop("topic_summary", None)
+
+
+# ジャーナルから会議を再開
+def resume_meeting(meeting_id):
+    """ジャーナルに記録された会議の表示と処理状態を復元"""
+    start_meeting(meeting_id)
+    meeting = meeting_journal.meeting(meeting_id)
+    
+    # 表示は直近の件数だけを読み込む（会議の長さに関係なく一定）
+    rows = meeting_journal.tail(meeting_id, TRANSCRIPT_TAIL)
+    st.session_state.transcripts.restore(rows, meeting["chunks"], meeting["chars"], meeting["tokens"])
+    st.session_state.tsukkomi_history = [
+        {
+            "chunk": row["chunk"],
+            "time": row["time"],
+            "text": row["tsukkomi"] or NO_TSUKKOMI_TEXT,
+            "no_tsukkomi": row["no_tsukkomi"]
+        }
+        for row in rows
+        if row["tsukkomi"] or row["no_tsukkomi"]
+    ][-TSUKKOMI_TAIL:]
+    st.session_state.meeting_start_time = meeting["started_at"]
+    if meeting["summary"]:
+        st.session_state.summary_result = meeting["summary"]
+    
+    # 会議コンテキスト・要約器・検索索引は最新のチェックポイントから戻し、それ以降のチャンクだけを取り込み直す
+    checkpoint_chunk, state = meeting_journal.checkpoint(meeting_id)
+    if state:
+        st.session_state.meeting_context.restore(state["context"])
+        st.session_state.summarizer.restore(state["summarizer"])
+        st.session_state.transcript_index.restore(state["index"])
+    for chunk, timestamp, text in meeting_journal.iter_chunks(meeting_id, after=checkpoint_chunk):
+        st.session_state.meeting_context.add_chunk(timestamp, text, chunk=chunk)
+        st.session_state.summarizer.add_chunk(f"[{timestamp}] {text}")
+    # チェックポイントにだけ入っていて記録が間に合わなかったチャンクの番号も使わない
+    st.session_state.chunk_counter = max(meeting["last_chunk"], checkpoint_chunk)
+
+
+# パネルの描画時間を計測
+@contextmanager
+def panel_timer(name):
+    """パネルの描画にかかった時間（ms）をセッション状態に記録"""
+    started = time.perf_counter()
     try:
-        # プロンプト選択
-        prompt_file = "otokомae_prompt.txt" if prompt_type == "otokomae" else "tsukkomi_prompt.txt"
-        system_prompt = load_prompt(prompt_file)
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        st.session_state.panel_render_ms[name] = seconds * 1000
+        metrics.observe("render", seconds)
+
+
+# 処理状況の表示（フラグメントとして定期実行され、完了したチャンクを取り込む）
+@st.fragment(run_every=STATUS_REFRESH_SECONDS)
+def pipeline_status_panel():
+    """処理中チャンクの状態を表示し、完了したチャンクを取り込む
+
+    完了したチャンクを取り込むたびにページ全体を1回再実行する（ツッコミ・文字起こし・統計の各パネルは
+    ここから個別に再実行できないため）。取り込むものが無い間はこのフラグメントだけが再実行される。
+    """
+    with panel_timer("status"):
+        finished = st.session_state.pipeline.collect()
+        if finished:
+            apply_finished_jobs(finished)
+            # 各パネルを毎秒定期実行して変化を待つより、チャンクごとに1回全体を描画し直すほうが軽い
+            # （フラグメントは描画を省くと表示が消えるので、定期実行すると変化が無くても毎回描画することになる）
+            st.rerun()
         
-        if not system_prompt:
-            return "プロンプトが読み込めませんでした。"
+        for job in st.session_state.pipeline.active_jobs():
+            st.caption(f"🎵 チャンク #{job.chunk}: {STATE_LABELS[job.state]}")
         
-        # GPT-4でツッコミ生成
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"会議テキスト:\n{transcript_text}"}
-            ],
-            temperature=0.8
-        )
+        for message in st.session_state.pipeline_errors[-3:]:
+            st.error(message)
+
+
+# 録音パネル（録音が届いたときはこのフラグメントだけ再実行される）
+@st.fragment
+def recorder_panel(prompt_type):
+    """録音コンポーネントを表示し、新しい録音をパイプラインに投入"""
+    with panel_timer("recorder"):
+        # 録音コンポーネントの説明
+        st.info("🎤 録音開始を押すと、設定したチャンク長ごとに文字起こし・ツッコミが届きます")
         
-        response_text = response.choices[0].message.content
+        # 録音コンポーネント（途切れなく録音し、連番付きのチャンクを1件ずつ送ってくる）
+        chunk = audio_recorder(
+            chunk_duration=st.session_state.chunk_scheduler.chunk_seconds,
+            acked=st.session_state.recorder_acked,
+            key="recorder"
+        )
         
-        # JSONをパースして整形
-        try:
-            # JSONブロックを抽出（```json...```の形式に対応）
-            json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                # 生のJSONの場合
-                json_str = response_text
+        # 最後に届いたチャンクは再実行のたびに返ってくるので、連番（ヘッダの比較だけ）で新しいものだけを受け付ける
+        if chunk:
+            acked = st.session_state.recorder_acked
+            if acked is None or chunk["session"] != acked[0] or chunk["sequence"] > acked[1]:
+                with metrics.span("receive"):
+                    st.session_state.recorder_acked = (chunk["session"], chunk["sequence"])
+                    st.session_state.chunk_counter += 1
+                    chunk_num = st.session_state.chunk_counter
+                    
+                    # 文字起こしとツッコミ生成はバックグラウンドで実行
+                    timestamp = datetime.fromtimestamp(chunk["timestamp"] / 1000).strftime("%H:%M:%S")
+                    # 音声のコピーは受け付けたときの1回だけ（ジョブ側で文字起こし後に解放される）
+                    st.session_state.pipeline.submit(chunk_num, timestamp, chunk["audio"].tobytes(), prompt_type)
+                    st.session_state.chunk_scheduler.submitted(chunk_num)
+                
+                # 受理した連番をコンポーネントに返して次のチャンクを送ってもらう
+                # （scope="fragment" はこのフラグメントだけの再実行中にしか使えないので、ページ全体の実行中は全体を再実行）
+                if st.session_state.get("full_run"):
+                    st.rerun()
+                else:
+                    st.rerun(scope="fragment")
+
+
+# ツッコミパネル
+@st.fragment
+def tsukkomi_panel(character):
+    """最新のツッコミと過去の履歴を表示"""
+    with panel_timer("tsukkomi"):
+        if st.session_state.tsukkomi_history:
+            # 最新のツッコミを取得
+            latest_tsukkomi = st.session_state.tsukkomi_history[-1]
+            timestamp = latest_tsukkomi['time']
+            tsukkomi_text = latest_tsukkomi['text']
+            is_no_tsukkomi = latest_tsukkomi.get('no_tsukkomi', False)
             
-            data = json.loads(json_str)
+            # キャラクター画像と吹き出し
+            char_col, bubble_col = st.columns([1, 2])
             
-            # should_speakがfalseの場合
-            if not data.get("should_speak", True):
-                return None
+            with char_col:
+                # キャラクター画像
+                if "OTO♡ME" in character:
+                    image_path = "image/otome_chan.jpg"
+                else:
+                    image_path = "image/otoko_mae_kun.png"
+                
+                # 画像が存在する場合のみ表示
+                image_bytes = load_character_image(image_path)
+                if image_bytes:
+                    st.markdown("<br><br>", unsafe_allow_html=True)
+                    st.image(image_bytes, width="stretch")
             
-            # replyの内容を整形して返す
-            reply = data.get("reply", {})
-            tsukkomi = reply.get("tsukkomi", "")
+            with bubble_col:
+                # 最新のツッコミを表示（CSSは定数、ツッコミ有無で色を変える）
+                bubble_class = "tsukkomi-bubble no-tsukkomi" if is_no_tsukkomi else "tsukkomi-bubble"
+                st.markdown(TSUKKOMI_CSS, unsafe_allow_html=True)
+                st.markdown(f"""
+                <div class="{bubble_class}">
+                    <div class="tsukkomi-time">🕐 {timestamp}</div>
+                    <div class="tsukkomi-text">{tsukkomi_text}</div>
+                </div>
+                """, unsafe_allow_html=True)
             
-            # ツッコミがある場合のみ返す
-            if tsukkomi:
-                return tsukkomi
-            else:
-                return None
-                
-        except (json.JSONDecodeError, KeyError, AttributeError):
-            # JSONパースに失敗した場合は生のテキストを返す
-            return response_text
+            # 過去のツッコミ履歴
+            if len(st.session_state.tsukkomi_history) > 1:
+                with st.expander(f"📜 過去のツッコミ履歴 ({len(st.session_state.tsukkomi_history) - 1}件)"):
+                    for tsukkomi_item in reversed(st.session_state.tsukkomi_history[:-1]):
+                        past_timestamp = tsukkomi_item['time']
+                        past_text = tsukkomi_item['text']
+                        
+                        st.markdown(f"**🕐 {past_timestamp}**")
+                        st.write(f"💬 {past_text}")
+                        
+        else:
+            st.info("💬 録音を開始すると、サイドバーで設定したチャンク長ごとにツッコミが届きます")
+
+
+# 文字起こしパネル
+@st.fragment
+def transcript_panel():
+    """文字起こし履歴とダウンロードボタンを表示"""
+    with panel_timer("transcript"):
+        transcripts = st.session_state.transcripts
+        if transcripts:
+            # ストアが更新されたときだけ値を差し替える（キーを固定してウィジェットを作り直さない）
+            if st.session_state.transcript_display_version != transcripts.version:
+                # 最新が上に来る表示用テキストはストア側で差分更新済み
+                st.session_state.transcript_display = transcripts.reversed_text()
+                st.session_state.transcript_display_version = transcripts.version
+            st.text_area(
+                "文字起こし履歴",
+                height=300,
+                key="transcript_display",
+                label_visibility="collapsed"
+            )
         
-    except Exception as e:
-        st.error(f"ツッコミ生成エラー: {e}")
-        return None
+        # 会議全体の発言検索（メモリ上の直近分だけでなく、索引から全チャンクを引く）
+        if transcripts:
+            search_panel()
+        
+        # ダウンロードボタン
+        if transcripts:
+            st.download_button(
+                label="📥 文字起こしをダウンロード",
+                data=lambda: meeting_journal.transcript_text(st.session_state.meeting_id),
+                file_name=f"transcription_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                mime="text/plain",
+                width="stretch"
+            )
 
-# 要約生成
-def generate_summary(transcript_text):
-    """文字起こしテキストから要約を生成"""
-    try:
-        summary_prompt = load_prompt("summary_prompt.txt")
+
+# 検索語の強調表示
+def highlight_matches(text, query):
+    """本文中の検索語を太字にする"""
+    terms = sorted({term for term in query.split() if term}, key=len, reverse=True)
+    if not terms:
+        return text
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    return pattern.sub(lambda match: f"**{match.group(0)}**", text)
+
+
+# 発言検索
+def search_panel():
+    """検索ボックスと検索結果、話題ごとの要約ボタンを表示（transcript_panel の中で呼ぶ）"""
+    index = st.session_state.transcript_index
+    query = st.text_input("🔍 発言を検索", key="transcript_query", placeholder="例: 決済 テスト")
+    if query.strip():
+        started = time.perf_counter()
+        results = index.search(query, limit=SEARCH_LIMIT)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        st.caption(f"{len(results)}件（{len(index)}チャンクから検索、{elapsed_ms:.1f}ms）")
+        for result in results:
+            st.markdown(f"**[{result['time']}]** {highlight_matches(result['text'], query)}")
         
-        if not summary_prompt:
-            return "要約プロンプトが読み込めませんでした。"
+        # 全文ではなく、検索で見つかった関連チャンクだけを要約に渡す
+        if results and st.button("🧠 この話題を要約", key="topic_summary_button"):
+            with st.spinner("話題の要約を生成中..."):
+                topic_summary = generate_summary(
+                    index.context(query, max_tokens=TOPIC_CONTEXT_TOKENS),
+                    token_log=st.session_state.summary_token_log,
+                    focus=query
+                )
+            if topic_summary:
+                st.session_state.topic_summary = (query, topic_summary)
+    
+    if st.session_state.get("topic_summary"):
+        topic, topic_summary = st.session_state.topic_summary
+        with st.expander(f"🧠 「{topic}」の要約", expanded=True):
+            st.markdown(topic_summary)
+
+
+# 要約パネル
+@st.fragment
+def summary_panel():
+    """会議要約を表示（要約ボタンが押されていればストリーミングで生成）"""
+    with panel_timer("summary"):
+        if st.session_state.pop("summary_requested", False):
+            summary_placeholder = st.empty()
+            with st.spinner("要約を生成中..."):
+                summary = st.session_state.summarizer.summarize(
+                    lambda text: generate_summary(
+                        text,
+                        on_delta=summary_placeholder.markdown,
+                        token_log=st.session_state.summary_token_log
+                    )
+                )
+                st.session_state.summary_result = summary
+                if summary:
+                    meeting_journal.record_summary(st.session_state.meeting_id, summary)
+            # 生成が終わったらストリーミング表示を消して通常の表示に切り替える
+            summary_placeholder.empty()
         
-        # GPT-4で要約生成
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": summary_prompt},
-                {"role": "user", "content": transcript_text}
-            ],
-            temperature=0.3
+        if hasattr(st.session_state, 'summary_result') and st.session_state.summary_result:
+            with st.expander("要約を表示", expanded=True):
+                st.markdown(st.session_state.summary_result)
+                
+                st.download_button(
+                    label="📥 要約をダウンロード",
+                    data=st.session_state.summary_result,
+                    file_name=f"summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                    mime="text/plain"
+                )
+        else:
+            st.info("サイドバーの「会議要約を生成」ボタンを押してください")
+
+
+# サイドバーの統計表示
+@st.fragment
+def sidebar_stats_panel():
+    """処理済みチャンク数などの統計を表示"""
+    with panel_timer("sidebar"):
+        scheduler = st.session_state.chunk_scheduler
+        latency_text = (
+            f"、処理 平均{scheduler.latency:.1f}秒 / 直近{scheduler.last_latency:.1f}秒"
+            if scheduler.latency is not None else ""
+        )
+        st.markdown(
+            f"**処理済みチャンク:** {st.session_state.chunk_counter}"
+            f"（チャンク長 {scheduler.chunk_seconds}秒{latency_text}）"
         )
+        expected_delay = scheduler.expected_delay()
+        if expected_delay is not None:
+            st.markdown(f"**ツッコミまでの見込み:** 約{expected_delay:.0f}秒（目標 {scheduler.target_delay:.0f}秒）")
+        st.markdown(f"**総文字数:** {st.session_state.transcripts.char_count}")
+        st.markdown(f"**推定トークン数:** {st.session_state.transcripts.token_count}")
+        if st.session_state.tsukkomi_token_log:
+            last_call = st.session_state.tsukkomi_token_log[-1]
+            cached_text = f"（うちキャッシュ {last_call['cached_tokens']}）" if last_call.get("cached_tokens") else ""
+            st.markdown(f"**送信トークン（直近）:** {last_call['prompt_tokens']}{cached_text}")
+            ttfts = [
+                item["ttft"]
+                for item in list(st.session_state.tsukkomi_token_log) + list(st.session_state.summary_token_log)
+                if item.get("ttft")
+            ]
+            if ttfts:
+                st.markdown(f"**最初のトークンまで（直近）:** {ttfts[-1]:.2f}秒")
+            totals = st.session_state.tsukkomi_token_log.totals
+            if totals.get("aborted"):
+                st.markdown(f"**沈黙判定で打ち切り:** {totals['aborted']}件（約{totals.get('tokens_saved', 0)}トークン節約）")
+        asr_stats = asr_backend.stats()
+        if len(asr_stats) > 1:
+            st.markdown("**文字起こしエンジン:** " + " / ".join(f"{name} {count}件" for name, count in asr_stats.items()))
+        # 結果キャッシュはプロセス内の全セッションで共有しているので、件数も全体の累計
+        lookups = result_cache.hits + result_cache.misses
+        if lookups:
+            st.markdown(
+                f"**結果キャッシュ:** ヒット {result_cache.hits} / ミス {result_cache.misses}"
+                f"（ヒット率 {result_cache.hits / lookups:.0%}）"
+            )
+        api_stats = client.stats()
+        if api_stats["retries"] or api_stats["queued"]:
+            st.markdown(f"**API再試行:** {api_stats['retries']}件（429: {api_stats['rate_limited']}件、待ち {api_stats['queued']}件）")
+        gate_stats = st.session_state.tsukkomi_gate.stats()
+        if gate_stats["evaluated"]:
+            recall = gate_stats["recall_estimate"]
+            recall_text = f"、推定再現率 {recall:.0%}" if recall is not None else ""
+            st.markdown(f"**ツッコミ判定:** 送信 {gate_stats['sent']} / 省略 {gate_stats['avoided']}{recall_text}")
+        # 要約ボタンを押したときに待つことになる部分要約の件数
+        pending_partials = st.session_state.summarizer.pending_count()
+        if pending_partials:
+            st.markdown(f"**部分要約の待ち:** {pending_partials}件")
+        if st.session_state.audio_stats_log:
+            audio_stats = st.session_state.audio_stats_log[-1]
+            st.markdown(
+                f"**音声圧縮（直近）:** {audio_stats['bytes_in'] / 1024:.0f}KB → {audio_stats['bytes_out'] / 1024:.0f}KB"
+                f"（{audio_stats['format'] or 'スキップ'}, {audio_stats['seconds']:.2f}秒）"
+            )
+            totals = st.session_state.audio_stats_log.totals
+            dropped = totals.get("dropped", 0)
+            saved_seconds = totals.get("trimmed_seconds", 0.0)
+            st.markdown(f"**無音スキップ:** {dropped}件（削減 {saved_seconds:.0f}秒）")
         
-        return response.choices[0].message.content
-    except Exception as e:
-        st.error(f"要約生成エラー: {e}")
-        return None
+        # 処理段階ごとの処理時間とこの会議のAPI利用量
+        with st.expander("📈 処理時間の内訳"):
+            stage_stats = metrics.percentiles()
+            rows = [
+                f"| {label} | {stage_stats[stage]['p50'] * 1000:.0f} | {stage_stats[stage]['p95'] * 1000:.0f} "
+                f"| {stage_stats[stage]['p99'] * 1000:.0f} | {stage_stats[stage]['count']} |"
+                for stage, label in STAGE_LABELS.items()
+                if stage_stats.get(stage)
+            ]
+            if rows:
+                st.markdown("| 段階 | p50 (ms) | p95 (ms) | p99 (ms) | 件数 |\n|---|---:|---:|---:|---:|\n" + "\n".join(rows))
+            chunk_rows = metrics.chunks(st.session_state.meeting_id)
+            if chunk_rows:
+                cost = sum(row["cost_usd"] for row in chunk_rows)
+                st.markdown(
+                    f"**この会議（直近{len(chunk_rows)}チャンク）:** 推定 ${cost:.4f}（1チャンク平均 ${cost / len(chunk_rows):.4f}）"
+                )
+                st.markdown(
+                    f"**送信:** {sum(row['prompt_tokens'] for row in chunk_rows)}トークン"
+                    f"（うちキャッシュ {sum(row.get('cached_tokens', 0) for row in chunk_rows)}） / "
+                    f"音声 {sum(row['upload_bytes'] for row in chunk_rows) / 1024:.0f}KB"
+                )
+            prompt_stats = prompt_registry.stats()
+            st.markdown(
+                f"**プロンプト（コンパイル後）:** {sum(item['source_tokens'] for item in prompt_stats)} → "
+                f"{sum(item['compiled_tokens'] for item in prompt_stats)}トークン"
+            )
+        
+        # パネルごとの描画時間
+        with st.expander("⏱️ 描画時間"):
+            if "last_run_seconds" in st.session_state:
+                st.markdown(f"**ページ全体（前回）:** {st.session_state.last_run_seconds * 1000:.0f}ms")
+            for name, label in PANEL_LABELS.items():
+                if name in st.session_state.panel_render_ms:
+                    st.markdown(f"**{label}:** {st.session_state.panel_render_ms[name]:.1f}ms")
 
 
 # Streamlitアプリのメイン
 def main():
+    run_started = time.perf_counter()
+    # ページ全体の実行中かどうか（フラグメントだけの再実行では main を通らないので False のまま）
+    st.session_state.full_run = True
     st.set_page_config(
         page_title="OTOKO★MAEくん",
         page_icon="🎤",
@@ -135,42 +701,35 @@ def main():
     
     with st.expander("📖 使い方", expanded=False):
         st.markdown("""
-        **1.** サイドバーでキャラクターモード選択 → **2.** 録音ボタンを押して会話 → **3.** 停止ボタンで処理
+        **1.** サイドバーでキャラクターモードとチャンク長を選択 → **2.** 🎤 録音開始を押して会話 → **3.** ⏹️ 録音停止で終了
         
-        - 録音するたびにAIが文字起こし・ツッコミを生成します
+        - 録音中はチャンクごとにAIが文字起こし・ツッコミを生成します（途中で録音を止める必要はありません）
+        - チャンク長はサイドバーの「チャンク長の範囲」のスライダーで指定し、処理時間に合わせてその範囲内で自動調整されます
         - 要約は「会議要約を生成」ボタンでいつでも作成可能です
         
         ### ⚠️ 注意事項（デプロイ版の制限）
-        - **手動録音のみ**: マイクボタンを押して録音開始・停止を行ってください
-        - **録音時間**: 最大5分まで（それ以上は自動停止します）
-        - ファイルサイズが大きすぎる場合はエラーになります
-        - 文字起こし、ツッコミの表示はリアルタイムでは行えません。録音停止後に処理されます
-        - マイクボタンの色で状態確認: 🔴赤=録音中 / 🔵青=待機中
+        - **録音はボタンで開始・終了**: 録音は途切れず続き、チャンク長ごとに区切って送信されます
+        - **録音時間**: 長い録音は自動で分割して並列に文字起こしします
+        - 文字起こし、ツッコミはチャンクが届くたびにバックグラウンドで処理され、完了したチャンクから順に表示されます
+        - 録音ボタンの下の表示で状態確認: 🔴録音中（N秒ごとに送信）/ 🟢待機中
         """)
     
     st.divider()
     
-    # セッション状態の初期化
-    if "transcripts" not in st.session_state:
-        st.session_state.transcripts = []
-    if "tsukkomi_history" not in st.session_state:
-        st.session_state.tsukkomi_history = []
-    if "full_transcript" not in st.session_state:
-        st.session_state.full_transcript = ""
-    if "chunk_counter" not in st.session_state:
-        st.session_state.chunk_counter = 0
-    if "last_audio_hash" not in st.session_state:
-        st.session_state.last_audio_hash = None
-    if "is_recording" not in st.session_state:
-        st.session_state.is_recording = False
-    if "meeting_start_time" not in st.session_state:
-        st.session_state.meeting_start_time = None
-    if "meeting_end_time" not in st.session_state:
-        st.session_state.meeting_end_time = None
-    if "meeting_start_time" not in st.session_state:
-        st.session_state.meeting_start_time = None
-    if "meeting_end_time" not in st.session_state:
-        st.session_state.meeting_end_time = None
+    # セッション状態の初期化（URLに会議IDがあれば、再読み込み後もジャーナルから再開する）
+    if "meeting_id" not in st.session_state:
+        meeting_id = st.query_params.get("meeting")
+        if meeting_id and meeting_journal.meeting(meeting_id):
+            resume_meeting(meeting_id)
+        else:
+            start_meeting()
+    if "recorder_acked" not in st.session_state:
+        # 録音コンポーネントから受理した (録音セッションID, 連番)。会議をクリアしてもブラウザ側の録音は続くので引き継ぐ
+        st.session_state.recorder_acked = None
+    if "transcript_display_version" not in st.session_state:
+        st.session_state.transcript_display_version = None
+    if "panel_render_ms" not in st.session_state:
+        st.session_state.panel_render_ms = {}
     
     # サイドバー設定
     with st.sidebar:
@@ -185,32 +744,63 @@ def main():
         )
         prompt_type = "otokomae" if "OTOKO☆MAE" in character else "otome"
         
+        # チャンク長は処理時間を見てこの範囲内で自動調整する
+        min_seconds, max_seconds = st.slider(
+            "チャンク長の範囲（秒）",
+            min_value=30,
+            max_value=180,
+            value=(30, 180),
+            step=10,
+            help="処理時間に合わせて、この範囲内で録音を区切る長さを自動で変えます"
+        )
+        target_delay = st.slider(
+            "ツッコミまでの目標遅延（秒）",
+            min_value=30,
+            max_value=240,
+            value=90,
+            step=10,
+            help="話し始めからツッコミが届くまでの時間がこの値に近づくようにチャンク長を調整します"
+        )
+        st.session_state.chunk_scheduler.set_bounds(min_seconds, max_seconds, target_delay)
+        
+        # ツッコミ判定のしきい値（0にすると毎チャンクLLMに送る）
+        st.session_state.tsukkomi_gate.threshold = st.slider(
+            "ツッコミ判定のしきい値",
+            min_value=0.0,
+            max_value=1.0,
+            value=0.45,
+            step=0.05,
+            help="脱線・堂々巡り・経過時間から計算したスコアがこの値以上のチャンクだけAIに送ります"
+        )
+        
         st.divider()
         
         # 要約ボタン
-        if st.button("📋 会議要約を生成", width="stretch", disabled=len(st.session_state.full_transcript) == 0):
-            with st.spinner("要約を生成中..."):
-                summary = generate_summary(st.session_state.full_transcript)
-                st.session_state.summary_result = summary
-            st.success("要約完了！")
-            st.rerun()
+        if st.button("📋 会議要約を生成", width="stretch", disabled=not st.session_state.transcripts):
+            # 生成は下部の要約エリアでストリーミング表示する
+            st.session_state.summary_requested = True
         
-        # クリアボタン
+        # クリアボタン（これまでの会議はジャーナルに残る）
         if st.button("🗑️ すべてクリア", width="stretch"):
-            st.session_state.transcripts = []
-            st.session_state.tsukkomi_history = []
-            st.session_state.full_transcript = ""
-            st.session_state.chunk_counter = 0
-            st.session_state.last_audio_hash = None
-            st.session_state.meeting_start_time = None
-            st.session_state.meeting_end_time = None
-            if hasattr(st.session_state, 'summary_result'):
-                del st.session_state.summary_result
+            start_meeting()
             st.rerun()
         
+        # 過去の会議の再開
+        past_meetings = [m for m in meeting_journal.recent_meetings() if m["id"] != st.session_state.meeting_id]
+        if past_meetings:
+            with st.expander("📂 過去の会議を再開"):
+                selected = st.selectbox(
+                    "会議",
+                    past_meetings,
+                    format_func=lambda m: f"{datetime.fromtimestamp(m['started_at']).strftime('%m/%d %H:%M')}（{m['chunks']}チャンク）",
+                    label_visibility="collapsed"
+                )
+                if st.button("▶️ この会議を再開", width="stretch"):
+                    resume_meeting(selected["id"])
+                    st.rerun()
+        
         st.divider()
-        st.markdown(f"**処理済みチャンク:** {st.session_state.chunk_counter}")
-        st.markdown(f"**総文字数:** {len(st.session_state.full_transcript)}")
+        sidebar_stats_panel()
     
     # メインエリア（2:3の比率）
     col1, col2 = st.columns([2, 3])
@@ -218,198 +808,22 @@ def main():
     with col1:
         # === ツッコミエリア ===
         st.subheader("💬 AIツッコミ")
-  
-        
-        if st.session_state.tsukkomi_history:
-            # 最新のツッコミを取得
-            latest_tsukkomi = st.session_state.tsukkomi_history[-1]
-            timestamp = latest_tsukkomi['time']
-            tsukkomi_text = latest_tsukkomi['text']
-            is_no_tsukkomi = latest_tsukkomi.get('no_tsukkomi', False)
-            
-            # キャラクター画像と吹き出し
-            char_col, bubble_col = st.columns([1, 2])
-            
-            with char_col:
-                # キャラクター画像
-                if "OTO♡ME" in character:
-                    image_path = "image/otome_chan.jpg"
-                else:
-                    image_path = "image/otoko_mae_kun.png"
-                
-                # 画像が存在する場合のみ表示
-                if os.path.exists(image_path):
-                    st.markdown("<br>", unsafe_allow_html=True)
-                    st.markdown("<br>", unsafe_allow_html=True)
-                    st.image(image_path, use_container_width=True)
-            
-            with bubble_col:
-                # カスタムCSS（色をツッコミ有無で変更）
-                if is_no_tsukkomi:
-                    gradient = "background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%);"
-                else:
-                    gradient = "background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);"
-                
-                st.markdown(f"""
-                <style>
-                .tsukkomi-bubble {{
-                    {gradient}
-                    color: white;
-                    padding: 20px;
-                    border-radius: 20px;
-                    margin: 10px 0;
-                    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                }}
-                .tsukkomi-time {{
-                    font-size: 0.85em;
-                    opacity: 0.9;
-                    margin-bottom: 8px;
-                }}
-                .tsukkomi-text {{
-                    font-size: 1.1em;
-                    font-weight: bold;
-                    margin: 10px 0;
-                }}
-                </style>
-                """, unsafe_allow_html=True)
-                
-                # 最新のツッコミを表示
-                st.markdown(f"""
-                <div class="tsukkomi-bubble">
-                    <div class="tsukkomi-time">🕐 {timestamp}</div>
-                    <div class="tsukkomi-text">{tsukkomi_text}</div>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            # 過去のツッコミ履歴
-            if len(st.session_state.tsukkomi_history) > 1:
-                with st.expander(f"📜 過去のツッコミ履歴 ({len(st.session_state.tsukkomi_history) - 1}件)"):
-                    for tsukkomi_item in reversed(st.session_state.tsukkomi_history[:-1]):
-                        past_timestamp = tsukkomi_item['time']
-                        past_text = tsukkomi_item['text']
-                        
-                        st.markdown(f"**🕐 {past_timestamp}**")
-                        st.write(f"💬 {past_text}")
-                        
-        else:
-            st.info("💬 マイクボタンを押して録音を停止するとその地点までのツッコミが表示されます")
+        tsukkomi_panel(character)
     
     with col2:
         st.subheader("📝 文字起こし履歴")
-        
-        # 録音コンポーネントの説明
-        st.info("🎤 マイクボタンを押して録音開始 → もう一度押して停止（最大5分）")
-        
-        # 音声録音コンポーネント（手動制御モード、5分制限）
-        audio_bytes = audio_recorder(
-            text="",
-            recording_color="#e74c3c",
-            neutral_color="#3498db",
-            icon_name="microphone",
-            icon_size="2x",
-            energy_threshold=(-1.0, 1.0),  # 自動音声検出を無効化
-            pause_threshold=300.0,  # 5分で自動停止（ファイルサイズ制限対策）
-        )
-        
-        # 音声データを受信した場合
-        if audio_bytes:
-            # ファイルサイズチェック（Whisper APIは25MB制限）
-            audio_size_mb = len(audio_bytes) / (1024 * 1024)
-            if audio_size_mb > 24:  # 24MBで制限（余裕を持たせる）
-                st.error(f"⚠️ 音声ファイルが大きすぎます（{audio_size_mb:.1f}MB）。録音時間を短くしてください（最大5分程度）。")
-            else:
-                # ハッシュを計算して重複処理を防ぐ
-                import hashlib
-                audio_hash = hashlib.md5(audio_bytes).hexdigest()
-                
-                if audio_hash != st.session_state.last_audio_hash:
-                    st.session_state.last_audio_hash = audio_hash
-                    st.session_state.chunk_counter += 1
-                    chunk_num = st.session_state.chunk_counter
-                    
-                    with st.spinner(f"🎵 チャンク #{chunk_num} を処理中..."):
-                        # 文字起こし
-                        transcript = transcribe_audio(audio_bytes)
-                    
-                    if transcript:
-                        # 記録
-                        timestamp = datetime.now().strftime("%H:%M:%S")
-                        st.session_state.transcripts.append({
-                            "chunk": chunk_num,
-                            "time": timestamp,
-                            "text": transcript
-                        })
-                        st.session_state.full_transcript += f"\n[{timestamp}] {transcript}"
-                        
-                        # 最初のチャンクで会議開始時刻を記録
-                        if st.session_state.meeting_start_time is None:
-                            import time
-                            st.session_state.meeting_start_time = time.time()
-                        
-                        # ツッコミ生成
-                        with st.spinner("ツッコミを生成中..."):
-                            tsukkomi = generate_tsukkomi(st.session_state.full_transcript, prompt_type)
-                            
-                            if tsukkomi:
-                                st.session_state.tsukkomi_history.append({
-                                    "chunk": chunk_num,
-                                    "time": timestamp,
-                                    "text": tsukkomi,
-                                    "no_tsukkomi": False
-                                })
-                            else:
-                                # ツッコミ不要の場合も履歴に記録
-                                st.session_state.tsukkomi_history.append({
-                                    "chunk": chunk_num,
-                                    "time": timestamp,
-                                    "text": "ツッコミは不要みたい！",
-                                    "no_tsukkomi": True
-                                })
-                        
-                        st.success(f"✅ チャンク #{chunk_num} の文字起こし完了！")
-                        st.rerun()
-        
-        # 文字起こし表示
-        if st.session_state.transcripts:
-            # 最新が上に来るように逆順で結合
-            transcript_items = [f"[{item['time']}] {item['text']}" for item in st.session_state.transcripts]
-            reversed_text = "\n\n".join(reversed(transcript_items))
-            st.text_area(
-                "文字起こし履歴",
-                reversed_text,
-                height=300,
-                key=f"transcript_display_{len(st.session_state.transcripts)}",
-                label_visibility="collapsed"
-            )
-
-
-        
-        # ダウンロードボタン
-        if st.session_state.full_transcript:
-            st.download_button(
-                label="📥 文字起こしをダウンロード",
-                data=st.session_state.full_transcript,
-                file_name=f"transcription_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                mime="text/plain",
-                use_container_width=True
-            )
+        recorder_panel(prompt_type)
+        pipeline_status_panel()
+        transcript_panel()
     
     # === 要約エリア（下部全体） ===
     st.divider()
     st.subheader("📋 会議要約")
+    summary_panel()
     
-    if hasattr(st.session_state, 'summary_result') and st.session_state.summary_result:
-        with st.expander("要約を表示", expanded=True):
-            st.markdown(st.session_state.summary_result)
-            
-            st.download_button(
-                label="📥 要約をダウンロード",
-                data=st.session_state.summary_result,
-                file_name=f"summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                mime="text/plain"
-            )
-    else:
-        st.info("サイドバーの「会議要約を生成」ボタンを押してください")
+    # 次回の描画時にサイドバーへ表示する
+    st.session_state.last_run_seconds = time.perf_counter() - run_started
+    st.session_state.full_run = False
 
 
 if __name__ == "__main__":
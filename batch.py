@@ -0,0 +1,308 @@
+"""録音済み会議の一括処理（Streamlitを使わないバッチ実行）
+
+ディレクトリ内の録音ファイルを会議ごとに並列で処理し、
+文字起こし・ツッコミ・要約を <出力先>/<ファイル名>.json と .md に書き出す。
+処理が完了した会議は次回の実行で飛ばすので、中断しても同じコマンドで再開できる。
+
+    python batch.py recordings/ --output outputs --workers 4
+
+最後に処理件数・音声の長さ・実時間比などを <出力先>/report.json に書き出す。
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from core.cache import ResultCache
+from core.meeting_context import MeetingContext
+from core.prefilter import TsukkomiGate
+from core.prompts import PromptRegistry
+from core.search import TranscriptIndex
+from core.services import MeetingServices, create_asr_backend, create_openai_client
+from core.summarizer import IncrementalSummarizer
+
+logger = logging.getLogger("batch")
+
+# Whisperが受け付ける形式
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".mp4", ".mpeg", ".mpga", ".webm", ".ogg", ".flac"}
+
+STATUS_DONE = "done"
+
+# プロセスプールの各ワーカーで1度だけ作る生成器
+_worker_services = None
+
+
+def build_services(rate_share=1):
+    """バッチ用の生成器を作る（rate_share で割ったレート制限を使う）"""
+    client = create_openai_client(
+        requests_per_minute=max(1, int(os.environ.get("OPENAI_RPM_LIMIT", "500")) // rate_share),
+        tokens_per_minute=max(1, int(os.environ.get("OPENAI_TPM_LIMIT", "30000")) // rate_share)
+    )
+    result_cache = ResultCache(os.environ.get("OTOKOMAE_CACHE_PATH", ".cache/results.sqlite3"))
+    return MeetingServices(client, result_cache, PromptRegistry("prompts"), create_asr_backend(client))
+
+
+def _init_worker(rate_share):
+    """プロセスプールのワーカー初期化"""
+    global _worker_services
+    _worker_services = build_services(rate_share)
+
+
+def split_recording(audio_bytes, chunk_seconds):
+    """録音を chunk_seconds 秒前後のチャンクに分ける
+
+    戻り値は ([(開始秒, 音声バイト列), ...], 録音の長さ秒)。
+    WAVに変換できない形式（ffmpegが無い環境のWebMや、浮動小数点など wave で読めないWAV）は
+    1チャンクのまま返し、長さはNoneになる。
+    """
+    from core.audio import TARGET_RATE, read_wav, split_wav, to_mono_wav
+
+    wav = to_mono_wav(audio_bytes)
+    if wav is None:
+        return [(0.0, audio_bytes)], None
+    params, _ = read_wav(wav)
+    # 区切りはアプリと同じく、チャンク終端の直前で最も静かな位置に置く
+    chunks = split_wav(wav, max_bytes=44 + int(chunk_seconds * TARGET_RATE * 2))
+    return chunks, params.nframes / TARGET_RATE
+
+
+def format_timestamp(seconds):
+    """録音先頭からの経過時間を HH:MM:SS にする"""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+def process_meeting(path, chunk_seconds=60, prompt_type="otokomae", use_gate=True, services=None):
+    """1件の録音を処理して結果の辞書を返す
+
+    チャンクは順番に文字起こしし、アプリと同じく会議コンテキスト・ツッコミ判定を通してツッコミを生成する。
+    """
+    services = services or _worker_services
+    path = Path(path)
+    started = time.perf_counter()
+
+    chunks, duration = split_recording(path.read_bytes(), chunk_seconds)
+
+    context = MeetingContext(index=TranscriptIndex())
+    # 監査の抽選を録音ごとに固定し、再実行しても同じチャンクを送るようにする
+    gate = TsukkomiGate(rng=random.Random(path.name)) if use_gate else None
+    summarizer = IncrementalSummarizer(services.generate_partial_summary, services.generate_summary)
+    token_log = []
+    audio_log = []
+
+    rows = []
+    transcribe_seconds = comment_seconds = 0.0
+    try:
+        for number, (offset, audio) in enumerate(chunks, start=1):
+            timestamp = format_timestamp(offset)
+            step_started = time.perf_counter()
+            transcript = services.transcribe_audio(audio, stats_log=audio_log)
+            transcribe_seconds += time.perf_counter() - step_started
+
+            row = {"chunk": number, "time": timestamp, "offset": offset, "text": transcript, "tsukkomi": None}
+            rows.append(row)
+            if not transcript:
+                continue
+
+            context.add_chunk(timestamp, transcript, chunk=number)
+            summarizer.add_chunk(f"[{timestamp}] {transcript}")
+
+            # 判定の経過時間は録音内の時刻で数える
+            decision = gate.evaluate(transcript, chunk=number, now=offset) if gate else None
+            if decision is not None and not decision["send"] and not decision["audit"]:
+                continue
+            step_started = time.perf_counter()
+            row["tsukkomi"] = services.generate_tsukkomi(context.render(), prompt_type, token_log)
+            comment_seconds += time.perf_counter() - step_started
+            if decision is not None:
+                gate.record_result(decision, row["tsukkomi"] is not None)
+
+        step_started = time.perf_counter()
+        summary = summarizer.summarize() if any(row["text"] for row in rows) else None
+        summary_seconds = time.perf_counter() - step_started
+    finally:
+        summarizer.close()
+
+    return {
+        "status": STATUS_DONE,
+        "source": path.name,
+        "source_bytes": path.stat().st_size,
+        "processed_at": datetime.now().isoformat(timespec="seconds"),
+        "audio_seconds": duration,
+        "chunk_seconds": chunk_seconds,
+        "prompt_type": prompt_type,
+        "asr_backend": services.asr_backend.name,
+        "chunks": rows,
+        "summary": summary,
+        "gate": gate.stats() if gate else None,
+        "tokens": {
+            "prompt": sum(entry["prompt_tokens"] for entry in token_log),
+            "completion": sum(entry["completion_tokens"] for entry in token_log),
+            "prompt_cached": sum(entry.get("cached_tokens", 0) for entry in token_log),
+            "cached_calls": sum(1 for entry in token_log if entry.get("cached")),
+        },
+        "timings": {
+            "total": time.perf_counter() - started,
+            "transcribe": transcribe_seconds,
+            "comment": comment_seconds,
+            "summary": summary_seconds,
+            "preprocess": sum(stats["seconds"] for stats in audio_log),
+        },
+    }
+
+
+def render_markdown(result):
+    """処理結果を読みやすいMarkdownにする"""
+    lines = [f"# {result['source']}", ""]
+    if result["audio_seconds"] is not None:
+        lines.append(f"- 録音の長さ: {format_timestamp(result['audio_seconds'])}")
+    lines += [f"- 処理日時: {result['processed_at']}", "", "## 要約", "", result["summary"] or "（要約なし）", ""]
+
+    tsukkomi = [row for row in result["chunks"] if row["tsukkomi"]]
+    lines += ["## ツッコミ", ""]
+    lines += [f"- [{row['time']}] {row['tsukkomi']}" for row in tsukkomi] or ["（ツッコミなし）"]
+
+    lines += ["", "## 文字起こし", ""]
+    lines += [f"[{row['time']}] {row['text']}" for row in result["chunks"] if row["text"]]
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path, text):
+    """書きかけのファイルが残らないよう、一時ファイルに書いてから置き換える"""
+    temp = path.with_name(path.name + ".tmp")
+    temp.write_text(text, encoding="utf-8")
+    os.replace(temp, path)
+
+
+def output_paths(output_dir, source):
+    """録音ファイルに対応する (JSON, Markdown) の出力パス"""
+    return output_dir / f"{source.stem}.json", output_dir / f"{source.stem}.md"
+
+
+def is_finished(json_path):
+    """前回の実行で処理が完了しているか"""
+    try:
+        return json.loads(json_path.read_text(encoding="utf-8")).get("status") == STATUS_DONE
+    except (OSError, ValueError):
+        return False
+
+
+def find_recordings(input_dir):
+    """入力ディレクトリ内の録音ファイル（ファイル名順）"""
+    return sorted(
+        path for path in Path(input_dir).iterdir()
+        if path.is_file() and path.suffix.lower() in AUDIO_EXTENSIONS
+    )
+
+
+def build_report(results, failures, skipped, wall_seconds, workers, mode):
+    """スループットの集計"""
+    audio_seconds = sum(result["audio_seconds"] or 0.0 for result in results)
+    return {
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "mode": mode,
+        "workers": workers,
+        "processed": len(results),
+        "skipped": len(skipped),
+        "failed": len(failures),
+        "wall_seconds": round(wall_seconds, 2),
+        "audio_seconds": round(audio_seconds, 2),
+        # 録音1秒あたりの処理時間（1未満なら録音より速く処理できている）
+        "realtime_factor": round(wall_seconds / audio_seconds, 3) if audio_seconds else None,
+        "meetings_per_hour": round(len(results) * 3600 / wall_seconds, 2) if wall_seconds else None,
+        "files": [
+            {
+                "source": result["source"],
+                "audio_seconds": result["audio_seconds"],
+                "chunks": len(result["chunks"]),
+                "seconds": round(result["timings"]["total"], 2),
+            }
+            for result in results
+        ],
+        "failures": failures,
+        "skipped_files": skipped,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="録音済み会議の文字起こし・ツッコミ・要約を一括で生成する")
+    parser.add_argument("input_dir", help="録音ファイルのディレクトリ")
+    parser.add_argument("--output", default="outputs", help="出力先ディレクトリ（既定: outputs）")
+    parser.add_argument("--workers", type=int, default=2, help="同時に処理する会議の数（既定: 2）")
+    parser.add_argument("--mode", choices=("thread", "process"), default="thread",
+                        help="thread: API中心の処理向け / process: ローカルASRなどCPU中心の処理向け")
+    parser.add_argument("--chunk-seconds", type=int, default=60, help="チャンクの長さ（秒、既定: 60）")
+    parser.add_argument("--character", choices=("otokomae", "otome"), default="otokomae",
+                        help="ツッコミのキャラクター（既定: otokomae）")
+    parser.add_argument("--no-gate", action="store_true", help="ツッコミ判定を使わず全チャンクをLLMに送る")
+    parser.add_argument("--force", action="store_true", help="処理済みの会議も処理し直す")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_args(argv)
+    workers = max(1, args.workers)
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    pending, skipped = [], []
+    for source in find_recordings(args.input_dir):
+        json_path, _ = output_paths(output_dir, source)
+        if not args.force and is_finished(json_path):
+            skipped.append(source.name)
+        else:
+            pending.append(source)
+    logger.info("%d recordings to process, %d already done", len(pending), len(skipped))
+
+    options = {"chunk_seconds": args.chunk_seconds, "prompt_type": args.character, "use_gate": not args.no_gate}
+    if args.mode == "process":
+        # 各プロセスが自前のレート制限を持つので、上限をワーカー数で分け合う
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,))
+    else:
+        # スレッドでは生成器とレート制限を全会議で共有する
+        options["services"] = build_services()
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="meeting")
+
+    results, failures = [], []
+    started = time.perf_counter()
+    with executor:
+        futures = {executor.submit(process_meeting, source, **options): source for source in pending}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error("%s failed: %s", source.name, e)
+                failures.append({"source": source.name, "error": str(e)})
+                continue
+            json_path, markdown_path = output_paths(output_dir, source)
+            # Markdownを先に書き、JSON（完了の目印）は最後に置く
+            write_atomic(markdown_path, render_markdown(result))
+            write_atomic(json_path, json.dumps(result, ensure_ascii=False, indent=2))
+            results.append(result)
+            logger.info("%s done in %.1fs", source.name, result["timings"]["total"])
+
+    report = build_report(results, failures, skipped, time.perf_counter() - started, workers, args.mode)
+    write_atomic(output_dir / "report.json", json.dumps(report, ensure_ascii=False, indent=2))
+    logger.info(
+        "processed %d, skipped %d, failed %d in %.1fs (realtime factor %s)",
+        report["processed"], report["skipped"], report["failed"], report["wall_seconds"], report["realtime_factor"]
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""OpenAI互換のフェイクサーバーを使ったオフラインベンチマーク"""
@@ -0,0 +1,215 @@
+"""ベンチマーク用のOpenAI互換フェイクサーバー
+
+実際のAPIを呼ばずに性能を測るため、/v1/audio/transcriptions と /v1/chat/completions を
+ローカルで返す。遅延・ストリーミング・ツッコミ要否（should_speak）・429の発生率を設定できる。
+プロンプトキャッシュも模擬し、以前と同じシステムメッセージで始まるリクエストには
+usage.prompt_tokens_details.cached_tokens を返す（1024トークン以上、128トークン単位）。
+
+    server = FakeOpenAIServer(transcribe_latency=0.3, rate_limit_rate=0.05)
+    server.start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.tokens import estimate_tokens
+
+# 文字起こし結果として返す発言（チャンクごとに組み合わせて会議らしくする）
+SENTENCES = [
+    "今日の議題は新しい予約システムのリリース日程です。",
+    "テストの進み具合はどうなっていますか。",
+    "結合テストは八割ほど終わっていて、残りは決済まわりです。",
+    "決済の外部APIの仕様変更が来週あるので、そこが心配ですね。",
+    "それなら先にステージング環境で確認しておきましょう。",
+    "ところで、昨日のランチのお店がすごく良かったんですよ。",
+    "話を戻すと、リリース日は月末で問題なさそうですか。",
+    "デザインの修正がまだ二件残っています。",
+    "では担当者と期限を決めて、来週の定例で確認することにします。",
+    "さっきも言いましたが、決済まわりのテストが一番の懸念です。",
+]
+
+
+class _Stats:
+    """サーバー側で観測したリクエストの集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.bytes_received = {}
+
+    def record(self, endpoint, size):
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            self.bytes_received[endpoint] = self.bytes_received.get(endpoint, 0) + size
+
+    def snapshot(self):
+        with self._lock:
+            return {"requests": dict(self.counts), "bytes_received": dict(self.bytes_received)}
+
+
+class FakeOpenAIServer:
+    """別スレッドで動くOpenAI互換のHTTPサーバー
+
+    transcribe_latency は文字起こし1件の応答時間、chat_latency はチャット補完の最初のトークンまでの時間、
+    token_interval はストリーミングの断片ごとの間隔（いずれも秒）。
+    speak_rate はツッコミで should_speak=true を返す割合、rate_limit_rate は429を返す割合。
+    """
+
+    def __init__(self, transcribe_latency=0.2, chat_latency=0.1, token_interval=0.005, speak_rate=0.5,
+                 rate_limit_rate=0.0, retry_after=0.5, sentences_per_chunk=4, seed=0, host="127.0.0.1", port=0):
+        self.transcribe_latency = transcribe_latency
+        self.chat_latency = chat_latency
+        self.token_interval = token_interval
+        self.speak_rate = speak_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.sentences_per_chunk = sentences_per_chunk
+        self.stats = _Stats()
+        self._seen_prefixes = set()
+        self._cache_lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def random(self):
+        with self._rng_lock:
+            return self._rng.random()
+
+    def cached_tokens(self, messages):
+        """プロンプトキャッシュに当たるトークン数（システムメッセージが前回までと一致した分）"""
+        system = (messages[0].get("content") or "") if messages else ""
+        tokens = estimate_tokens(system)
+        if tokens < 1024:
+            return 0
+        with self._cache_lock:
+            seen = system in self._seen_prefixes
+            self._seen_prefixes.add(system)
+        return tokens // 128 * 128 if seen else 0
+
+    def sample_sentences(self):
+        with self._rng_lock:
+            return "".join(self._rng.choice(SENTENCES) for _ in range(self.sentences_per_chunk))
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path.endswith("/audio/transcriptions"):
+                    endpoint = "transcriptions"
+                elif self.path.endswith("/chat/completions"):
+                    endpoint = "chat"
+                else:
+                    self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+                    return
+                server.stats.record(endpoint, len(body))
+
+                if server.random() < server.rate_limit_rate:
+                    server.stats.record("rate_limited", 0)
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                    {"Retry-After": str(server.retry_after)})
+                    return
+
+                if endpoint == "transcriptions":
+                    time.sleep(server.transcribe_latency)
+                    self._send_json(200, {"text": server.sample_sentences()})
+                else:
+                    self._chat(json.loads(body))
+
+            def _chat(self, request):
+                messages = request.get("messages", [])
+                system = messages[0]["content"] if messages else ""
+                prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+                if "should_speak" in system:
+                    if server.random() < server.speak_rate:
+                        content = json.dumps({"should_speak": True, "reply": {"tsukkomi": "いや、話戻そか！"}},
+                                             ensure_ascii=False)
+                    else:
+                        content = '{"should_speak": false, "reason": "順調に進行中"}'
+                else:
+                    content = "## 要約\n- リリース日は月末\n- 決済まわりのテストが懸念"
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": estimate_tokens(content),
+                    "total_tokens": prompt_tokens + estimate_tokens(content),
+                    "prompt_tokens_details": {"cached_tokens": server.cached_tokens(messages)},
+                }
+
+                time.sleep(server.chat_latency)
+                if not request.get("stream"):
+                    self._send_json(200, {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                        "model": request.get("model"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                include_usage = (request.get("stream_options") or {}).get("include_usage")
+                try:
+                    for start in range(0, len(content), 8):
+                        self._event({"choices": [{"index": 0, "delta": {"content": content[start:start + 8]}}]})
+                        time.sleep(server.token_interval)
+                    self._event({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                    if include_usage:
+                        self._event({"choices": [], "usage": usage})
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # クライアントが打ち切った（should_speak=false の早期終了）
+                    server.stats.record("aborted_streams", 0)
+                self.close_connection = True
+
+            def _event(self, payload):
+                payload.update({"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                                "created": int(time.time()), "model": "fake"})
+                self.wfile.write(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
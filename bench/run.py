@@ -0,0 +1,339 @@
+"""オフラインベンチマーク
+
+フェイクのOpenAIサーバー（bench/fake_openai.py）を立ててクライアントの接続先を向け、
+合成音声のチャンクをアプリと同じチャンク処理パイプラインに流して性能を測る。
+
+    python -m bench.run --chunks 30 --rate-limit-rate 0.05
+
+段階ごとの処理時間のパーセンタイル、会議が進むにつれてツッコミ1回あたりに送るトークン数、
+アップロード量、スループットを表示し、bench/results.jsonl に追記する。
+同じ設定の前回の結果と比べて悪化した指標があれば表示する。
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from bench.fake_openai import FakeOpenAIServer
+from core.audio import TARGET_RATE, write_wav
+from core.cache import ResultCache
+from core.meeting_context import MeetingContext
+from core.metrics import percentiles
+from core.prefilter import TsukkomiGate
+from core.prompts import PromptRegistry
+from core.search import TranscriptIndex
+from core.services import MeetingServices, create_asr_backend, create_openai_client
+from core.summarizer import IncrementalSummarizer
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+# 前回と比べて悪化とみなす変化率
+REGRESSION_THRESHOLD = 0.10
+
+# 比較する指標（値が大きいほど悪いもの / 良いもの）
+LOWER_IS_BETTER = [
+    ("latency", "end_to_end", "p50"),
+    ("latency", "end_to_end", "p95"),
+    ("latency", "transcribe", "p95"),
+    ("latency", "comment", "p95"),
+    ("latency", "summary", "max"),
+    ("tokens", "per_call", "last"),
+    ("tokens", "total_prompt"),
+    ("upload", "audio_bytes"),
+]
+HIGHER_IS_BETTER = [
+    ("tokens", "cached_ratio"),
+    ("throughput", "chunks_per_second"),
+    ("throughput", "audio_seconds_per_second"),
+]
+
+
+def synthetic_chunk(seconds, seed, silent=False):
+    """発話らしい音声（音節ごとに強弱のある倍音＋ポーズ）の16kHzモノラルWAVを作る"""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * TARGET_RATE)
+    samples = 0.002 * rng.standard_normal(total)
+    if not silent:
+        t = np.arange(total) / TARGET_RATE
+        position = rng.uniform(0.0, 1.5)
+        while position < seconds - 0.5:
+            # 1.5〜4秒の発話と0.3〜1.5秒の間を交互に置く
+            length = rng.uniform(1.5, 4.0)
+            start, end = int(position * TARGET_RATE), int(min(seconds, position + length) * TARGET_RATE)
+            pitch = rng.uniform(110, 240)
+            segment = t[start:end]
+            voice = sum(np.sin(2 * np.pi * pitch * k * segment) / k for k in range(1, 5))
+            syllables = 0.5 * (1 + np.sin(2 * np.pi * rng.uniform(4, 6) * segment))
+            samples[start:end] += 0.2 * voice * syllables
+            position += length + rng.uniform(0.3, 1.5)
+    pcm = np.clip(np.round(samples * 32767.0), -32768, 32767).astype("<i2").tobytes()
+    return write_wav(pcm, 1, 2, TARGET_RATE)
+
+
+def git_revision():
+    """現在のコミット（未コミットの変更があれば末尾に +dirty）"""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ("+dirty" if dirty else "")
+
+
+def run_benchmark(args, server):
+    """合成会議を1回流して計測結果を返す"""
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    client = create_openai_client()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # 前回の実行のキャッシュに当たらないよう、実行ごとに空のキャッシュを使う
+        result_cache = ResultCache(os.path.join(cache_dir, "results.sqlite3"))
+        services = MeetingServices(client, result_cache, PromptRegistry("prompts"), create_asr_backend(client))
+        try:
+            return _drive_meeting(args, services, client, server)
+        finally:
+            result_cache.close()
+
+
+def _drive_meeting(args, services, client, server):
+    rng = random.Random(args.seed)
+    chunks = [
+        synthetic_chunk(args.chunk_seconds, seed=args.seed * 100003 + number, silent=rng.random() < args.silent_rate)
+        for number in range(1, args.chunks + 1)
+    ]
+
+    meeting_context = MeetingContext(index=TranscriptIndex())
+    summarizer = IncrementalSummarizer(services.generate_partial_summary, services.generate_summary)
+    # 全チャンクを送る場合はしきい値を0にする（監査の抽選も固定）
+    gate = TsukkomiGate(threshold=0.0 if args.no_gate else args.gate_threshold, rng=random.Random(args.seed))
+    token_log, audio_log = [], []
+    pipeline = services.create_pipeline(meeting_context, summarizer, gate, token_log, audio_log)
+
+    submitted, finished, jobs = {}, {}, []
+    started = time.perf_counter()
+    try:
+        for number, audio in enumerate(chunks, start=1):
+            timestamp = time.strftime("%H:%M:%S", time.gmtime(number * args.chunk_seconds))
+            submitted[number] = time.perf_counter()
+            pipeline.submit(number, timestamp, audio, "otokomae")
+            # 実際の会議と同じく、次のチャンクは一定間隔で届く
+            deadline = submitted[number] + args.interval
+            while True:
+                for job in pipeline.collect():
+                    finished[job.chunk] = time.perf_counter()
+                    jobs.append(job)
+                if time.perf_counter() >= deadline:
+                    break
+                time.sleep(0.005)
+
+        while len(jobs) < len(chunks):
+            for job in pipeline.collect():
+                finished[job.chunk] = time.perf_counter()
+                jobs.append(job)
+            time.sleep(0.005)
+        pipeline_seconds = time.perf_counter() - started
+
+        summary_started = time.perf_counter()
+        summarizer.summarize()
+        summary_seconds = time.perf_counter() - summary_started
+    finally:
+        pipeline.close()
+        summarizer.close()
+
+    # ツッコミを呼んだチャンク（判定で送ったもの）は順に1件ずつ token_log に入る
+    called = [decision["chunk"] for decision in gate.log if decision["send"] or decision["audit"]]
+    calls = [
+        {"chunk": chunk, "prompt_tokens": entry["prompt_tokens"], "aborted": entry.get("aborted", False)}
+        for chunk, entry in zip(called, token_log)
+    ]
+    prompt_tokens = [call["prompt_tokens"] for call in calls]
+    cached_tokens = sum(entry.get("cached_tokens", 0) for entry in token_log)
+
+    audio_seconds = args.chunks * args.chunk_seconds
+    server_stats = server.stats.snapshot()
+    return {
+        "latency": {
+            "end_to_end": percentiles(finished[chunk] - submitted[chunk] for chunk in finished),
+            "transcribe": percentiles(job.transcribe_seconds for job in jobs),
+            "comment": percentiles(job.comment_seconds for job in jobs),
+            "preprocess": percentiles(stats["seconds"] for stats in audio_log),
+            "ttft": percentiles(entry.get("ttft") for entry in token_log),
+            "summary": {"max": summary_seconds},
+        },
+        # サービス内部の段階（ハッシュ・前処理・ツッコミ解析など）
+        "stages": services.metrics.percentiles(),
+        "tokens": {
+            "per_call": {
+                "first": prompt_tokens[0] if prompt_tokens else None,
+                "last": prompt_tokens[-1] if prompt_tokens else None,
+                "max": max(prompt_tokens, default=None),
+                "mean": sum(prompt_tokens) / len(prompt_tokens) if prompt_tokens else None,
+            },
+            "series": calls,
+            "total_prompt": sum(prompt_tokens),
+            # プロンプトキャッシュで割引された入力トークン
+            "total_cached": cached_tokens,
+            "cached_ratio": cached_tokens / sum(prompt_tokens) if sum(prompt_tokens) else None,
+            "tsukkomi_calls": len(calls),
+            "aborted_calls": sum(1 for call in calls if call["aborted"]),
+        },
+        "upload": {
+            "audio_bytes": sum(stats["bytes_out"] for stats in audio_log),
+            "raw_audio_bytes": sum(stats["bytes_in"] for stats in audio_log),
+            "dropped_chunks": sum(1 for stats in audio_log if stats["dropped"]),
+            "server_bytes_received": server_stats["bytes_received"],
+        },
+        "throughput": {
+            "pipeline_seconds": pipeline_seconds,
+            "chunks_per_second": len(jobs) / pipeline_seconds if pipeline_seconds else None,
+            "audio_seconds_per_second": audio_seconds / pipeline_seconds if pipeline_seconds else None,
+        },
+        "prompts": services.prompts.stats(),
+        "errors": sum(1 for job in jobs if job.error),
+        "server_requests": server_stats["requests"],
+        "client": client.stats(),
+    }
+
+
+def metric(result, path):
+    value = result
+    for key in path:
+        if not isinstance(value, dict) or value.get(key) is None:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(current, previous):
+    """前回の結果と比べて悪化した指標の一覧"""
+    regressions = []
+    for paths, worse in ((LOWER_IS_BETTER, 1), (HIGHER_IS_BETTER, -1)):
+        for path in paths:
+            now, before = metric(current, path), metric(previous, path)
+            if not now or not before:
+                continue
+            change = (now - before) / before
+            if change * worse > REGRESSION_THRESHOLD:
+                regressions.append((".".join(path), before, now, change))
+    return regressions
+
+
+def load_previous(path, config):
+    """同じ設定で記録された最後の結果"""
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("config") == config:
+                previous = record
+    return previous
+
+
+def print_report(record, previous):
+    results = record["results"]
+    print(f"benchmark {record['revision'] or '(no git)'} {record['recorded_at']}")
+    for stage, stats in results["latency"].items():
+        if stats and "p50" in stats:
+            print(f"  {stage:<11} p50 {stats['p50'] * 1000:8.1f}ms  p95 {stats['p95'] * 1000:8.1f}ms  "
+                  f"max {stats['max'] * 1000:8.1f}ms  (n={stats['count']})")
+        elif stats:
+            print(f"  {stage:<11} {stats['max'] * 1000:8.1f}ms")
+    for stage, stats in sorted(results["stages"].items()):
+        print(f"  [{stage:<10}] p50 {stats['p50'] * 1000:8.1f}ms  p95 {stats['p95'] * 1000:8.1f}ms  (n={stats['count']})")
+    tokens = results["tokens"]
+    series = " ".join(f"#{call['chunk']}:{call['prompt_tokens']}" for call in tokens["series"])
+    print(f"  tokens/call first {tokens['per_call']['first']} last {tokens['per_call']['last']} "
+          f"max {tokens['per_call']['max']}  calls {tokens['tsukkomi_calls']} (aborted {tokens['aborted_calls']})")
+    print(f"  tokens by chunk {series}")
+    if tokens["cached_ratio"] is not None:
+        print(f"  prompt cache {tokens['total_cached']} / {tokens['total_prompt']} tokens ({tokens['cached_ratio']:.0%})")
+    for stats in results["prompts"]:
+        print(f"  prompt {stats['name']:<28} {stats['source_tokens']} -> {stats['compiled_tokens']} tokens "
+              f"({stats['source_bytes']:,} -> {stats['compiled_bytes']:,} bytes)")
+    upload = results["upload"]
+    print(f"  upload {upload['audio_bytes']:,} bytes (raw {upload['raw_audio_bytes']:,}, "
+          f"dropped chunks {upload['dropped_chunks']})")
+    throughput = results["throughput"]
+    print(f"  throughput {throughput['chunks_per_second']:.2f} chunks/s, "
+          f"{throughput['audio_seconds_per_second']:.1f} audio s/s, errors {results['errors']}, "
+          f"429 {results['client']['rate_limited']}")
+
+    if previous is None:
+        print("  (no previous run with the same settings)")
+        return
+    regressions = compare(results, previous["results"])
+    if not regressions:
+        print(f"  no regressions vs {previous['revision']}")
+    for name, before, now, change in regressions:
+        print(f"  REGRESSION {name}: {before:.4g} -> {now:.4g} ({change:+.0%}) vs {previous['revision']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="フェイクのOpenAIサーバーでチャンク処理の性能を測る")
+    parser.add_argument("--chunks", type=int, default=20, help="会議のチャンク数（既定: 20）")
+    parser.add_argument("--chunk-seconds", type=int, default=30, help="1チャンクの長さ（秒、既定: 30）")
+    parser.add_argument("--interval", type=float, default=0.5, help="チャンクを投入する間隔（秒、既定: 0.5）")
+    parser.add_argument("--silent-rate", type=float, default=0.1, help="無音チャンクの割合（既定: 0.1）")
+    parser.add_argument("--transcribe-latency", type=float, default=0.2)
+    parser.add_argument("--chat-latency", type=float, default=0.1)
+    parser.add_argument("--token-interval", type=float, default=0.005)
+    parser.add_argument("--speak-rate", type=float, default=0.5, help="should_speak=true を返す割合")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429を返す割合")
+    parser.add_argument("--gate-threshold", type=float, default=0.45)
+    parser.add_argument("--no-gate", action="store_true", help="全チャンクをLLMに送る")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default=RESULTS_PATH, help="結果を追記するファイル")
+    parser.add_argument("--no-save", action="store_true", help="結果を保存しない")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args(argv)
+    config = {
+        key: value for key, value in vars(args).items() if key not in ("results", "no_save")
+    }
+
+    server = FakeOpenAIServer(
+        transcribe_latency=args.transcribe_latency,
+        chat_latency=args.chat_latency,
+        token_interval=args.token_interval,
+        speak_rate=args.speak_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=0.2,
+        seed=args.seed
+    )
+    with server:
+        results = run_benchmark(args, server)
+
+    record = {
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "config": config,
+        "results": results,
+    }
+    print_report(record, load_previous(args.results, config))
+    if not args.no_save:
+        with open(args.results, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""長時間会議のソークテスト
+
+Streamlit のアプリテストAPI（AppTest）で app.py を画面なしで動かし、
+フェイクのOpenAIサーバーを相手に3〜4時間分の会議をチャンクごとに流す。
+チャンクを1件処理するたびにアプリ全体を再実行し、再実行の時間・プロセスのRSS・
+session_state のサイズを記録する。会議が長くなるにつれて予算を超えて増えたら失敗（終了コード1）にする。
+
+    python -m bench.soak --chunks 400 --chunk-seconds 30
+
+AppTest はカスタムコンポーネントの値を設定できないため、録音コンポーネントの代わりに
+録音パネルと同じ手順（チャンク番号の採番・パイプラインへの投入・チャンク長の記録）で直接投入する。
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from types import FunctionType, MethodType, ModuleType
+
+from bench.fake_openai import FakeOpenAIServer
+from bench.run import synthetic_chunk
+
+# サイズを数えない型（共有リソースやスレッドなど、会議の長さで増えないもの）
+_OPAQUE_TYPES = (ModuleType, FunctionType, MethodType, type, threading.Thread)
+
+
+def deep_size(obj, seen=None):
+    """オブジェクトが参照しているコンテナ・文字列を含めたおおよそのバイト数"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, _OPAQUE_TYPES):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return size + sum(deep_size(item, seen) for item in obj)
+    if hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    for name in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, name):
+            size += deep_size(getattr(obj, name), seen)
+    return size
+
+
+def current_rss_bytes():
+    """現在のRSS（/proc が無い環境ではNone）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_bytes():
+    """プロセス起動からのRSSの最大値"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def slope(points):
+    """(x, y) の最小二乗の傾き"""
+    if len(points) < 2:
+        return 0.0
+    mean_x = statistics.fmean(x for x, _ in points)
+    mean_y = statistics.fmean(y for _, y in points)
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    if not denominator:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator
+
+
+def session_sizes(at):
+    """session_state のキーごとのバイト数（共有オブジェクトは最初に現れたキーで数える）"""
+    seen = set()
+    state = at.session_state.filtered_state
+    return {key: deep_size(value, seen) for key, value in sorted(state.items())}
+
+
+def submit_chunk(at, number, chunk_seconds, audio):
+    """録音パネルと同じ手順でチャンクをパイプラインに投入する"""
+    state = at.session_state
+    state["chunk_counter"] = number
+    timestamp = time.strftime("%H:%M:%S", time.gmtime(number * chunk_seconds))
+    job = state["pipeline"].submit(number, timestamp, audio, "otokomae")
+    state["chunk_scheduler"].submitted(number)
+    return job
+
+
+def wait_for(job, timeout):
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"chunk #{job.chunk} did not finish within {timeout:.0f}s")
+        time.sleep(0.005)
+
+
+def run_soak(args):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file("app.py", default_timeout=args.rerun_timeout)
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"app failed on first run: {at.exception}")
+
+    samples = []
+    last_state_bytes = 0
+    for number in range(1, args.chunks + 1):
+        # 文字起こしキャッシュに当たらないよう、チャンクごとに違う音声にする
+        audio = synthetic_chunk(args.audio_seconds, seed=number)
+        job = submit_chunk(at, number, args.chunk_seconds, audio)
+        wait_for(job, args.rerun_timeout)
+
+        started = time.perf_counter()
+        at.run()
+        rerun_seconds = time.perf_counter() - started
+        if at.exception:
+            raise RuntimeError(f"app failed at chunk #{number}: {at.exception}")
+
+        summary_seconds = None
+        if args.summary_every and number % args.summary_every == 0:
+            started = time.perf_counter()
+            next(button for button in at.sidebar.button if button.label == "📋 会議要約を生成").click().run()
+            summary_seconds = time.perf_counter() - started
+
+        sample = {
+            "chunk": number,
+            "meeting_minutes": number * args.chunk_seconds / 60,
+            "rerun_seconds": rerun_seconds,
+            "summary_seconds": summary_seconds,
+            "rss_bytes": current_rss_bytes(),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+        # session_state を辿るのは重いので間引いて測る
+        if number % args.measure_every == 0 or number == args.chunks:
+            sizes = session_sizes(at)
+            sample["state_bytes"] = last_state_bytes = sum(sizes.values())
+            sample["state_by_key"] = sizes
+        samples.append(sample)
+
+        if number % args.progress_every == 0:
+            print(f"  chunk {number:4d} ({sample['meeting_minutes']:5.0f} min): rerun {rerun_seconds * 1000:6.1f}ms, "
+                  f"RSS {(sample['rss_bytes'] or 0) / 2**20:6.1f}MB, state {last_state_bytes / 1024:8.1f}KB",
+                  flush=True)
+    return samples
+
+
+def check_budgets(samples, args):
+    """会議の長さに対する増え方を予算と比べ、(結果の辞書, 予算超過の一覧) を返す"""
+    window = max(1, min(args.window, len(samples) // 4))
+    # 直近の記録のウィンドウなどが埋まるまでは増えて当然なので、会議が長いほど長めに外す
+    warmup = args.warmup if args.warmup is not None else max(20, len(samples) // 4)
+    warmup = max(0, min(warmup, len(samples) - 2 * window))
+    first = [sample["rerun_seconds"] for sample in samples[warmup:warmup + window]]
+    last = [sample["rerun_seconds"] for sample in samples[-window:]]
+    first_median, last_median = statistics.median(first), statistics.median(last)
+    last_p95 = sorted(last)[min(len(last) - 1, int(0.95 * len(last)))]
+
+    # ウォームアップ後の傾きで増え方を見る（増え続けてよいのは部分要約と検索索引の分だけで、数百バイト以内）
+    measured = [(sample["chunk"], sample["state_bytes"]) for sample in samples if "state_bytes" in sample]
+    state_growth = slope([point for point in measured if point[0] > warmup] or measured)
+    rss = [sample["rss_bytes"] for sample in samples if sample["rss_bytes"]]
+    rss_growth = (rss[-1] - rss[warmup]) / 2**20 if len(rss) > warmup else 0.0
+
+    result = {
+        "chunks": len(samples),
+        "rerun_median_first_ms": first_median * 1000,
+        "rerun_median_last_ms": last_median * 1000,
+        "rerun_p95_last_ms": last_p95 * 1000,
+        "rerun_growth": last_median / first_median if first_median else None,
+        "state_bytes_last": measured[-1][1] if measured else None,
+        "warmup_chunks": warmup,
+        "state_bytes_per_chunk": state_growth,
+        "rss_growth_mb": rss_growth,
+        "peak_rss_mb": samples[-1]["peak_rss_bytes"] / 2**20,
+    }
+
+    failures = []
+    if last_p95 * 1000 > args.max_rerun_ms:
+        failures.append(f"rerun p95 {last_p95 * 1000:.0f}ms > {args.max_rerun_ms:.0f}ms")
+    if result["rerun_growth"] and result["rerun_growth"] > args.max_rerun_growth:
+        failures.append(f"rerun time grew {result['rerun_growth']:.1f}x > {args.max_rerun_growth:.1f}x")
+    if state_growth > args.max_state_bytes_per_chunk:
+        failures.append(f"session_state grows {state_growth:.0f} bytes/chunk > {args.max_state_bytes_per_chunk:.0f}")
+    if rss_growth > args.max_rss_growth_mb:
+        failures.append(f"RSS grew {rss_growth:.0f}MB > {args.max_rss_growth_mb:.0f}MB")
+    return result, failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="長時間会議で app.py の再実行時間とメモリの増え方を調べる")
+    parser.add_argument("--chunks", type=int, default=400, help="チャンク数（既定: 400 = 30秒チャンクで約3時間20分）")
+    parser.add_argument("--chunk-seconds", type=int, default=30, help="会議時間として数える1チャンクの長さ（秒）")
+    parser.add_argument("--audio-seconds", type=float, default=2.0, help="実際に流す合成音声の長さ（秒）")
+    parser.add_argument("--summary-every", type=int, default=100, help="このチャンク数ごとに要約ボタンを押す（0で押さない）")
+    parser.add_argument("--measure-every", type=int, default=10, help="session_state のサイズを測る間隔（チャンク数）")
+    parser.add_argument("--progress-every", type=int, default=25)
+    parser.add_argument("--warmup", type=int, help="比較から外す最初のチャンク数（既定: チャンク数の1/4、最低20）")
+    parser.add_argument("--window", type=int, default=50, help="最初と最後の再実行時間を比べる件数")
+    parser.add_argument("--rerun-timeout", type=float, default=60.0)
+    parser.add_argument("--max-rerun-ms", type=float, default=1000.0, help="最後の区間の再実行時間 p95 の上限")
+    parser.add_argument("--max-rerun-growth", type=float, default=2.0, help="再実行時間の中央値の増加率の上限")
+    parser.add_argument("--max-state-bytes-per-chunk", type=float, default=512.0,
+                        help="ウォームアップ後の session_state の1チャンクあたりの増加量の上限")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=200.0, help="ウォームアップ後のRSS増加の上限")
+    parser.add_argument("--output", help="チャンクごとの計測値を書き出すJSONファイル")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    data_dir = tempfile.mkdtemp(prefix="otokomae-soak-")
+    server = FakeOpenAIServer(transcribe_latency=0.0, chat_latency=0.0, token_interval=0.0, seed=0)
+    with server:
+        # アプリはモジュール読み込み時に環境変数から接続先と保存先を決める
+        os.environ.update({
+            "OPENAI_BASE_URL": server.base_url,
+            "OPENAI_API_KEY": "sk-soak",
+            "OTOKOMAE_CACHE_PATH": os.path.join(data_dir, "results.sqlite3"),
+            "OTOKOMAE_JOURNAL_PATH": os.path.join(data_dir, "meetings.sqlite3"),
+            "OTOKOMAE_ASR_BACKEND": "remote",
+            # 測りたいのはアプリ側の増え方なので、レート制限では待たせない
+            "OPENAI_RPM_LIMIT": "1000000",
+            "OPENAI_TPM_LIMIT": "1000000000",
+        })
+        os.environ.pop("OTOKOMAE_METRICS_PATH", None)
+        os.environ.pop("OTOKOMAE_METRICS_PORT", None)
+        print(f"soak: {args.chunks} chunks ({args.chunks * args.chunk_seconds / 3600:.1f}h meeting)", flush=True)
+        samples = run_soak(args)
+
+    result, failures = check_budgets(samples, args)
+    for key, value in result.items():
+        print(f"  {key}: {value:.2f}" if isinstance(value, float) else f"  {key}: {value}")
+    last_sizes = next(sample["state_by_key"] for sample in reversed(samples) if "state_by_key" in sample)
+    largest = sorted(last_sizes.items(), key=lambda item: item[1], reverse=True)[:5]
+    print("  largest session_state keys: " + ", ".join(f"{key} {size / 1024:.1f}KB" for key, size in largest))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "result": result, "failures": failures, "samples": samples}, f,
+                      ensure_ascii=False, indent=2)
+
+    for failure in failures:
+        print(f"  BUDGET EXCEEDED: {failure}")
+    print("soak passed" if not failures else "soak failed")
+    # AppTest や要約器のスレッドを待たずに終わらせる
+    sys.stdout.flush()
+    os._exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
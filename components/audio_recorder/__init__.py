@@ -1,204 +1,73 @@
+import os
+import struct
+
 import streamlit.components.v1 as components
 
+_component = components.declare_component(
+    "audio_recorder",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend")
+)
+
+# フロントエンドが付ける独自ヘッダ: マジック, 録音セッションID, 連番, 開始時刻（エポックms）
+_HEADER = struct.Struct("<4sIId")
+_MAGIC = b"OTK1"
 
-def audio_recorder(chunk_duration=60, key=None):
+
+def parse_chunk(payload):
     """
-    ブラウザで音声を録音し、指定された秒数ごとに音声チャンクをPython側に送信するカスタムコンポーネント
-    
-    Parameters:
-    -----------
-    chunk_duration : int
-        録音チャンクの長さ（秒）。デフォルトは60秒
-    key : str
-        Streamlitコンポーネントのキー
-    
+    コンポーネントから届いたバイト列をヘッダとWAV本体に分解する
+
+    読むのは先頭のヘッダだけで、WAV本体はコピーせずmemoryviewで返す。
+    同じチャンクが再実行のたびに返ってきても、連番の比較だけで済むようにするため。
+
     Returns:
     --------
     dict or None
-        音声データを含む辞書。形式: {"audio": base64_encoded_audio, "timestamp": timestamp}
+        形式: {"audio": WAV本体のmemoryview, "timestamp": 開始時刻（エポックms）, "session": 録音セッションID, "sequence": 連番}
+        形式が違う場合はNone
     """
-    
-    html_code = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            body {{
-                margin: 0;
-                padding: 10px;
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-            }}
-            .controls {{
-                display: flex;
-                gap: 10px;
-                margin-bottom: 15px;
-            }}
-            button {{
-                padding: 10px 20px;
-                font-size: 14px;
-                border: none;
-                border-radius: 4px;
-                cursor: pointer;
-                font-weight: 500;
-            }}
-            #startBtn {{
-                background-color: #4CAF50;
-                color: white;
-            }}
-            #stopBtn {{
-                background-color: #f44336;
-                color: white;
-            }}
-            button:disabled {{
-                opacity: 0.5;
-                cursor: not-allowed;
-            }}
-            .status {{
-                padding: 10px;
-                border-radius: 4px;
-                font-size: 13px;
-                margin-bottom: 10px;
-            }}
-            .status.recording {{
-                background-color: #ffebee;
-                color: #c62828;
-            }}
-            .status.idle {{
-                background-color: #e8f5e9;
-                color: #2e7d32;
-            }}
-            .info {{
-                font-size: 12px;
-                color: #666;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="controls">
-            <button id="startBtn">🎤 録音開始</button>
-            <button id="stopBtn" disabled>⏹️ 録音停止</button>
-        </div>
-        <div id="status" class="status idle">待機中...</div>
-        <div class="info">
-            <p>📝 {chunk_duration}秒ごとに自動送信 | チャンク数: <span id="chunkCount">0</span></p>
-        </div>
-
-        <script>
-            let mediaRecorder = null;
-            let audioChunks = [];
-            let chunkTimer = null;
-            let chunkCount = 0;
-            let isRecording = false;
-
-            function sendDataToParent(audioData) {{
-                const reader = new FileReader();
-                reader.onloadend = function() {{
-                    const base64data = reader.result.split(',')[1];
-                    window.parent.postMessage({{
-                        type: 'streamlit:setComponentValue',
-                        value: {{
-                            audio: base64data,
-                            timestamp: Date.now(),
-                            chunk_number: chunkCount
-                        }}
-                    }}, '*');
-                }};
-                reader.readAsDataURL(audioData);
-            }}
-
-            function updateStatus(message, type = 'idle') {{
-                const statusEl = document.getElementById('status');
-                statusEl.className = `status ${{type}}`;
-                statusEl.textContent = message;
-            }}
-
-            function processChunk() {{
-                if (audioChunks.length > 0) {{
-                    const audioBlob = new Blob(audioChunks, {{ type: 'audio/webm' }});
-                    audioChunks = [];
-                    chunkCount++;
-                    document.getElementById('chunkCount').textContent = chunkCount;
-                    updateStatus(`録音中... (チャンク #${{chunkCount}} 送信中)`, 'recording');
-                    sendDataToParent(audioBlob);
-                }}
-            }}
+    if not payload or len(payload) <= _HEADER.size:
+        return None
+    magic, session, sequence, timestamp = _HEADER.unpack_from(payload)
+    if magic != _MAGIC:
+        return None
+    return {
+        "audio": memoryview(payload)[_HEADER.size:],
+        "timestamp": timestamp,
+        "session": session,
+        "sequence": sequence,
+    }
 
-            async function startRecording() {{
-                try {{
-                    const stream = await navigator.mediaDevices.getUserMedia({{
-                        audio: {{
-                            echoCancellation: true,
-                            noiseSuppression: true,
-                            autoGainControl: true
-                        }}
-                    }});
 
-                    mediaRecorder = new MediaRecorder(stream, {{ mimeType: 'audio/webm' }});
-                    
-                    mediaRecorder.ondataavailable = (event) => {{
-                        if (event.data.size > 0) {{
-                            audioChunks.push(event.data);
-                        }}
-                    }};
-
-                    mediaRecorder.onstop = () => {{
-                        processChunk();
-                        stream.getTracks().forEach(track => track.stop());
-                    }};
-
-                    mediaRecorder.start();
-                    isRecording = true;
-                    chunkCount = 0;
-                    document.getElementById('chunkCount').textContent = chunkCount;
-                    
-                    updateStatus(`録音中... ({chunk_duration}秒ごとに自動送信)`, 'recording');
-                    document.getElementById('startBtn').disabled = true;
-                    document.getElementById('stopBtn').disabled = false;
-
-                    chunkTimer = setInterval(() => {{
-                        if (isRecording && mediaRecorder && mediaRecorder.state === 'recording') {{
-                            mediaRecorder.stop();
-                            setTimeout(() => {{
-                                if (isRecording) {{
-                                    mediaRecorder.start();
-                                }}
-                            }}, 100);
-                        }}
-                    }}, {chunk_duration * 1000});
-
-                }} catch (error) {{
-                    console.error('録音エラー:', error);
-                    updateStatus('エラー: マイクアクセス拒否', 'idle');
-                }}
-            }}
+def audio_recorder(chunk_duration=30, acked=None, key=None):
+    """
+    ブラウザで音声を録音し、指定された秒数ごとに音声チャンクをPython側に送信するカスタムコンポーネント
 
-            function stopRecording() {{
-                isRecording = false;
-                if (chunkTimer) {{
-                    clearInterval(chunkTimer);
-                    chunkTimer = null;
-                }}
-                if (mediaRecorder && mediaRecorder.state !== 'inactive') {{
-                    mediaRecorder.stop();
-                }}
-                updateStatus('録音停止', 'idle');
-                document.getElementById('startBtn').disabled = false;
-                document.getElementById('stopBtn').disabled = true;
-            }}
+    録音は16kHzモノラルPCMで途切れなく続け、サンプル数でチャンクに区切る。
+    チャンクはbase64にせずバイナリのまま、録音セッションごとの連番付きで1件ずつ送られる。
+    ブラウザ側は受理された連番（acked）より後のチャンクを保持し続け、受理されたら次を送る。
+    送るものが無くなると値を空に戻すので、受理済みの音声がウィジェットの値として残り続けない。
 
-            document.getElementById('startBtn').addEventListener('click', startRecording);
-            document.getElementById('stopBtn').addEventListener('click', stopRecording);
+    Parameters:
+    -----------
+    chunk_duration : int
+        録音チャンクの長さ（秒）。デフォルトは30秒
+    acked : tuple or None
+        Python側で受理済みの (録音セッションID, 連番)
+    key : str
+        Streamlitコンポーネントのキー
 
-            // Streamlitに準備完了を通知
-            window.parent.postMessage({{
-                type: 'streamlit:componentReady',
-                height: 150
-            }}, '*');
-        </script>
-    </body>
-    </html>
+    Returns:
+    --------
+    dict or None
+        最後に届いたチャンク（parse_chunk の形式）。同じチャンクが繰り返し返るので、連番で重複を除くこと
     """
-    
-    component_value = components.html(html_code, height=150, scrolling=False)
-    return component_value
+    acked_session, acked_sequence = acked or (None, 0)
+    payload = _component(
+        chunk_duration=chunk_duration,
+        acked_session=acked_session,
+        acked_sequence=acked_sequence,
+        key=key,
+        default=None
+    )
+    return parse_chunk(payload)
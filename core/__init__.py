@@ -0,0 +1 @@
+"""OTOKO★MAEくんの会議処理ロジック（Streamlitに依存しない部分）"""
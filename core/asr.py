@@ -0,0 +1,282 @@
+"""音声認識（ASR）バックエンド
+
+transcribe_audio から呼ぶ文字起こしエンジンを差し替えられるようにする。
+
+- remote: OpenAI Whisper API（既定）
+- local: faster-whisper の量子化モデルをCPUで動かす（オフラインや社内の閉じた会議室向け）
+- auto: remote を使い、遅い・失敗したときは local に切り替える
+
+どのバックエンドも transcribe(音声バイト列, ファイル名) で文字起こし結果を返す。
+transcribe_with_engine は実際に文字起こししたバックエンドも返すので、課金やキャッシュのキーはそちらで判定する。
+"""
+
+import importlib.util
+import io
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from core.openai_client import PRIORITY_TRANSCRIBE
+
+logger = logging.getLogger(__name__)
+
+
+class ASRBackend:
+    """文字起こしエンジンの共通インターフェース"""
+
+    name = "base"
+    # アップロード量を減らすためにOgg/Opusへ圧縮した音声を受け取るか（ローカル処理ならWAVのままでよい）
+    compressed_upload = True
+    # 音声の長さで課金されるか
+    billed = False
+
+    def __init__(self):
+        self._count_lock = threading.Lock()
+        self.counts = {}
+
+    def _count(self, name):
+        with self._count_lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    @property
+    def engine(self):
+        """エンジンとモデルを表す名前（文字起こしキャッシュのキーに使う）"""
+        return self.name
+
+    def engines(self):
+        """文字起こしに使うことのあるバックエンド（優先順）"""
+        return [self]
+
+    def transcribe(self, audio_bytes, filename="audio.wav"):
+        raise NotImplementedError
+
+    def transcribe_with_engine(self, audio_bytes, filename="audio.wav"):
+        """(文字起こし結果, 実際に文字起こししたバックエンド) を返す"""
+        return self.transcribe(audio_bytes, filename), self
+
+    def stats(self):
+        """エンジンごとの処理件数"""
+        with self._count_lock:
+            return dict(self.counts)
+
+
+class RemoteWhisperBackend(ASRBackend):
+    """OpenAI Whisper API（SharedOpenAIClient経由）"""
+
+    name = "remote"
+    billed = True
+
+    def __init__(self, client, model="whisper-1", language="ja"):
+        super().__init__()
+        self.client = client
+        self.model = model
+        self.language = language
+
+    @property
+    def engine(self):
+        return f"{self.name}:{self.model}"
+
+    def transcribe(self, audio_bytes, filename="audio.wav"):
+        # 音声ファイルとして送信（拡張子でWhisperが形式を判定する）
+        audio_file = io.BytesIO(audio_bytes)
+        audio_file.name = filename
+        transcript = self.client.transcription(
+            PRIORITY_TRANSCRIBE,
+            model=self.model,
+            file=audio_file,
+            language=self.language
+        )
+        self._count(self.name)
+        return transcript.text
+
+
+class LocalWhisperBackend(ASRBackend):
+    """faster-whisper によるCPU上の文字起こし
+
+    モデルは最初の文字起こしで1度だけ読み込む。リクエストは1本のワーカースレッドが1件ずつ順に処理する。
+    区間をまたいだバッチ推論はせず、各区間の中だけ BatchedInferencePipeline でバッチ推論する。
+    """
+
+    name = "local"
+    compressed_upload = False
+
+    def __init__(self, model_size="small", device="cpu", compute_type="int8", language="ja",
+                 batch_size=8, cpu_threads=0):
+        super().__init__()
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
+        self.language = language
+        self.batch_size = batch_size
+        self.cpu_threads = cpu_threads
+        self._requests = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    @property
+    def engine(self):
+        return f"{self.name}:{self.model_size}"
+
+    @staticmethod
+    def available():
+        """faster-whisper がインストールされているか"""
+        return importlib.util.find_spec("faster_whisper") is not None
+
+    def transcribe(self, audio_bytes, filename="audio.wav"):
+        self._ensure_worker()
+        future = Future()
+        self._requests.put((audio_bytes, future))
+        return future.result()
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="local-asr", daemon=True)
+                self._worker.start()
+
+    def _load(self):
+        from faster_whisper import WhisperModel
+        model = WhisperModel(
+            self.model_size, device=self.device, compute_type=self.compute_type, cpu_threads=self.cpu_threads
+        )
+        try:
+            from faster_whisper import BatchedInferencePipeline
+        except ImportError:
+            return model, False
+        return BatchedInferencePipeline(model=model), True
+
+    def _run(self):
+        try:
+            engine, batched = self._load()
+        except Exception as e:
+            # 読み込めない場合は待っているリクエストすべてに例外を返し続ける
+            logger.error("local ASR model could not be loaded: %s", e)
+            while True:
+                _, future = self._requests.get()
+                future.set_exception(e)
+
+        while True:
+            # 待っているリクエストを取り出し、モデルを温めたまま1件ずつ続けて処理する
+            pending = [self._requests.get()]
+            while True:
+                try:
+                    pending.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+            for audio_bytes, future in pending:
+                try:
+                    future.set_result(self._transcribe_one(engine, batched, audio_bytes))
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _transcribe_one(self, engine, batched, audio_bytes):
+        options = {"language": self.language}
+        if batched:
+            options["batch_size"] = self.batch_size
+        segments, _ = engine.transcribe(self._decode(audio_bytes), **options)
+        text = "".join(segment.text for segment in segments).strip()
+        self._count(self.name)
+        return text
+
+    @staticmethod
+    def _decode(audio_bytes):
+        """16kHzモノラルWAVならNumPy配列にする（それ以外はfaster-whisper側でデコードさせる）"""
+        from core.audio import TARGET_RATE, is_wav, read_wav, to_mono_wav
+        import numpy as np
+
+        if is_wav(audio_bytes):
+            wav = to_mono_wav(audio_bytes, TARGET_RATE)
+            if wav is not None:
+                _, frames = read_wav(wav)
+                return np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+        return io.BytesIO(audio_bytes)
+
+
+class FallbackBackend(ASRBackend):
+    """基本のバックエンドが遅い・失敗したときに予備のバックエンドへ切り替える
+
+    primary が timeout 秒以内に返らないか例外を出したら fallback で文字起こしし、
+    その後 cooldown 秒は primary を使わない。primary の処理時間の移動平均が slow_seconds を超えた場合も同様。
+    """
+
+    def __init__(self, primary, fallback, timeout=30.0, slow_seconds=15.0, cooldown=120.0,
+                 smoothing=0.3, max_workers=4):
+        super().__init__()
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+        self.compressed_upload = primary.compressed_upload
+        self.timeout = timeout
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.latency = None
+        self._lock = threading.Lock()
+        self._primary_blocked_until = 0.0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asr-primary")
+
+    def _block_primary(self, reason):
+        with self._lock:
+            self._primary_blocked_until = time.monotonic() + self.cooldown
+        logger.warning("ASR falling back to %s for %.0fs: %s", self.fallback.name, self.cooldown, reason)
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self.latency = seconds if self.latency is None else (
+                self.smoothing * seconds + (1 - self.smoothing) * self.latency
+            )
+            slow = self.latency > self.slow_seconds
+        if slow:
+            self._block_primary(f"average latency {self.latency:.1f}s")
+
+    def engines(self):
+        return self.primary.engines() + self.fallback.engines()
+
+    def transcribe(self, audio_bytes, filename="audio.wav"):
+        return self.transcribe_with_engine(audio_bytes, filename)[0]
+
+    def transcribe_with_engine(self, audio_bytes, filename="audio.wav"):
+        with self._lock:
+            use_primary = time.monotonic() >= self._primary_blocked_until
+        if use_primary:
+            started = time.monotonic()
+            future = self._pool.submit(self.primary.transcribe_with_engine, audio_bytes, filename)
+            try:
+                result = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                # 遅れている呼び出しはそのまま走らせておき、結果は使わない
+                self._block_primary(f"no response within {self.timeout:.0f}s")
+            except Exception as e:
+                self._block_primary(e)
+            else:
+                self._record_latency(time.monotonic() - started)
+                return result
+        return self.fallback.transcribe_with_engine(audio_bytes, filename)
+
+    def stats(self):
+        stats = self.primary.stats()
+        for name, count in self.fallback.stats().items():
+            stats[name] = stats.get(name, 0) + count
+        return stats
+
+
+def make_backend(kind, client, local_model="small", timeout=30.0):
+    """設定名からバックエンドを作る（"remote" / "local" / "auto"）
+
+    faster-whisper が入っていなければ、"local" は ImportError を出し、"auto" は警告して remote だけを使う。
+    """
+    local_available = LocalWhisperBackend.available()
+    if kind == "local":
+        if not local_available:
+            raise ImportError("ASR backend 'local' requires faster-whisper (pip install faster-whisper)")
+        return LocalWhisperBackend(model_size=local_model)
+    remote = RemoteWhisperBackend(client)
+    if kind == "auto":
+        if local_available:
+            return FallbackBackend(remote, LocalWhisperBackend(model_size=local_model), timeout=timeout)
+        logger.warning("faster-whisper is not installed, ASR backend 'auto' uses remote only")
+    elif kind != "remote":
+        logger.warning("unknown ASR backend %r, using remote", kind)
+    return remote
@@ -0,0 +1,296 @@
+"""音声データの前処理と分割
+
+録音をWhisperに送る前に16kHzモノラルへ変換して前後の無音を切り詰め、圧縮する。
+アップロード上限（25MB）を超える録音は無音に近い位置で上限未満の区間に分割する。
+"""
+
+import array
+import io
+import shutil
+import subprocess
+import sys
+import time
+import wave
+
+from core.vad import speech_bounds
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Whisper APIの上限は25MB。ヘッダ等の余裕を持たせる
+MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+# Whisperは内部で16kHzモノラルに変換するので、それ以上の情報は送っても無駄になる
+TARGET_RATE = 16000
+# 圧縮時のOpusビットレート（音声認識には十分な品質）
+OPUS_BITRATE = "24k"
+
+FFMPEG = shutil.which("ffmpeg")
+
+
+def is_wav(audio_bytes):
+    """RIFF/WAVE形式かどうか"""
+    return audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE"
+
+
+def read_wav(audio_bytes):
+    """WAVバイト列を (パラメータ, PCMフレーム) に分解する"""
+    with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+        params = wav.getparams()
+        frames = wav.readframes(params.nframes)
+    return params, frames
+
+
+def write_wav(frames, nchannels, sampwidth, framerate):
+    """PCMフレームをWAVバイト列にする"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(nchannels)
+        wav.setsampwidth(sampwidth)
+        wav.setframerate(framerate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+def frame_energies(frames, params, window_frames):
+    """window_frames ごとの平均振幅（16bit PCMのみ対応、それ以外はNone）"""
+    if params.sampwidth != 2:
+        return None
+
+    if np is not None:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32)
+        samples = samples[:len(samples) - len(samples) % params.nchannels]
+        mono = samples.reshape(-1, params.nchannels).mean(axis=1) if params.nchannels > 1 else samples
+        count = len(mono) // window_frames
+        if count == 0:
+            return []
+        return np.abs(mono[:count * window_frames]).reshape(count, window_frames).mean(axis=1).tolist()
+
+    # NumPyが無い場合は標準ライブラリで計算する
+    samples = array.array("h")
+    samples.frombytes(frames[:len(frames) - len(frames) % 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    step = window_frames * params.nchannels
+    return [
+        sum(abs(s) for s in samples[i:i + step]) / step
+        for i in range(0, len(samples) - step + 1, step)
+    ]
+
+
+def split_wav(audio_bytes, max_bytes=MAX_UPLOAD_BYTES, search_seconds=10.0, window_seconds=0.1):
+    """WAVを上限サイズ未満の区間に分割する
+
+    各区間の終端は上限直前 search_seconds 秒の中で最も音量が小さい位置に置く。
+    戻り値は (開始秒, WAVバイト列) のリスト。
+    """
+    params, frames = read_wav(audio_bytes)
+    frame_size = params.nchannels * params.sampwidth
+    total_frames = len(frames) // frame_size
+    # WAVヘッダ分（44バイト）を差し引いた最大フレーム数
+    max_frames = (max_bytes - 44) // frame_size
+    if total_frames <= max_frames:
+        return [(0.0, audio_bytes)]
+
+    window_frames = max(1, int(params.framerate * window_seconds))
+    search_frames = int(params.framerate * search_seconds)
+    energies = frame_energies(frames, params, window_frames)
+
+    segments = []
+    start = 0
+    while start < total_frames:
+        end = min(start + max_frames, total_frames)
+        if end < total_frames and energies:
+            # 探索範囲内で最も静かな窓の位置で区切る
+            first = max(start + 1, end - search_frames) // window_frames
+            last = end // window_frames
+            candidates = range(first, min(last, len(energies)))
+            if candidates:
+                quietest = min(reversed(candidates), key=lambda i: energies[i])
+                end = max(start + 1, quietest * window_frames + window_frames // 2)
+        segment = frames[start * frame_size:end * frame_size]
+        segments.append((start / params.framerate, write_wav(segment, params.nchannels, params.sampwidth, params.framerate)))
+        start = end
+    return segments
+
+
+def format_offset(seconds):
+    """区間の開始位置を [+MM:SS] 形式にする"""
+    minutes, secs = divmod(int(seconds), 60)
+    return f"[+{minutes:02d}:{secs:02d}]"
+
+
+def _samples_from_frames(frames, params):
+    """PCMフレームを [-1, 1] のモノラルfloat配列にする（NumPy使用）"""
+    width = params.sampwidth
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        raw = np.frombuffer(frames[:len(frames) - len(frames) % 3], dtype=np.uint8).reshape(-1, 3)
+        ints = raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        samples = ints.astype(np.float32) / float(1 << 23)
+    else:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / float(1 << 31)
+
+    channels = params.nchannels
+    samples = samples[:len(samples) - len(samples) % channels]
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def _resample(samples, src_rate, dst_rate):
+    """サンプリングレート変換（NumPy使用、簡易ローパス付き）"""
+    if src_rate == dst_rate:
+        return samples
+    if src_rate % dst_rate == 0:
+        # 整数比なら区間平均で間引く（48kHz→16kHzなど）
+        factor = src_rate // dst_rate
+        samples = samples[:len(samples) - len(samples) % factor]
+        return samples.reshape(-1, factor).mean(axis=1)
+
+    if src_rate > dst_rate:
+        # 移動平均で折り返し雑音を抑えてから補間する
+        width = int(np.ceil(src_rate / dst_rate))
+        samples = np.convolve(samples, np.ones(width, dtype=np.float32) / width, mode="same")
+    duration = len(samples) / src_rate
+    positions = np.arange(int(duration * dst_rate)) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def _downmix_pure_python(frames, params, dst_rate):
+    """NumPyが無い場合の16bit PCM用の簡易変換（チャンネル平均と間引き）"""
+    samples = array.array("h")
+    samples.frombytes(frames[:len(frames) - len(frames) % 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+
+    channels = params.nchannels
+    total = len(samples) // channels
+    ratio = params.framerate / dst_rate
+    count = int(total / ratio)
+    out = array.array("h", bytes(2 * count))
+    for i in range(count):
+        base = int(i * ratio) * channels
+        out[i] = sum(samples[base:base + channels]) // channels
+    if sys.byteorder == "big":
+        out.byteswap()
+    return out.tobytes()
+
+
+def _ffmpeg(args, data):
+    """ffmpegをパイプで実行して出力バイト列を返す"""
+    result = subprocess.run(
+        [FFMPEG, "-hide_banner", "-loglevel", "error", *args],
+        input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    return result.stdout
+
+
+def to_mono_wav(audio_bytes, target_rate=TARGET_RATE):
+    """録音を target_rate のモノラル16bit WAVに変換する（変換できない場合はNone。呼び出し側は元のバイト列を送る）"""
+    if is_wav(audio_bytes):
+        try:
+            params, frames = read_wav(audio_bytes)
+        except (wave.Error, EOFError):
+            # 浮動小数点やWAVE_FORMAT_EXTENSIBLEなど wave で読めないWAVは、WAV以外と同じくffmpegに任せる
+            params = None
+        if params is not None:
+            if params.nchannels == 1 and params.sampwidth == 2 and params.framerate == target_rate:
+                return audio_bytes
+            if np is not None:
+                samples = _resample(_samples_from_frames(frames, params), params.framerate, target_rate)
+                pcm = np.clip(np.round(samples * 32767.0), -32768, 32767).astype("<i2").tobytes()
+                return write_wav(pcm, 1, 2, target_rate)
+            if params.sampwidth == 2:
+                return write_wav(_downmix_pure_python(frames, params, target_rate), 1, 2, target_rate)
+            return None
+
+    if FFMPEG:
+        # WebMなどWAV以外（と wave で読めないWAV）はffmpegで生PCMにデコードする
+        try:
+            pcm = _ffmpeg(["-i", "pipe:0", "-ac", "1", "-ar", str(target_rate), "-f", "s16le", "pipe:1"], audio_bytes)
+        except (subprocess.CalledProcessError, OSError):
+            return None
+        return write_wav(pcm, 1, 2, target_rate)
+    return None
+
+
+def encode_compact(wav_bytes):
+    """WhisperがサポートするOgg/Opusに圧縮する（ffmpegが無い場合はWAVのまま）
+
+    戻り値は (バイト列, アップロード時のファイル名)。
+    """
+    if FFMPEG:
+        try:
+            encoded = _ffmpeg(["-f", "wav", "-i", "pipe:0", "-c:a", "libopus", "-b:a", OPUS_BITRATE,
+                               "-application", "voip", "-f", "ogg", "pipe:1"], wav_bytes)
+            if encoded:
+                return encoded, "audio.ogg"
+        except (subprocess.CalledProcessError, OSError):
+            pass
+    return wav_bytes, "audio.wav"
+
+
+def trim_silence(wav_bytes):
+    """16bitモノラルWAVの前後の無音を切り詰める
+
+    戻り値は (WAVバイト列 または 発話が無ければNone, 情報)。
+    情報は speech_seconds / trimmed_seconds を持つ辞書。NumPyが無い場合は何もしない。
+    """
+    params, frames = read_wav(wav_bytes)
+    duration = params.nframes / params.framerate if params.framerate else 0.0
+    if np is None or params.nchannels != 1 or params.sampwidth != 2:
+        return wav_bytes, {"speech_seconds": duration, "trimmed_seconds": 0.0}
+
+    samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    bounds = speech_bounds(samples, params.framerate)
+    if bounds is None:
+        return None, {"speech_seconds": 0.0, "trimmed_seconds": duration}
+
+    start, end = bounds
+    speech_seconds = (end - start) / params.framerate
+    if start == 0 and end == len(samples):
+        return wav_bytes, {"speech_seconds": speech_seconds, "trimmed_seconds": 0.0}
+
+    trimmed = write_wav(frames[start * 2:end * 2], 1, 2, params.framerate)
+    return trimmed, {"speech_seconds": speech_seconds, "trimmed_seconds": duration - speech_seconds}
+
+
+def preprocess_audio(audio_bytes, max_bytes=MAX_UPLOAD_BYTES, compress=True):
+    """録音を16kHzモノラルに変換し、無音を除いて分割・圧縮する（compress=FalseならWAVのまま）
+
+    戻り値は ([(開始秒, バイト列, ファイル名), ...], 統計情報)。発話が無ければ区間は空になる。
+    統計情報は bytes_in / bytes_out / seconds / format / speech_seconds / trimmed_seconds / dropped を持つ辞書。
+    """
+    started = time.perf_counter()
+    wav = to_mono_wav(audio_bytes)
+    vad_info = {"speech_seconds": None, "trimmed_seconds": 0.0}
+
+    if wav is None:
+        # 変換できない形式はそのまま送る（分割もしない）
+        name = "audio.wav" if is_wav(audio_bytes) else "audio.webm"
+        uploads = [(0.0, audio_bytes, name)]
+    else:
+        wav, vad_info = trim_silence(wav)
+        if wav is None:
+            uploads = []
+        else:
+            uploads = [
+                (offset, *(encode_compact(segment) if compress else (segment, "audio.wav")))
+                for offset, segment in split_wav(wav, max_bytes=max_bytes)
+            ]
+
+    stats = {
+        "bytes_in": len(audio_bytes),
+        "bytes_out": sum(len(data) for _, data, _ in uploads),
+        "seconds": time.perf_counter() - started,
+        "format": uploads[0][2].rsplit(".", 1)[-1] if uploads else None,
+        "dropped": not uploads,
+        **vad_info,
+    }
+    return uploads, stats
@@ -0,0 +1,89 @@
+"""API結果のディスクキャッシュ
+
+文字起こし・ツッコミ・要約の結果を、入力のハッシュをキーにしてSQLiteに保存する。
+合計サイズが上限を超えたら最後に使われた時刻が古いものから削除する（LRU）。
+同じプロセスの全セッションで1つのインスタンスを共有する。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def make_key(*parts):
+    """キーの構成要素を連結してハッシュ化する"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, bytes):
+            part = str(part).encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """サイズ上限付きのLRUキャッシュ（SQLite）"""
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """キャッシュされた値を返す（無ければNone）"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        """値を保存し、上限を超えていれば古いものから削除する"""
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """合計サイズが上限に収まるまで古いエントリを削除する（ロック保持中に呼ぶ）"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        rows = self._conn.execute("SELECT key, size FROM cache ORDER BY last_access").fetchall()
+        stale = []
+        for key, size in rows:
+            if total - removed <= self.max_bytes:
+                break
+            stale.append((key,))
+            removed += size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", stale)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
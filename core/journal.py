@@ -0,0 +1,195 @@
+"""会議ジャーナル（ディスク上の追記専用ログ）
+
+チャンクごとの文字起こし・ツッコミ・処理時間を完了した時点でSQLite（WALモード）に追記する。
+ブラウザの再読み込みやサーバーの再起動の後でも、会議IDから表示を復元して会議を再開できる。
+セッション側は会議IDと直近の数件だけを持てばよい。
+会議コンテキストなどの処理状態も一定件数ごとにチェックポイントとして保存し、
+再開時はチェックポイントとそれ以降のチャンクだけを読み込む。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MeetingJournal:
+    """会議ごとのチャンク記録（SQLite）"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # チェックポイントの圧縮と書き込みは呼び出し元を待たせないよう、1本のスレッドで保存順に行う
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-checkpoint")
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # 集計値は追記のたびに更新し、再開時に全件を読まずに済むようにする
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meetings ("
+            " id TEXT PRIMARY KEY, started_at REAL NOT NULL, updated_at REAL NOT NULL,"
+            " last_chunk INTEGER NOT NULL DEFAULT 0, chunks INTEGER NOT NULL DEFAULT 0,"
+            " chars INTEGER NOT NULL DEFAULT 0, tokens INTEGER NOT NULL DEFAULT 0, summary TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " meeting_id TEXT NOT NULL, chunk INTEGER NOT NULL, time TEXT NOT NULL,"
+            " transcript TEXT NOT NULL, tsukkomi TEXT, no_tsukkomi INTEGER NOT NULL,"
+            " chars INTEGER NOT NULL, tokens INTEGER NOT NULL,"
+            " transcribe_seconds REAL, comment_seconds REAL, recorded_at REAL NOT NULL,"
+            " PRIMARY KEY (meeting_id, chunk))"
+        )
+        # 会議ごとに最新の1件だけを残す（state は JSON を zlib で圧縮したもの）
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " meeting_id TEXT PRIMARY KEY, chunk INTEGER NOT NULL, state BLOB NOT NULL, recorded_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def create_meeting(self):
+        """新しい会議を登録して会議IDを返す"""
+        meeting_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO meetings (id, started_at, updated_at) VALUES (?, ?, ?)", (meeting_id, now, now)
+            )
+            self._conn.commit()
+        return meeting_id
+
+    def record_chunk(self, meeting_id, segment, tsukkomi=None, no_tsukkomi=False,
+                     transcribe_seconds=None, comment_seconds=None):
+        """完了したチャンクを追記する（segment は TranscriptStore の Segment）"""
+        now = time.time()
+        chars = len(segment.line)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO chunks (meeting_id, chunk, time, transcript, tsukkomi, no_tsukkomi,"
+                " chars, tokens, transcribe_seconds, comment_seconds, recorded_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (meeting_id, segment.chunk, segment.time, segment.text, tsukkomi, int(no_tsukkomi),
+                 chars, segment.tokens, transcribe_seconds, comment_seconds, now)
+            )
+            if cursor.rowcount:
+                self._conn.execute(
+                    "UPDATE meetings SET updated_at = ?, last_chunk = MAX(last_chunk, ?), chunks = chunks + 1,"
+                    " chars = chars + ?, tokens = tokens + ? WHERE id = ?",
+                    (now, segment.chunk, chars, segment.tokens, meeting_id)
+                )
+            self._conn.commit()
+
+    def record_summary(self, meeting_id, summary):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE meetings SET summary = ?, updated_at = ? WHERE id = ?", (summary, time.time(), meeting_id)
+            )
+            self._conn.commit()
+
+    def record_checkpoint(self, meeting_id, chunk, state):
+        """chunk まで取り込んだ時点の処理状態（JSONに変換できる辞書）を保存する"""
+        data = zlib.compress(json.dumps(state, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (meeting_id, chunk, state, recorded_at) VALUES (?, ?, ?, ?)",
+                (meeting_id, chunk, data, time.time())
+            )
+            self._conn.commit()
+
+    def record_checkpoint_async(self, meeting_id, chunk, state):
+        """record_checkpoint をバックグラウンドで実行する（state はこの後変更されないスナップショットを渡す）"""
+        return self._writer.submit(self._record_checkpoint_logged, meeting_id, chunk, state)
+
+    def _record_checkpoint_logged(self, meeting_id, chunk, state):
+        try:
+            self.record_checkpoint(meeting_id, chunk, state)
+        except sqlite3.Error as e:
+            # 保存できなくても会議は続ける（再開時は前のチェックポイントから読み直す）
+            logger.warning("checkpoint of meeting %s at chunk %s was not saved: %s", meeting_id, chunk, e)
+
+    def checkpoint(self, meeting_id):
+        """最新のチェックポイントの (チャンク番号, 状態)。無ければ (0, None)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chunk, state FROM checkpoints WHERE meeting_id = ?", (meeting_id,)
+            ).fetchone()
+        if not row:
+            return 0, None
+        return row[0], json.loads(zlib.decompress(row[1]).decode("utf-8"))
+
+    def meeting(self, meeting_id):
+        """会議の集計情報（無ければNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, started_at, updated_at, last_chunk, chunks, chars, tokens, summary"
+                " FROM meetings WHERE id = ?", (meeting_id,)
+            ).fetchone()
+        return self._meeting_dict(row) if row else None
+
+    def recent_meetings(self, limit=10):
+        """最近更新された会議（チャンクのあるもののみ）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, started_at, updated_at, last_chunk, chunks, chars, tokens, summary"
+                " FROM meetings WHERE chunks > 0 ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._meeting_dict(row) for row in rows]
+
+    @staticmethod
+    def _meeting_dict(row):
+        keys = ("id", "started_at", "updated_at", "last_chunk", "chunks", "chars", "tokens", "summary")
+        return dict(zip(keys, row))
+
+    def tail(self, meeting_id, limit):
+        """直近 limit 件のチャンクを古い順に返す（主キーの索引を逆順にたどる）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk, time, transcript, tsukkomi, no_tsukkomi FROM chunks"
+                " WHERE meeting_id = ? ORDER BY chunk DESC LIMIT ?", (meeting_id, limit)
+            ).fetchall()
+        return [
+            {"chunk": chunk, "time": time_text, "text": text, "tsukkomi": tsukkomi, "no_tsukkomi": bool(no_tsukkomi)}
+            for chunk, time_text, text, tsukkomi, no_tsukkomi in reversed(rows)
+        ]
+
+    def iter_chunks(self, meeting_id, batch_size=200, after=0):
+        """チャンク番号が after より後のチャンクを古い順に少しずつ読み出す"""
+        last = after
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT chunk, time, transcript FROM chunks WHERE meeting_id = ? AND chunk > ?"
+                    " ORDER BY chunk LIMIT ?", (meeting_id, last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def chunk_texts(self, meeting_id, chunks, batch_size=500):
+        """指定したチャンクの {チャンク番号: (時刻, 文字起こし)}（検索結果の表示用）"""
+        chunks = list(chunks)
+        texts = {}
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT chunk, time, transcript FROM chunks WHERE meeting_id = ?"
+                    f" AND chunk IN ({','.join('?' * len(batch))})", (meeting_id, *batch)
+                ).fetchall()
+            texts.update((chunk, (time_text, text)) for chunk, time_text, text in rows)
+        return texts
+
+    def transcript_text(self, meeting_id):
+        """時系列順の全文（ダウンロード用）"""
+        return "\n".join(f"[{time_text}] {text}" for _, time_text, text in self.iter_chunks(meeting_id))
@@ -0,0 +1,178 @@
+"""ツッコミ生成用の会議コンテキスト管理
+
+会議全文を毎回送る代わりに、圧縮した「会議の状態」（議題・決定事項・話題）と
+直近チャンクの固定ウィンドウだけを保持し、トークン上限内のプロンプトを組み立てる。
+検索インデックス（core/search.py）を渡すと、直近の発言に関連する過去のチャンクも添える。
+"""
+
+import re
+from collections import deque
+
+from core.tokens import estimate_tokens, truncate_to_tokens
+
+# 決定事項らしい文を拾うためのパターン
+DECISION_PATTERN = re.compile(
+    r"(決定|決まり|決めました|決めましょう|合意|確定|にしましょう|でいきましょう|で行きましょう"
+    r"|することにし|やることにし|担当|までに)"
+)
+# 話題語の候補（漢字2文字以上・カタカナ2文字以上・英単語）
+TOPIC_PATTERN = re.compile(r"[一-龥々]{2,}|[ァ-ヴー]{2,}|[A-Za-z][A-Za-z0-9]{2,}")
+SENTENCE_SPLIT = re.compile(r"(?<=[。！？!?\n])")
+# 話題にしても意味の薄い語
+TOPIC_STOPWORDS = {
+    "今日", "今回", "時間", "自分", "感じ", "部分", "場合", "必要", "会議", "意味", "内容",
+    "本当", "一応", "結構", "全然", "大丈夫", "ちょっと", "そうですね", "ありがとう",
+}
+
+
+class MeetingContext:
+    """会議の圧縮状態と直近チャンクを保持し、上限付きのプロンプトを生成する"""
+
+    def __init__(self, window_size=3, token_budget=1500, agenda_chunks=1,
+                 agenda_tokens=300, decision_tokens=300, topic_tokens=100,
+                 max_decisions=10, max_topics=10, topic_decay=0.7,
+                 index=None, related_chunks=2, related_tokens=300):
+        self.window_size = window_size
+        self.token_budget = token_budget
+        self.agenda_chunks = agenda_chunks
+        self.agenda_tokens = agenda_tokens
+        self.decision_tokens = decision_tokens
+        self.topic_tokens = topic_tokens
+        self.max_topics = max_topics
+        self.topic_decay = topic_decay
+        self.index = index
+        self.related_chunks = related_chunks
+        self.related_tokens = related_tokens
+
+        self.agenda = ""
+        self.decisions = deque(maxlen=max_decisions)
+        self.topic_scores = {}
+        self.recent = deque(maxlen=window_size)
+        self.chunk_count = 0
+        self.first_time = None
+        self.last_time = None
+
+    def add_chunk(self, timestamp, text, chunk=None):
+        """新しいチャンクを取り込み、会議の状態を更新する（chunk はチャンク番号、省略時は取り込んだ件数）"""
+        self.chunk_count += 1
+        if self.index is not None:
+            self.index.add(chunk or self.chunk_count, timestamp, text)
+        if self.first_time is None:
+            self.first_time = timestamp
+        self.last_time = timestamp
+
+        # 最初のチャンクは議題の宣言とみなす
+        if self.chunk_count <= self.agenda_chunks:
+            agenda = f"{self.agenda}\n{text}".strip()
+            self.agenda = truncate_to_tokens(agenda, self.agenda_tokens)
+
+        self._update_decisions(text)
+        self._update_topics(text)
+        self.recent.append((timestamp, text))
+
+    def state(self):
+        """再開用に保存する状態（JSONに変換できる辞書。検索インデックスは含まない）"""
+        return {
+            "agenda": self.agenda,
+            "decisions": list(self.decisions),
+            "topic_scores": dict(self.topic_scores),
+            "recent": [list(item) for item in self.recent],
+            "chunk_count": self.chunk_count,
+            "first_time": self.first_time,
+            "last_time": self.last_time,
+        }
+
+    def restore(self, state):
+        """state() の内容を読み込む"""
+        self.agenda = state["agenda"]
+        self.decisions.clear()
+        self.decisions.extend(state["decisions"])
+        self.topic_scores = dict(state["topic_scores"])
+        self.recent.clear()
+        self.recent.extend(tuple(item) for item in state["recent"])
+        self.chunk_count = state["chunk_count"]
+        self.first_time = state["first_time"]
+        self.last_time = state["last_time"]
+
+    def _update_decisions(self, text):
+        """決定事項らしい文を抽出して追記する"""
+        for sentence in SENTENCE_SPLIT.split(text):
+            sentence = sentence.strip()
+            if sentence and DECISION_PATTERN.search(sentence) and sentence not in self.decisions:
+                self.decisions.append(sentence)
+
+    def _update_topics(self, text):
+        """話題語のスコアを減衰させつつ加算する"""
+        for word in list(self.topic_scores):
+            score = self.topic_scores[word] * self.topic_decay
+            if score < 0.5:
+                del self.topic_scores[word]
+            else:
+                self.topic_scores[word] = score
+
+        for word in TOPIC_PATTERN.findall(text):
+            if word in TOPIC_STOPWORDS:
+                continue
+            self.topic_scores[word] = self.topic_scores.get(word, 0.0) + 1.0
+
+        # スコア上位だけを残してメモリを一定に保つ
+        if len(self.topic_scores) > self.max_topics * 5:
+            top = sorted(self.topic_scores.items(), key=lambda kv: kv[1], reverse=True)
+            self.topic_scores = dict(top[:self.max_topics * 5])
+
+    def recent_topics(self):
+        """直近の主要な話題語を返す"""
+        top = sorted(self.topic_scores.items(), key=lambda kv: kv[1], reverse=True)
+        return [word for word, _ in top[:self.max_topics]]
+
+    def related_text(self):
+        """直近の発言に関連する、ウィンドウより前のチャンク（時系列順、related_tokens 以内）"""
+        if self.index is None or not self.recent or not self.related_chunks:
+            return ""
+        query = "\n".join(text for _, text in self.recent)
+        results = self.index.related(query, limit=self.related_chunks, exclude_recent=len(self.recent))
+        lines = [f"[{result['time']}] {result['text']}" for result in sorted(results, key=lambda r: r["chunk"])]
+        return truncate_to_tokens("\n".join(lines), self.related_tokens)
+
+    def render(self):
+        """トークン上限内に収まるプロンプト本文を生成する
+
+        プロンプトキャッシュが効くように、変わりにくい議題・決定事項を先に、
+        チャンクごとに変わる経過・話題・直近の発言を後に置く。
+        """
+        sections = ["【会議の状態】"]
+
+        if self.agenda:
+            sections.append(f"■議題（冒頭の発言）\n{self.agenda}")
+        if self.decisions:
+            decisions = "\n".join(f"- {d}" for d in self.decisions)
+            # 古い決定事項から削る
+            sections.append(f"■これまでの決定事項\n{truncate_to_tokens(decisions, self.decision_tokens, keep='tail')}")
+        sections.append(f"■経過\nチャンク{self.chunk_count}件目（{self.first_time}〜{self.last_time}）")
+        topics = self.recent_topics()
+        if topics:
+            sections.append(f"■最近の話題\n{truncate_to_tokens('、'.join(topics), self.topic_tokens)}")
+        related = self.related_text()
+        if related:
+            sections.append(f"■関連する過去の発言\n{related}")
+
+        state_text = "\n\n".join(sections)
+        remaining = self.token_budget - estimate_tokens(state_text) - 20
+
+        # 直近チャンクは新しいものから入れ、入りきらなければ古いものを捨てる
+        recent_items = []
+        for timestamp, text in reversed(self.recent):
+            item = f"[{timestamp}] {text}"
+            cost = estimate_tokens(item)
+            if cost <= remaining:
+                recent_items.append(item)
+                remaining -= cost
+            else:
+                if not recent_items:
+                    # 最新チャンクだけは末尾を残して必ず含める
+                    recent_items.append(truncate_to_tokens(item, remaining, keep="tail"))
+                break
+
+        recent_text = "\n".join(reversed(recent_items))
+        prompt = f"{state_text}\n\n【直近の発言】\n{recent_text}"
+        return truncate_to_tokens(prompt, self.token_budget, keep="tail")
@@ -0,0 +1,242 @@
+"""処理段階ごとの計測
+
+チャンクの受信・ハッシュ・前処理・文字起こし・ツッコミ生成・解析・要約・描画の処理時間を記録し、
+段階ごとのパーセンタイルにまとめる。トークン数・アップロード量・推定コストも合計する。
+
+- チャンクごとの記録は JSON Lines のファイルに追記できる（path を指定した場合）
+- Prometheus のテキスト形式で出力し、serve(port) で /metrics として公開できる
+
+プロセス内の全セッションで1つのインスタンスを共有する。
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 推定コストの単価（USD）。チャットは100万トークンあたりの (入力, キャッシュ済み入力, 出力)
+CHAT_PRICES = {"gpt-4o": (2.50, 1.25, 10.00)}
+WHISPER_PRICE_PER_MINUTE = 0.006
+
+# 出力するパーセンタイル
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def percentiles(values):
+    """p50 / p90 / p95 / p99 / max / mean（最近傍順位法）。値が無ければNone"""
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+
+    def rank(q):
+        return values[min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))]
+
+    result = {"count": len(values)}
+    for q in QUANTILES:
+        result[f"p{round(q * 100)}"] = rank(q)
+    result["max"] = values[-1]
+    result["mean"] = sum(values) / len(values)
+    return result
+
+
+def estimate_cost(prompt_tokens=0, completion_tokens=0, audio_seconds=0.0, model="gpt-4o", cached_tokens=0):
+    """API利用料の見積もり（USD）。cached_tokens は prompt_tokens のうちプロンプトキャッシュで割引された分"""
+    input_price, cached_price, output_price = CHAT_PRICES.get(model, CHAT_PRICES["gpt-4o"])
+    return (
+        (prompt_tokens - cached_tokens) * input_price / 1_000_000
+        + cached_tokens * cached_price / 1_000_000
+        + completion_tokens * output_price / 1_000_000
+        + audio_seconds / 60.0 * WHISPER_PRICE_PER_MINUTE
+    )
+
+
+class RollingLog:
+    """直近 maxlen 件の記録と、全件の数値項目の累計
+
+    会議中ずっと追記される呼び出しごとの記録（辞書）をセッションに置くためのもの。
+    len() は追記した全件数、イテレーションと添字は直近の分だけを返す。
+    totals は数値の項目ごとの合計（True/False は件数として数える）。
+    """
+
+    def __init__(self, maxlen=100):
+        self._items = deque(maxlen=maxlen)
+        self._count = 0
+        self._lock = threading.Lock()
+        self.totals = {}
+
+    def append(self, item):
+        with self._lock:
+            self._items.append(item)
+            self._count += 1
+            for key, value in item.items():
+                if isinstance(value, (int, float)):
+                    self.totals[key] = self.totals.get(key, 0) + value
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        # ワーカースレッドの追記と画面の読み出しが重なってもよいようにコピーを返す
+        with self._lock:
+            return iter(list(self._items))
+
+    def __getitem__(self, index):
+        with self._lock:
+            return self._items[index]
+
+
+class MetricsRecorder:
+    """段階ごとの処理時間とAPI利用量の集計"""
+
+    def __init__(self, window=1000, path=None):
+        self.window = window
+        self.path = path
+        self._lock = threading.Lock()
+        self._samples = {}     # 段階 -> 直近 window 件の処理時間（秒）
+        self._totals = {}      # 段階 -> [合計秒, 件数]（起動からの累計）
+        self._usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "upload_bytes": 0,
+                       "audio_seconds": 0.0}
+        self._chunks = deque(maxlen=window)
+        self._server = None
+
+    @contextmanager
+    def span(self, stage):
+        """with ブロックの処理時間を stage として記録する"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+                self._totals[stage] = [0.0, 0]
+            samples.append(seconds)
+            totals = self._totals[stage]
+            totals[0] += seconds
+            totals[1] += 1
+
+    def add_usage(self, prompt_tokens=0, completion_tokens=0, upload_bytes=0, audio_seconds=0.0, cached_tokens=0):
+        """API呼び出し1回分の利用量を累計に加える（audio_seconds は課金対象の音声の長さ）"""
+        with self._lock:
+            self._usage["prompt_tokens"] += prompt_tokens
+            self._usage["completion_tokens"] += completion_tokens
+            self._usage["cached_tokens"] += cached_tokens
+            self._usage["upload_bytes"] += upload_bytes
+            self._usage["audio_seconds"] += audio_seconds
+
+    def record_chunk(self, meeting, chunk, seconds, transcribe_seconds=None, comment_seconds=None, usage=None):
+        """完了したチャンクの処理時間と利用量を記録する（seconds は投入から完了までの時間）"""
+        usage = usage or {}
+        row = {
+            "time": time.time(),
+            "meeting": meeting,
+            "chunk": chunk,
+            "seconds": seconds,
+            "transcribe_seconds": transcribe_seconds,
+            "comment_seconds": comment_seconds,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "upload_bytes": usage.get("upload_bytes", 0),
+            "audio_seconds": usage.get("audio_seconds", 0.0),
+        }
+        row["cost_usd"] = estimate_cost(row["prompt_tokens"], row["completion_tokens"], row["audio_seconds"],
+                                        cached_tokens=row["cached_tokens"])
+        self.observe("chunk", seconds)
+        with self._lock:
+            self._chunks.append(row)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        return row
+
+    def percentiles(self):
+        """段階ごとのパーセンタイル（直近 window 件）"""
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+        return {stage: percentiles(values) for stage, values in samples.items()}
+
+    def chunks(self, meeting=None):
+        """直近のチャンクの記録（meeting を指定するとその会議の分だけ）"""
+        with self._lock:
+            return [row for row in self._chunks if meeting is None or row["meeting"] == meeting]
+
+    def usage(self):
+        """起動からの利用量の累計と推定コスト"""
+        with self._lock:
+            usage = dict(self._usage)
+        usage["cost_usd"] = estimate_cost(usage["prompt_tokens"], usage["completion_tokens"], usage["audio_seconds"],
+                                          cached_tokens=usage["cached_tokens"])
+        return usage
+
+    def prometheus_text(self):
+        """Prometheus のテキスト形式"""
+        stages = self.percentiles()
+        with self._lock:
+            totals = {stage: list(values) for stage, values in self._totals.items()}
+        usage = self.usage()
+
+        lines = [
+            "# HELP otokomae_stage_seconds Time spent in each processing stage.",
+            "# TYPE otokomae_stage_seconds summary",
+        ]
+        for stage, stats in sorted(stages.items()):
+            for q in QUANTILES:
+                lines.append(f'otokomae_stage_seconds{{stage="{stage}",quantile="{q}"}} {stats[f"p{round(q * 100)}"]:.6f}')
+            lines.append(f'otokomae_stage_seconds_sum{{stage="{stage}"}} {totals[stage][0]:.6f}')
+            lines.append(f'otokomae_stage_seconds_count{{stage="{stage}"}} {totals[stage][1]}')
+        lines += [
+            "# HELP otokomae_tokens_total Tokens sent to and received from the chat API.",
+            "# TYPE otokomae_tokens_total counter",
+            f'otokomae_tokens_total{{kind="prompt"}} {usage["prompt_tokens"]}',
+            f'otokomae_tokens_total{{kind="completion"}} {usage["completion_tokens"]}',
+            "# HELP otokomae_cached_tokens_total Prompt tokens served from the provider prompt cache.",
+            "# TYPE otokomae_cached_tokens_total counter",
+            f"otokomae_cached_tokens_total {usage['cached_tokens']}",
+            "# HELP otokomae_upload_bytes_total Audio bytes uploaded for transcription.",
+            "# TYPE otokomae_upload_bytes_total counter",
+            f"otokomae_upload_bytes_total {usage['upload_bytes']}",
+            "# HELP otokomae_audio_seconds_total Seconds of audio sent to the transcription API.",
+            "# TYPE otokomae_audio_seconds_total counter",
+            f"otokomae_audio_seconds_total {usage['audio_seconds']:.3f}",
+            "# HELP otokomae_cost_usd_total Estimated API cost in USD.",
+            "# TYPE otokomae_cost_usd_total counter",
+            f"otokomae_cost_usd_total {usage['cost_usd']:.6f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """別スレッドで /metrics を公開する（すでに公開中なら何もしない）"""
+        if self._server is not None:
+            return self._server
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = recorder.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        return self._server
@@ -0,0 +1,246 @@
+"""プロセス共有のOpenAIクライアント層
+
+同じサーバーで複数の会議が動いても429で取りこぼさないよう、全セッションで1つのクライアントを共有する。
+
+- HTTP接続プールを使い回す（httpxがあれば接続数とキープアライブを調整する）
+- リクエスト数/分・トークン数/分のトークンバケットで送信を絞る
+- 待ちが出たら優先度順に送る（文字起こし → ツッコミ → 要約）
+- 429・5xx・接続エラーはジッター付き指数バックオフで再試行し、Retry-After があればそれに従う
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from core.tokens import estimate_tokens
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# 優先度（小さいほど先に送る）
+PRIORITY_TRANSCRIBE = 0
+PRIORITY_TSUKKOMI = 1
+PRIORITY_SUMMARY = 2
+
+# max_tokens が無い場合に見込む応答トークン数
+DEFAULT_COMPLETION_TOKENS = 300
+# 再試行するHTTPステータス
+RETRY_STATUSES = {408, 409, 429}
+# ステータスを持たない再試行対象の例外（openaiを読み込まずに名前で判定する）
+RETRY_ERRORS = {"APIConnectionError", "APITimeoutError"}
+
+
+class RateLimiter:
+    """リクエスト数/分・トークン数/分のトークンバケット（優先度付きの待ち行列）
+
+    上限に None を渡した項目は制限しない。
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, clock=time.monotonic):
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._capacity = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self._level = dict(self._capacity)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        for name, capacity in self._capacity.items():
+            if capacity:
+                self._level[name] = min(capacity, self._level[name] + capacity * elapsed / 60.0)
+
+    def _shortfall(self, tokens):
+        """必要量が貯まるまでの秒数（0なら今すぐ送れる）"""
+        wait = 0.0
+        for name, amount in (("requests", 1), ("tokens", tokens)):
+            capacity = self._capacity[name]
+            if capacity and self._level[name] < amount:
+                wait = max(wait, (amount - self._level[name]) * 60.0 / capacity)
+        return wait
+
+    def acquire(self, tokens=0, priority=PRIORITY_TSUKKOMI):
+        """送信枠が空くまで待ち、消費したトークン数を返す"""
+        if self._capacity["tokens"]:
+            # 上限より大きい要求で永久に待たないようにする
+            tokens = min(tokens, self._capacity["tokens"])
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = self.clock()
+                    self._refill(now)
+                    wait = self._paused_until - now
+                    if self._waiters[0] == entry and wait <= 0:
+                        wait = self._shortfall(tokens)
+                        if wait <= 0:
+                            for name, amount in (("requests", 1), ("tokens", tokens)):
+                                if self._capacity[name]:
+                                    self._level[name] -= amount
+                            return tokens
+                    # 先頭でなければ先頭の送信（またはタイムアウト）で起こされる
+                    self._cond.wait(timeout=wait if wait > 0 else None)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def settle(self, estimated, actual):
+        """見積もりと実際のトークン数の差をバケットに戻す（超過分は借りとして差し引く）"""
+        if not self._capacity["tokens"] or actual is None:
+            return
+        with self._cond:
+            self._level["tokens"] = min(self._capacity["tokens"], self._level["tokens"] + estimated - actual)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """429を受けたときなど、全リクエストの送信を一時停止する"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+            self._cond.notify_all()
+
+    def queued(self):
+        """優先度ごとの待ち件数"""
+        with self._cond:
+            counts = {}
+            for priority, _ in self._waiters:
+                counts[priority] = counts.get(priority, 0) + 1
+            return counts
+
+
+def retry_after_seconds(error):
+    """例外のレスポンスヘッダから Retry-After を秒で取り出す（無ければNone）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    """再試行すれば通る可能性のあるエラーか"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    return type(error).__name__ in RETRY_ERRORS
+
+
+def make_http_client(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0, timeout=60.0):
+    """接続プールを調整したHTTPクライアント（httpxが無ければNoneでSDKの既定を使う）"""
+    if httpx is None:
+        return None
+    from openai import DefaultHttpxClient
+    return DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=httpx.Timeout(timeout, connect=5.0)
+    )
+
+
+class SharedOpenAIClient:
+    """レート制限と再試行を挟んでOpenAIを呼ぶ（全セッションで1つを共有する）"""
+
+    def __init__(self, client, limiter, max_retries=5, base_delay=1.0, max_delay=60.0, rng=None, sleep=time.sleep):
+        self.client = client
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _backoff(self, attempt):
+        """ジッター付き指数バックオフ（上限の半分〜上限の間で揺らす）"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * self.rng.uniform(0.5, 1.0)
+
+    def _call(self, request, tokens, priority):
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens, priority)
+            self._count("requests")
+            try:
+                return request()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    self._count("failed")
+                    raise
+                # 失敗したリクエストはトークンを消費していないので枠を戻す
+                self.limiter.settle(tokens, 0)
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                if getattr(e, "status_code", None) == 429:
+                    # 他のリクエストも同じ上限に当たるので、まとめて止める
+                    self._count("rate_limited")
+                    self.limiter.pause(delay)
+                self._count("retries")
+                logger.warning("OpenAI request failed (%s), retrying in %.1fs", e, delay)
+                self.sleep(delay)
+                attempt += 1
+
+    @staticmethod
+    def estimate_chat_tokens(messages, max_tokens=None):
+        """チャット補完で消費するトークン数の見積もり"""
+        return sum(estimate_tokens(m["content"]) for m in messages) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+    def chat_completion(self, priority=PRIORITY_TSUKKOMI, **kwargs):
+        """chat.completions.create（ストリーミングの場合は settle_usage で実績を反映する）"""
+        estimated = self.estimate_chat_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+        response = self._call(lambda: self.client.chat.completions.create(**kwargs), estimated, priority)
+        if not kwargs.get("stream"):
+            self.settle_usage(kwargs["messages"], getattr(response, "usage", None), kwargs.get("max_tokens"))
+        return response
+
+    def settle_usage(self, messages, usage, max_tokens=None):
+        """実際の使用トークン数をレート制限に反映する"""
+        if usage is not None:
+            self.limiter.settle(self.estimate_chat_tokens(messages, max_tokens), usage.total_tokens)
+
+    def transcription(self, priority=PRIORITY_TRANSCRIBE, **kwargs):
+        """audio.transcriptions.create（再試行時はファイルを先頭に戻して送り直す）"""
+        def request():
+            kwargs["file"].seek(0)
+            return self.client.audio.transcriptions.create(**kwargs)
+        return self._call(request, 0, priority)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats["queued"] = sum(self.limiter.queued().values())
+        return stats
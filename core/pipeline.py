@@ -0,0 +1,152 @@
+"""チャンク処理のバックグラウンドパイプライン
+
+録音チャンクごとにジョブを作り、文字起こしとツッコミ生成をワーカースレッドで実行する。
+文字起こしは並列に走らせるが、会議コンテキストへの反映とツッコミ生成は
+チャンク番号順に行うため、チャンクN+1の文字起こしとチャンクNのツッコミ生成が重なって進む。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ジョブの状態
+QUEUED = "queued"
+TRANSCRIBING = "transcribing"
+COMMENTING = "commenting"
+DONE = "done"
+FAILED = "failed"
+
+STATE_LABELS = {
+    QUEUED: "待機中",
+    TRANSCRIBING: "文字起こし中",
+    COMMENTING: "ツッコミ生成中",
+    DONE: "完了",
+    FAILED: "失敗",
+}
+
+
+class ChunkJob:
+    """1チャンク分の処理状態"""
+
+    def __init__(self, chunk, timestamp, audio_bytes, prompt_type):
+        self.chunk = chunk
+        self.timestamp = timestamp
+        self.audio_bytes = audio_bytes
+        self.prompt_type = prompt_type
+        self.state = QUEUED
+        self.transcript = None
+        self.tsukkomi = None
+        self.error = None          # (段階名, 例外)
+        self.transcribed = False
+        self.transcribe_seconds = None
+        self.comment_seconds = None
+        self.submitted_at = time.perf_counter()
+        # チャンクごとのAPI利用量（トークン数・アップロード量など）
+        self.usage = {}
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+
+class ChunkPipeline:
+    """セッションごとのチャンク処理キュー
+
+    transcribe_fn(audio_bytes, usage) は文字起こし結果を返す（usage はジョブの利用量の辞書で、書き込んでよい）。
+    on_transcript(job) は文字起こし完了時にチャンク順で呼ばれ、ツッコミ生成に渡す入力を返す。
+    comment_fn(context, prompt_type) はツッコミを返す（不要ならNone）。
+    """
+
+    def __init__(self, transcribe_fn, comment_fn, on_transcript=None, transcribe_workers=2):
+        self.transcribe_fn = transcribe_fn
+        self.comment_fn = comment_fn
+        self.on_transcript = on_transcript
+        self._transcribe_pool = ThreadPoolExecutor(max_workers=transcribe_workers, thread_name_prefix="transcribe")
+        # ツッコミは会議の流れに沿って1件ずつ生成する
+        self._comment_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tsukkomi")
+        self._lock = threading.Lock()
+        # on_transcript をチャンク順に1件ずつ呼ぶためのロック（_lock は持たずに呼ぶので、画面からの collect を待たせない）
+        self._dispatch_lock = threading.Lock()
+        self._jobs = []            # 未回収のジョブ（チャンク順）
+        self._dispatched = 0       # _jobs のうちツッコミ段階へ進めた件数
+
+    def submit(self, chunk, timestamp, audio_bytes, prompt_type):
+        """チャンクをキューに追加する"""
+        job = ChunkJob(chunk, timestamp, audio_bytes, prompt_type)
+        with self._lock:
+            self._jobs.append(job)
+        self._transcribe_pool.submit(self._run_transcribe, job)
+        return job
+
+    def _run_transcribe(self, job):
+        job.state = TRANSCRIBING
+        started = time.perf_counter()
+        try:
+            job.transcript = self.transcribe_fn(job.audio_bytes, job.usage)
+        except Exception as e:
+            job.error = ("transcribe", e)
+        job.transcribe_seconds = time.perf_counter() - started
+        # 音声データはもう使わないので解放する
+        job.audio_bytes = None
+        job.transcribed = True
+        self._dispatch_in_order()
+
+    def _next_to_dispatch(self):
+        """文字起こしが済んでいて、まだツッコミ段階へ進めていない先頭のジョブ（無ければNone）"""
+        with self._lock:
+            if self._dispatched < len(self._jobs) and self._jobs[self._dispatched].transcribed:
+                self._dispatched += 1
+                return self._jobs[self._dispatched - 1]
+        return None
+
+    def _dispatch_in_order(self):
+        """文字起こしが済んだ先頭からチャンク順にツッコミ段階へ進める"""
+        with self._dispatch_lock:
+            while True:
+                job = self._next_to_dispatch()
+                if job is None:
+                    return
+                self._dispatch(job)
+
+    def _dispatch(self, job):
+        """1件をツッコミ段階へ進める（_dispatch_lock 保持中に呼ぶ）"""
+        if job.error or not job.transcript:
+            job.state = FAILED if job.error else DONE
+            return
+
+        job.state = COMMENTING
+        try:
+            context = self.on_transcript(job) if self.on_transcript else job.transcript
+        except Exception as e:
+            job.error = ("transcribe", e)
+            job.state = FAILED
+            return
+        self._comment_pool.submit(self._run_comment, job, context)
+
+    def _run_comment(self, job, context):
+        started = time.perf_counter()
+        try:
+            job.tsukkomi = self.comment_fn(context, job.prompt_type)
+        except Exception as e:
+            job.error = ("comment", e)
+        job.comment_seconds = time.perf_counter() - started
+        job.state = FAILED if job.error else DONE
+
+    def collect(self):
+        """完了したジョブをチャンク順に取り出す（途中に未完了があればそこで止める）"""
+        finished = []
+        with self._lock:
+            while self._jobs and self._jobs[0].finished:
+                finished.append(self._jobs.pop(0))
+            self._dispatched -= len(finished)
+        return finished
+
+    def active_jobs(self):
+        """未回収のジョブ一覧"""
+        with self._lock:
+            return list(self._jobs)
+
+    def close(self):
+        """ワーカースレッドを停止する"""
+        self._transcribe_pool.shutdown(wait=False, cancel_futures=True)
+        self._comment_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,154 @@
+"""ツッコミ生成前のローカル判定
+
+最新チャンクをGPT-4oに送る価値があるかを、API呼び出し前に安価な指標で判定する。
+
+- 脱線度: 冒頭チャンク（議題）との文字bigram TF-IDFコサイン類似度の低さ
+- 堂々巡り度: 直近チャンクとの類似度の高さ
+- 前回のツッコミからの経過時間
+
+語ごとの出現チャンク数は max_terms 語までに抑え、超えたら出現の少ない語から捨てる。
+判定結果はすべて記録し、送らなかったチャンクの一部はあえてLLMにも送って（監査）、
+常に送る場合と比べた再現率を見積もれるようにする。
+"""
+
+import logging
+import math
+import random
+import re
+import time
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# キャラクターが呼ばれたら必ず送る
+CALL_PATTERN = re.compile(r"(OTOKO|オトコマエ|男前|おとこまえ|OTO♡?ME|オトメ|乙女|おとめ)", re.IGNORECASE)
+# bigramから除く文字（空白・句読点・記号）
+SKIP_CHARS = re.compile(r"[\s、。，．,.!?！？「」『』（）()\[\]【】・…ー〜~\-:：]")
+
+
+def char_bigrams(text):
+    """記号を除いた文字bigramの出現回数"""
+    chars = SKIP_CHARS.sub("", text)
+    return Counter(chars[i:i + 2] for i in range(len(chars) - 1))
+
+
+def cosine(a, b):
+    """疎ベクトル（dict）のコサイン類似度"""
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(value * b.get(key, 0.0) for key, value in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+class TsukkomiGate:
+    """最新チャンクをLLMに送るかどうかを判定する"""
+
+    def __init__(self, threshold=0.45, agenda_chunks=2, history=5,
+                 drift_weight=0.5, loop_weight=0.3, time_weight=0.4,
+                 comment_interval=300.0, audit_rate=0.1, max_log=500, max_terms=5000, rng=None):
+        self.threshold = threshold
+        self.agenda_chunks = agenda_chunks
+        self.drift_weight = drift_weight
+        self.loop_weight = loop_weight
+        self.time_weight = time_weight
+        self.comment_interval = comment_interval
+        self.audit_rate = audit_rate
+        self.max_terms = max_terms
+        self.rng = rng or random.Random()
+
+        self._doc_freq = Counter()
+        self._doc_count = 0
+        self._agenda = Counter()
+        self._recent = deque(maxlen=history)
+        self._last_spoken = None
+        self._started = None
+
+        self.log = deque(maxlen=max_log)
+        self.counts = Counter()
+
+    def _tfidf(self, counts):
+        # 平滑化IDF（全チャンクに出る語も重み0にならないよう +1 する）
+        return {
+            term: tf * (math.log((1 + self._doc_count) / (1 + self._doc_freq[term])) + 1.0)
+            for term, tf in counts.items()
+        }
+
+    def evaluate(self, text, chunk=None, now=None):
+        """チャンクを判定し、判定内容の辞書を返す（"send" がTrueならLLMに送る）"""
+        now = time.time() if now is None else now
+        if self._started is None:
+            self._started = now
+
+        bigrams = char_bigrams(text)
+        self._doc_count += 1
+        self._doc_freq.update(bigrams.keys())
+        if len(self._doc_freq) > self.max_terms:
+            # 半分まで減らして、剪定は語が max_terms / 2 種類増えるごとに1回にする（捨てた語は次に出たら数え直す）
+            self._doc_freq = Counter(dict(self._doc_freq.most_common(self.max_terms // 2)))
+        vector = self._tfidf(bigrams)
+
+        is_agenda = self._doc_count <= self.agenda_chunks
+        drift = 0.0 if is_agenda else 1.0 - cosine(vector, self._tfidf(self._agenda))
+        loop = max((cosine(vector, self._tfidf(previous)) for previous in self._recent), default=0.0)
+        elapsed = now - (self._last_spoken or self._started)
+        called = bool(CALL_PATTERN.search(text))
+
+        if is_agenda:
+            self._agenda.update(bigrams)
+        self._recent.append(bigrams)
+
+        score = (
+            self.drift_weight * drift
+            + self.loop_weight * loop
+            + self.time_weight * min(1.0, elapsed / self.comment_interval)
+        )
+        send = called or score >= self.threshold
+        # 送らない判定の一部は監査としてLLMにも送り、取りこぼしを見積もる
+        audit = not send and self.rng.random() < self.audit_rate
+
+        decision = {
+            "chunk": chunk,
+            "score": round(score, 3),
+            "drift": round(drift, 3),
+            "loop": round(loop, 3),
+            "elapsed": round(elapsed, 1),
+            "called": called,
+            "send": send,
+            "audit": audit,
+            "spoke": None,
+            "time": now,
+        }
+        self.log.append(decision)
+        self.counts["evaluated"] += 1
+        self.counts["sent" if send else "skipped"] += 1
+        if audit:
+            self.counts["audited"] += 1
+        logger.info("tsukkomi gate: %s", decision)
+        return decision
+
+    def record_result(self, decision, spoke):
+        """LLMに送った結果（キャラクターが発話したか）を記録する"""
+        decision["spoke"] = spoke
+        if spoke:
+            self._last_spoken = decision["time"]
+            self.counts["sent_spoke" if decision["send"] else "audited_spoke"] += 1
+
+    def stats(self):
+        """回避した呼び出し数と、常に送る場合と比べた推定再現率"""
+        counts = self.counts
+        sent_spoke = counts["sent_spoke"]
+        # 監査したチャンクでの発話率から、送らなかったチャンク全体での取りこぼしを推定
+        missed = 0.0
+        if counts["audited"]:
+            missed = counts["audited_spoke"] / counts["audited"] * counts["skipped"]
+        recall = sent_spoke / (sent_spoke + missed) if sent_spoke + missed else None
+        return {
+            "evaluated": counts["evaluated"],
+            "sent": counts["sent"],
+            "skipped": counts["skipped"],
+            "avoided": counts["skipped"] - counts["audited"],
+            "recall_estimate": recall,
+        }
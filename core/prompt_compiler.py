@@ -0,0 +1,162 @@
+"""プロンプトのコンパイル（実行時用のコンパクトな形への変換）
+
+prompts/*.txt は人が読み書きするための原稿で、`:fire:` のような絵文字ショートコード・
+見出しの飾り・折り返しの字下げ・整形されたJSON例などを含む。
+毎回システムメッセージとして送るので、意味を変えずに以下を取り除いた形を実行時に使う。
+
+- 行頭の飾りのショートコード（見出しの `:fire: 1.` など）を削除
+- 本文中のショートコードは Unicode の絵文字に置き換える（モデルの出力例としてそのまま使える形）
+- 1行に詰め込まれた例文の表（`:earth_africa: 脱線「…」:repeat: 堂々巡り「…」`）を1行1例に分ける
+- 字下げ1文字で折り返した行を前の行につなげる
+- 複数行のJSON例を1行に詰め、行末の空白と連続する空行をまとめる
+- 同じ文の繰り返しを削除する
+
+    python -m core.prompt_compiler            # 変換前後のバイト数・トークン数を表示
+    python -m core.prompt_compiler --show otokомae_prompt.txt
+"""
+
+import argparse
+import re
+import sys
+
+from core.tokens import estimate_tokens
+
+# OpenAIのプロンプトキャッシュは先頭1024トークン以上が一致した場合に効く
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# prompts/ で使っているショートコード
+SHORTCODES = {
+    "+1": "👍", "alarm_clock": "⏰", "blossom": "🌼", "blush": "😊", "brain": "🧠", "bubbles": "🫧",
+    "cherry_blossom": "🌸", "earth_africa": "🌍", "feet": "🐾", "fire": "🔥", "heartpulse": "💗",
+    "joy": "😂", "microphone": "🎤", "package": "📦", "rabbit": "🐰", "repeat": "🔁",
+    "revolving_hearts": "💞", "ribbon": "🎀", "sleeping": "😴", "soccer": "⚽", "sparkles": "✨",
+    "sparkling_heart": "💖", "strawberry": "🍓", "sweat_smile": "😅", "test_tube": "🧪", "tulip": "🌷",
+    "zzz": "💤",
+}
+
+SHORTCODE = re.compile(r":([a-z0-9_+\-]+):")
+# 行頭の飾り（ショートコードか絵文字1文字）
+LEADING_DECORATION = re.compile(r"^(?::[a-z0-9_+\-]+:|[\U0001F300-\U0001FAFF☀-➿])\s*")
+# 例文の表の行の区切り（ショートコード + 空白 + 見出し語 + 「）
+TABLE_ROW = re.compile(r"(?::[a-z0-9_+\-]+:|[\U0001F300-\U0001FAFF])\s+(?=[^\s「」:]{1,8}「)")
+SENTENCE_SPLIT = re.compile(r"(?<=。)")
+# 繰り返しとみなす文の最小文字数（短い定型句は残す）
+MIN_DEDUPE_CHARS = 12
+
+
+def _replace_shortcode(match):
+    return SHORTCODES.get(match.group(1), match.group(0))
+
+
+def _split_table_rows(line):
+    """1行に詰め込まれた例文の表を「- 見出し「例文」」の行に分ける"""
+    if len(TABLE_ROW.findall(line)) < 2:
+        return [line]
+    parts = TABLE_ROW.split(line)
+    head, rows = parts[0].strip(), [part.strip() for part in parts[1:] if part.strip()]
+    return ([head] if head else []) + [f"- {row}" for row in rows]
+
+
+def _join_json_blocks(lines):
+    """単独の { で始まり } で終わる複数行のブロックを1行に詰める"""
+    result = []
+    block = None
+    for line in lines:
+        if block is None and line.strip() == "{":
+            block = ["{"]
+            continue
+        if block is not None:
+            block.append(line.strip())
+            if line.strip() == "}":
+                result.append(re.sub(r"\s+", " ", " ".join(block)).replace("{ ", "{").replace(" }", "}"))
+                block = None
+            continue
+        result.append(line)
+    if block is not None:
+        result.extend(block)
+    return result
+
+
+def _dedupe_sentences(lines):
+    """すでに出てきた文（句点まで）を削除する"""
+    seen = set()
+    result = []
+    for line in lines:
+        kept = []
+        for sentence in SENTENCE_SPLIT.split(line):
+            key = sentence.strip().lstrip("-・ ")
+            if len(key) >= MIN_DEDUPE_CHARS and key in seen:
+                continue
+            seen.add(key)
+            kept.append(sentence)
+        text = "".join(kept)
+        # 繰り返しだけでできていた行は箇条書きの記号ごと消す
+        if line.strip() and not text.strip(" -・　"):
+            continue
+        result.append(text)
+    return result
+
+
+def compile_prompt(source):
+    """原稿のプロンプトを実行時用のコンパクトな形に変換する"""
+    lines = []
+    for raw in source.replace("\r\n", "\n").split("\n"):
+        line = raw.rstrip()
+        # 字下げ1文字の行は前の行の折り返し
+        if lines and lines[-1] and re.match(r"^ \S", line):
+            lines[-1] += line[1:]
+            continue
+        lines.append(line)
+
+    compiled = []
+    for line in lines:
+        line = LEADING_DECORATION.sub("", line)
+        for row in _split_table_rows(line):
+            compiled.append(SHORTCODE.sub(_replace_shortcode, row).rstrip())
+
+    compiled = _dedupe_sentences(_join_json_blocks(compiled))
+    text = "\n".join(compiled)
+    # 連続する空行は1つにまとめる
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip() + "\n"
+
+
+def prompt_stats(name, source, compiled):
+    """変換前後のバイト数・トークン数"""
+    source_tokens = estimate_tokens(source)
+    compiled_tokens = estimate_tokens(compiled)
+    return {
+        "name": name,
+        "source_bytes": len(source.encode("utf-8")),
+        "compiled_bytes": len(compiled.encode("utf-8")),
+        "source_tokens": source_tokens,
+        "compiled_tokens": compiled_tokens,
+        "saved_tokens": source_tokens - compiled_tokens,
+        # これより短いとプロンプトキャッシュの対象にならない（ユーザーメッセージの先頭も一致すれば届く場合がある）
+        "cacheable": compiled_tokens >= PROMPT_CACHE_MIN_TOKENS,
+    }
+
+
+def main(argv=None):
+    from core.prompts import PromptRegistry
+
+    parser = argparse.ArgumentParser(description="prompts/*.txt を実行時の形に変換し、サイズを比較する")
+    parser.add_argument("--directory", default="prompts", help="プロンプトのディレクトリ（既定: prompts）")
+    parser.add_argument("--show", metavar="NAME", help="変換後の本文を表示するファイル名")
+    args = parser.parse_args(argv)
+
+    registry = PromptRegistry(args.directory)
+    if args.show:
+        sys.stdout.write(registry.get(args.show))
+        return 0
+
+    print(f"{'prompt':<28} {'bytes':>15} {'tokens':>13} {'saved':>6}  cache")
+    for stats in registry.stats():
+        print(f"{stats['name']:<28} {stats['source_bytes']:>6} -> {stats['compiled_bytes']:>5} "
+              f"{stats['source_tokens']:>5} -> {stats['compiled_tokens']:>4} {stats['saved_tokens']:>6}  "
+              f"{'yes' if stats['cacheable'] else 'no'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
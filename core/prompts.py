@@ -0,0 +1,60 @@
+"""プロンプトファイルのレジストリ
+
+prompts/*.txt を起動時に一度だけ読み込み、実行時用の形にコンパイルしてメモリに保持する
+（core/prompt_compiler.py）。取得時にファイルの更新時刻だけを確認し、変更されていれば読み直す。
+"""
+
+import glob
+import os
+import threading
+
+from core.prompt_compiler import compile_prompt, prompt_stats
+
+
+class PromptRegistry:
+    """プロンプトファイルのキャッシュ（更新時刻で無効化）
+
+    compiled=False にすると原稿をそのまま返す。
+    """
+
+    def __init__(self, directory="prompts", compiled=True):
+        self.directory = directory
+        self.compiled = compiled
+        self._lock = threading.Lock()
+        self._entries = {}  # ファイル名 -> (更新時刻, 原稿, コンパイル後)
+        for path in glob.glob(os.path.join(directory, "*.txt")):
+            self._load(os.path.basename(path))
+
+    def _load(self, filename):
+        path = os.path.join(self.directory, filename)
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+        entry = (mtime, source, compile_prompt(source))
+        with self._lock:
+            self._entries[filename] = entry
+        return entry
+
+    def _entry(self, filename):
+        mtime = os.stat(os.path.join(self.directory, filename)).st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(filename)
+        if entry is not None and entry[0] == mtime:
+            return entry
+        return self._load(filename)
+
+    def get(self, filename):
+        """プロンプト本文を返す（ファイルが無ければFileNotFoundError）"""
+        entry = self._entry(filename)
+        return entry[2] if self.compiled else entry[1]
+
+    def stats(self):
+        """ファイルごとのコンパイル前後のバイト数・トークン数"""
+        return [
+            prompt_stats(name, *self._entry(name)[1:])
+            for name in self.names()
+        ]
+
+    def names(self):
+        with self._lock:
+            return sorted(self._entries)
@@ -0,0 +1,77 @@
+"""チャンク長の自動調整
+
+チャンクの先頭で話した内容にツッコミが返るまでの遅延は「チャンク長 + 処理時間」になる。
+処理時間（録音が届いてからツッコミが出るまで）の移動平均と処理待ちの件数を見て、
+この遅延が目標に近づくようにチャンク長を決める。
+
+- 目標の遅延から処理時間を引いた長さを基本にする（速いときは文脈を長く取り、遅いときは短く切る）
+- 処理時間がチャンク長に迫ると処理待ちが積み上がるので、処理時間 / max_utilization を下限にする
+- 実際に処理待ちが溜まっているときは、さらに長くして1件あたりの呼び出し回数を減らす
+"""
+
+import time
+
+
+class ChunkScheduler:
+    """処理時間からチャンク長を決める"""
+
+    def __init__(self, min_seconds=30, max_seconds=180, target_delay=90.0, smoothing=0.3,
+                 max_utilization=0.8, max_step=15, rounding=5):
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.target_delay = target_delay
+        self.smoothing = smoothing
+        self.max_utilization = max_utilization
+        self.max_step = max_step
+        self.rounding = rounding
+
+        self.chunk_seconds = min_seconds
+        self.latency = None        # 処理時間の指数移動平均（秒）
+        self.last_latency = None
+        self.backlog = 0
+        self._submitted = {}       # チャンク番号 -> 投入時刻
+
+    def submitted(self, chunk, now=None):
+        """チャンクをパイプラインに投入した時刻を記録する"""
+        self._submitted[chunk] = time.monotonic() if now is None else now
+
+    def finished(self, chunk, backlog=0, now=None):
+        """チャンクの処理完了を記録し、チャンク長を更新する（backlog は未完了のチャンク数）"""
+        started = self._submitted.pop(chunk, None)
+        self.backlog = backlog
+        if started is not None:
+            latency = (time.monotonic() if now is None else now) - started
+            self.last_latency = latency
+            self.latency = latency if self.latency is None else (
+                self.smoothing * latency + (1 - self.smoothing) * self.latency
+            )
+        self._update()
+        return self.chunk_seconds
+
+    def set_bounds(self, min_seconds, max_seconds, target_delay=None):
+        """サイドバーの設定を反映する"""
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        if target_delay is not None:
+            self.target_delay = target_delay
+        self.chunk_seconds = min(max(self.chunk_seconds, min_seconds), max_seconds)
+
+    def _update(self):
+        if self.latency is None:
+            return
+        desired = self.target_delay - self.latency
+        # 処理が追いつく長さより短くはしない
+        desired = max(desired, self.latency / self.max_utilization)
+        if self.backlog > 1:
+            desired = max(desired, self.chunk_seconds + self.max_step)
+
+        # 急に変えると会議の途中で区切りが大きく揺れるので、1回の変化量を抑える
+        step = max(-self.max_step, min(self.max_step, desired - self.chunk_seconds))
+        seconds = round((self.chunk_seconds + step) / self.rounding) * self.rounding
+        self.chunk_seconds = int(min(max(seconds, self.min_seconds), self.max_seconds))
+
+    def expected_delay(self):
+        """チャンク先頭の発話からツッコミまでの見込み遅延（秒）"""
+        if self.latency is None:
+            return None
+        return self.chunk_seconds + self.latency
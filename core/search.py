@@ -0,0 +1,227 @@
+"""会議の文字起こしの全文検索（文字n-gramの転置インデックス）
+
+日本語は単語の区切りが無いので、形態素解析の代わりに文字bigramで索引を作る。
+チャンクが届くたびに add() で差分更新し、再構築はしない。
+
+- 正規化は NFKC と大文字小文字の同一視（全角英数・半角カナの揺れを吸収）
+- bigram は句読点・空白をまたがない（文字種の連続区間ごとに作る）
+- ポスティングリストはチャンクの通し番号の差分を可変長バイト列で保持し、長時間の会議でもメモリを抑える
+- メモリに持つのはポスティングリストとチャンク番号だけで、本文はヒットしたチャンクの分だけ
+  fetch(チャンク番号のリスト) で会議ジャーナルから読み出す
+- search() は語句の完全一致（bigramで候補を絞ってから本文で確認）、
+  related() は任意のテキストに関連する過去のチャンクを idf 重み付きの bigram の重なりで探す
+"""
+
+import base64
+import math
+import re
+import threading
+import unicodedata
+from array import array
+
+from core.tokens import estimate_tokens
+
+# 索引の対象にする文字の連続区間（句読点・記号・空白で区切る）
+WORD_RUN = re.compile(r"[0-9a-zぁ-ゖァ-ヺー一-龥々〆ヶ]+")
+# これより多くのチャンクに出てくる bigram は関連度の計算に使わない（「です」「して」など）
+COMMON_GRAM_RATIO = 0.3
+
+
+def normalize(text):
+    """検索用の正規化（NFKC + 小文字化）"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def ngrams(text, n=2):
+    """正規化済みテキストの文字n-gram（区間が n より短ければ区間そのもの）"""
+    grams = []
+    for run in WORD_RUN.findall(text):
+        if len(run) < n:
+            grams.append(run)
+        else:
+            grams.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return grams
+
+
+def _encode(value, out):
+    """非負整数を可変長バイト列（7ビットずつ、最上位ビットが継続フラグ）で追記する"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode(data):
+    """_encode で追記した差分列から通し番号を順に返す"""
+    doc = value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        doc += value
+        yield doc
+        value = shift = 0
+
+
+class TranscriptIndex:
+    """チャンク単位の文字n-gram転置インデックス
+
+    add() はパイプラインのワーカースレッドから、search() は画面の再実行から呼ばれる。
+    fetch(チャンク番号のリスト) は {チャンク番号: (時刻, 本文)} を返す関数（アプリでは会議ジャーナル）。
+    省略した場合はバッチ処理などのために本文を索引の中に持つ。
+    """
+
+    def __init__(self, n=2, fetch=None):
+        self.n = n
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        self._chunks = array("I")   # 通し番号 -> チャンク番号
+        self._postings = {}         # n-gram -> [最後の通し番号, 件数, 差分の可変長バイト列]
+        self._texts = None if fetch else {}
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def add(self, chunk, time, text):
+        """チャンクを1件索引に加える"""
+        grams = set(ngrams(normalize(text), self.n))
+        with self._lock:
+            doc = len(self._chunks)
+            self._chunks.append(chunk)
+            if self._texts is not None:
+                self._texts[chunk] = (time, text)
+            for gram in grams:
+                posting = self._postings.get(gram)
+                if posting is None:
+                    posting = self._postings[gram] = [0, 0, bytearray()]
+                # 最初の1件は通し番号そのもの、以降は前の番号との差分
+                _encode(doc - posting[0] if posting[1] else doc, posting[2])
+                posting[0] = doc
+                posting[1] += 1
+
+    def state(self):
+        """再開用に保存する状態（JSONに変換できる辞書。ポスティングリストは base64）"""
+        with self._lock:
+            return {
+                "chunks": self._chunks.tolist(),
+                "postings": {
+                    gram: [last, count, base64.b64encode(data).decode("ascii")]
+                    for gram, (last, count, data) in self._postings.items()
+                },
+                "texts": None if self._texts is None else [[chunk, *item] for chunk, item in self._texts.items()],
+            }
+
+    def restore(self, state):
+        """state() の内容で索引を置き換える"""
+        with self._lock:
+            self._chunks = array("I", state["chunks"])
+            self._postings = {
+                gram: [last, count, bytearray(base64.b64decode(data))]
+                for gram, (last, count, data) in state["postings"].items()
+            }
+            if self._texts is not None:
+                self._texts = {chunk: (time, text) for chunk, time, text in state["texts"] or []}
+
+    def _docs_with(self, gram):
+        posting = self._postings.get(gram)
+        return set(_decode(posting[2])) if posting else set()
+
+    def _fetch(self, chunks):
+        """チャンク番号から {チャンク番号: (時刻, 本文)} を得る（まだ記録されていないチャンクは含まれない）"""
+        if self._texts is not None:
+            with self._lock:
+                return {chunk: self._texts[chunk] for chunk in chunks if chunk in self._texts}
+        return self.fetch(list(chunks))
+
+    def search(self, query, limit=20, batch_size=100):
+        """空白区切りの語句をすべて含むチャンクを新しい順に limit 件返す（score は語句の出現回数）
+
+        候補は新しいものから batch_size 件ずつ本文を読んで確認し、limit 件見つかったら打ち切る。
+        """
+        terms = [normalize(term) for term in query.split() if term.strip()]
+        if not terms:
+            return []
+
+        with self._lock:
+            candidates = None
+            for term in terms:
+                grams = ngrams(term, self.n)
+                if not grams or any(len(gram) < self.n for gram in grams):
+                    # 1文字の語は索引を引けないので、他の語で絞り込んだ候補（無ければ全件）を本文で確認する
+                    continue
+                for gram in set(grams):
+                    docs = self._docs_with(gram)
+                    candidates = docs if candidates is None else candidates & docs
+                    if not candidates:
+                        return []
+            if candidates is None:
+                candidates = range(len(self._chunks))
+            chunks = [self._chunks[doc] for doc in sorted(candidates, reverse=True)]
+
+        results = []
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            texts = self._fetch(batch)
+            for chunk in batch:
+                if chunk not in texts:
+                    continue
+                time, text = texts[chunk]
+                normalized = normalize(text)
+                counts = [normalized.count(term) for term in terms]
+                if all(counts):
+                    results.append({"chunk": chunk, "time": time, "text": text, "score": sum(counts)})
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def related(self, text, limit=3, exclude_recent=0, min_score=2.0):
+        """text に関連する過去のチャンクを関連度の高い順に返す（直近 exclude_recent 件は除く）
+
+        チャンクの関連度は、共通する bigram の idf（log(全件数 / 出現チャンク数)）の合計。
+        """
+        with self._lock:
+            count = len(self._chunks)
+            total = count - exclude_recent
+            if total <= 0:
+                return []
+            scores = {}
+            for gram in set(ngrams(normalize(text), self.n)):
+                posting = self._postings.get(gram)
+                if posting is None or posting[1] > max(1, COMMON_GRAM_RATIO * count):
+                    continue
+                weight = math.log(count / posting[1])
+                for doc in _decode(posting[2]):
+                    if doc >= total:
+                        break
+                    scores[doc] = scores.get(doc, 0.0) + weight
+            ranked = sorted(
+                ((score, self._chunks[doc]) for doc, score in scores.items() if score >= min_score),
+                reverse=True
+            )[:limit]
+
+        texts = self._fetch(chunk for _, chunk in ranked)
+        return [
+            {"chunk": chunk, "time": texts[chunk][0], "text": texts[chunk][1], "score": round(score, 3)}
+            for score, chunk in ranked
+            if chunk in texts
+        ]
+
+    def context(self, query, max_tokens=2000, limit=50):
+        """query に関連するチャンクを時系列順に「[時刻] 本文」で並べる（プロンプト用、トークン上限内）
+
+        語句の完全一致を優先し、足りなければ関連度の高いチャンクで埋める。
+        """
+        results = self.search(query, limit=limit)
+        seen = {result["chunk"] for result in results}
+        results += [result for result in self.related(query, limit=limit) if result["chunk"] not in seen]
+
+        lines, used = [], 0
+        for result in results:
+            line = f"[{result['time']}] {result['text']}"
+            cost = estimate_tokens(line)
+            if used + cost > max_tokens:
+                break
+            lines.append((result["chunk"], line))
+            used += cost
+        return "\n".join(line for _, line in sorted(lines))
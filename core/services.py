@@ -0,0 +1,361 @@
+"""文字起こし・ツッコミ・要約の生成処理（Streamlit非依存）
+
+Streamlitアプリとバッチ処理（batch.py）の両方から使う。
+エラーは例外として呼び出し側に返し、表示は呼び出し側で行う。
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.asr import make_backend
+from core.cache import make_key
+from core.metrics import MetricsRecorder
+from core.openai_client import (
+    PRIORITY_SUMMARY, PRIORITY_TSUKKOMI, RateLimiter, SharedOpenAIClient, make_http_client
+)
+from core.pipeline import ChunkPipeline
+from core.tokens import estimate_tokens
+
+# should_speak=false が確定したら、残りの応答は使わないので受信を打ち切る
+SHOULD_SPEAK_FALSE = re.compile(r'"should_speak"\s*:\s*false')
+
+
+def create_openai_client(requests_per_minute=None, tokens_per_minute=None):
+    """レート制限・再試行付きのOpenAIクライアントを作る（上限を省略すると環境変数から読む）"""
+    from openai import OpenAI
+    # 再試行はSharedOpenAIClient側で優先度とレート制限を考慮して行う
+    openai_client = OpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        http_client=make_http_client(),
+        max_retries=0
+    )
+    limiter = RateLimiter(
+        requests_per_minute=requests_per_minute or int(os.environ.get("OPENAI_RPM_LIMIT", "500")),
+        tokens_per_minute=tokens_per_minute or int(os.environ.get("OPENAI_TPM_LIMIT", "30000"))
+    )
+    return SharedOpenAIClient(openai_client, limiter)
+
+
+def create_asr_backend(client):
+    """環境変数 OTOKOMAE_ASR_BACKEND（remote / local / auto）に応じたASRバックエンドを作る"""
+    return make_backend(
+        os.environ.get("OTOKOMAE_ASR_BACKEND", "remote"),
+        client,
+        local_model=os.environ.get("OTOKOMAE_LOCAL_ASR_MODEL", "small"),
+        timeout=float(os.environ.get("OTOKOMAE_ASR_TIMEOUT", "30"))
+    )
+
+
+class MeetingServices:
+    """API呼び出しをまとめた文字起こし・ツッコミ・要約の生成器"""
+
+    def __init__(self, client, result_cache, prompts, asr_backend, metrics=None):
+        self.client = client
+        self.result_cache = result_cache
+        self.prompts = prompts
+        self.asr_backend = asr_backend
+        self.metrics = metrics or MetricsRecorder()
+
+    # キャッシュ付きチャット補完（ワーカースレッドからも呼ばれる）
+    def chat_completion(self, messages, temperature, model="gpt-4o", token_log=None,
+                        on_delta=None, abort_pattern=None, abort_result=None, priority=PRIORITY_TSUKKOMI,
+                        prompt_cache_key=None):
+        """同じプロンプト・入力の結果はキャッシュから返す
+
+        on_delta か abort_pattern を指定するとストリーミングで受信する。
+        on_delta(受信済みテキスト) は受信のたびに呼ばれる。
+        受信済みテキストが abort_pattern に一致した時点でストリームを打ち切り、abort_result を結果とする。
+        priority はレート制限で待ちが出たときの送信順（小さいほど先）。
+        prompt_cache_key は同じ先頭部分を持つリクエストを同じプロンプトキャッシュに振り分けるためのキー。
+        """
+        cache_key = make_key("chat", model, temperature, *(m["content"] for m in messages))
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            if token_log is not None:
+                token_log.append({"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cached": True})
+            if on_delta is not None:
+                on_delta(cached)
+            return cached
+
+        started = time.perf_counter()
+        entry = {"cached": False, "aborted": False, "ttft": None}
+        options = {"prompt_cache_key": prompt_cache_key} if prompt_cache_key else {}
+        if on_delta is None and abort_pattern is None:
+            response = self.client.chat_completion(
+                priority,
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                **options
+            )
+            usage = getattr(response, "usage", None)
+            content = response.choices[0].message.content
+        else:
+            content, usage = self._stream_chat_completion(messages, temperature, model, on_delta, abort_pattern,
+                                                          started, entry, priority, options)
+            if entry["aborted"]:
+                content = abort_result
+
+        # 送信トークン数を記録（usageが無い場合は見積もり値）
+        entry["prompt_tokens"] = usage.prompt_tokens if usage else sum(estimate_tokens(m["content"]) for m in messages)
+        entry["completion_tokens"] = usage.completion_tokens if usage else estimate_tokens(entry.get("received", content))
+        # プロンプトキャッシュで割引された入力トークン数（prompt_tokens の内数）
+        details = getattr(usage, "prompt_tokens_details", None)
+        entry["cached_tokens"] = getattr(details, "cached_tokens", None) or 0
+        self.metrics.add_usage(prompt_tokens=entry["prompt_tokens"], completion_tokens=entry["completion_tokens"],
+                               cached_tokens=entry["cached_tokens"])
+        if token_log is not None:
+            if entry["aborted"]:
+                # 打ち切らなかった場合に生成されていたはずの量を、過去の完走した応答の平均から見積もる
+                completed = [item["completion_tokens"] for item in token_log if not item.get("cached") and not item.get("aborted")]
+                expected = sum(completed) / len(completed) if completed else 150
+                entry["tokens_saved"] = max(0, round(expected - entry["completion_tokens"]))
+            entry.pop("received", None)
+            token_log.append(entry)
+
+        if content is not None:
+            self.result_cache.set(cache_key, content)
+        return content
+
+    def _stream_chat_completion(self, messages, temperature, model, on_delta, abort_pattern, started, entry, priority,
+                                options):
+        """ストリーミングで受信し、(テキスト, usage) を返す。最初のトークンまでの時間と打ち切りを entry に記録"""
+        stream = self.client.chat_completion(
+            priority,
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            **options
+        )
+
+        text = ""
+        usage = None
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if entry["ttft"] is None:
+                    entry["ttft"] = time.perf_counter() - started
+                text += delta
+                if on_delta is not None:
+                    on_delta(text)
+                if abort_pattern is not None and abort_pattern.search(text):
+                    entry["aborted"] = True
+                    break
+        finally:
+            # 打ち切った場合はここで接続を閉じて残りの生成を止める
+            stream.close()
+
+        self.client.settle_usage(messages, usage)
+        entry["received"] = text
+        return text, usage
+
+    # 音声を文字起こし
+    def transcribe_audio(self, audio_bytes, max_workers=4, stats_log=None):
+        """音声バイトデータを文字起こし（16kHzモノラルに圧縮し、上限を超える録音は分割して並列処理）"""
+        # 同じ録音の文字起こし結果はキャッシュから返す
+        with self.metrics.span("hash"):
+            audio_hash = hashlib.md5(audio_bytes).hexdigest()
+        # キャッシュは実際に文字起こししたエンジンごとに持ち、優先して使うエンジンの結果から探す
+        engines = self.asr_backend.engines()
+        for engine in engines:
+            cached = self.result_cache.get(make_key("transcribe", audio_hash, engine.engine, "ja"))
+            if cached is not None:
+                return cached
+
+        text, engine = self._transcribe_uncached(audio_bytes, max_workers, stats_log)
+        self.result_cache.set(make_key("transcribe", audio_hash, (engine or engines[0]).engine, "ja"), text)
+        return text
+
+    def _transcribe_uncached(self, audio_bytes, max_workers, stats_log):
+        """前処理・分割して文字起こしし、(テキスト, 文字起こししたバックエンド) を返す
+
+        区間ごとに別のバックエンドが使われた場合は、優先順位の低い方を返す。
+        前処理の統計には、課金対象の音声の秒数 billed_seconds を書き込む。
+        """
+        # NumPyを使う前処理モジュールは初回の文字起こしまで読み込まない
+        from core.audio import format_offset, preprocess_audio
+
+        # ローカルで文字起こしする場合は圧縮しない
+        uploads, stats = preprocess_audio(audio_bytes, compress=self.asr_backend.compressed_upload)
+        self.metrics.observe("preprocess", stats["seconds"])
+        if stats_log is not None:
+            stats_log.append(stats)
+
+        stats["billed_seconds"] = 0.0
+        # 発話が無いチャンクはAPIを呼ばない
+        if not uploads:
+            return "", None
+
+        with self.metrics.span("transcribe"):
+            if len(uploads) == 1:
+                _, data, filename = uploads[0]
+                results = [self.asr_backend.transcribe_with_engine(data, filename)]
+            else:
+                # 区間ごとに並列で文字起こしし、開始位置付きで順番に結合
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(uploads))) as executor:
+                    results = list(executor.map(
+                        lambda upload: self.asr_backend.transcribe_with_engine(upload[1], upload[2]), uploads
+                    ))
+
+        # 課金されるのは Whisper API で文字起こしした区間の分だけ（区間の長さは発話の秒数を等分して見積もる）
+        billed = sum(1 for _, engine in results if engine.billed)
+        stats["billed_seconds"] = (stats["speech_seconds"] or 0.0) * billed / len(uploads)
+        self.metrics.add_usage(upload_bytes=stats["bytes_out"], audio_seconds=stats["billed_seconds"])
+
+        engines = self.asr_backend.engines()
+        engine = max((engine for _, engine in results), key=engines.index)
+        if len(uploads) == 1:
+            return results[0][0], engine
+        text = "\n".join(
+            f"{format_offset(offset)} {text}"
+            for (offset, _, _), (text, _) in zip(uploads, results)
+            if text
+        )
+        return text, engine
+
+    # ツッコミ生成
+    def generate_tsukkomi(self, transcript_text, prompt_type="otokomae", token_log=None):
+        """会議コンテキスト（MeetingContext.renderの出力）からツッコミを生成"""
+        # プロンプト選択
+        prompt_file = "otokомae_prompt.txt" if prompt_type == "otokomae" else "tsukkomi_prompt.txt"
+        system_prompt = self.prompts.get(prompt_file)
+
+        # 毎回同じシステムプロンプトを先頭に置き、変わる部分はユーザーメッセージの末尾に寄せる
+        # （先頭が一致する限りプロバイダのプロンプトキャッシュで入力トークンが割引される）
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"会議テキスト:\n{transcript_text}"}
+        ]
+
+        # GPT-4でツッコミ生成
+        with self.metrics.span("tsukkomi"):
+            response_text = self.chat_completion(
+                messages,
+                temperature=0.8,
+                token_log=token_log,
+                abort_pattern=SHOULD_SPEAK_FALSE,
+                abort_result='{"should_speak": false}',
+                priority=PRIORITY_TSUKKOMI,
+                prompt_cache_key=f"otokomae-{prompt_type}"
+            )
+
+        with self.metrics.span("parse"):
+            return self._parse_tsukkomi(response_text)
+
+    @staticmethod
+    def _parse_tsukkomi(response_text):
+        """応答のJSONからツッコミを取り出す（不要ならNone）"""
+        # JSONをパースして整形
+        try:
+            # JSONブロックを抽出（```json...```の形式に対応）
+            json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
+            if json_match:
+                json_str = json_match.group(1)
+            else:
+                # 生のJSONの場合
+                json_str = response_text
+
+            data = json.loads(json_str)
+
+            # should_speakがfalseの場合
+            if not data.get("should_speak", True):
+                return None
+
+            # replyの内容を整形して返す
+            reply = data.get("reply", {})
+            tsukkomi = reply.get("tsukkomi", "")
+
+            # ツッコミがある場合のみ返す
+            if tsukkomi:
+                return tsukkomi
+            else:
+                return None
+
+        except (json.JSONDecodeError, KeyError, AttributeError):
+            # JSONパースに失敗した場合は生のテキストを返す
+            return response_text
+
+    # 部分要約生成
+    def generate_partial_summary(self, segment_text):
+        """文字起こしの一区間から部分要約を生成"""
+        partial_prompt = self.prompts.get("partial_summary_prompt.txt")
+
+        return self.chat_completion([
+            {"role": "system", "content": partial_prompt},
+            {"role": "user", "content": segment_text}
+        ], temperature=0.3, priority=PRIORITY_SUMMARY, prompt_cache_key="otokomae-partial-summary")
+
+    # 要約生成
+    def generate_summary(self, transcript_text, on_delta=None, token_log=None, focus=None):
+        """文字起こしテキストから要約を生成（on_deltaを渡すと受信途中のテキストで呼ばれる）
+
+        focus を渡すと、その話題についての要約にする。transcript_text には
+        TranscriptIndex.context(focus) で検索した関連チャンクだけを渡せばよい。
+        """
+        summary_prompt = self.prompts.get("summary_prompt.txt")
+        if focus:
+            # システムプロンプトは共通のまま、話題の指定はユーザーメッセージ側に置く
+            transcript_text = f"「{focus}」に関する発言だけを抜き出したものです。この話題について要約してください。\n\n{transcript_text}"
+
+        # GPT-4で要約生成
+        with self.metrics.span("summary"):
+            return self.chat_completion([
+                {"role": "system", "content": summary_prompt},
+                {"role": "user", "content": transcript_text}
+            ], temperature=0.3, token_log=token_log, on_delta=on_delta, priority=PRIORITY_SUMMARY,
+                prompt_cache_key="otokomae-summary")
+
+    # チャンク処理パイプライン作成
+    def create_pipeline(self, meeting_context, summarizer, gate, token_log, audio_log, checkpoint=None):
+        """会議コンテキスト・要約器・ツッコミ判定と連携するチャンク処理パイプラインを作成
+
+        checkpoint(チャンク番号) は会議コンテキストと要約器にチャンクを取り込んだ直後に、チャンク順で呼ばれる。
+        """
+        def on_transcript(job):
+            # チャンク順に呼ばれるので、ここで会議コンテキストを更新してツッコミ入力を確定する
+            meeting_context.add_chunk(job.timestamp, job.transcript, chunk=job.chunk)
+            summarizer.add_chunk(f"[{job.timestamp}] {job.transcript}")
+            if checkpoint is not None:
+                checkpoint(job.chunk)
+            decision = gate.evaluate(job.transcript, chunk=job.chunk)
+            return meeting_context.render(), decision, job.usage
+
+        def comment(payload, prompt_type):
+            context, decision, usage = payload
+            # ローカル判定で不要とされたチャンクはLLMを呼ばない（監査対象を除く）
+            if not decision["send"] and not decision["audit"]:
+                return None
+            # ツッコミは1件ずつ生成されるので、この呼び出しで増えた記録がこのチャンクの分
+            start = len(token_log)
+            tsukkomi = self.generate_tsukkomi(context, prompt_type, token_log)
+            # token_log は直近の分だけを持つ RollingLog の場合もあるので、末尾から増えた件数だけ取る
+            added = len(token_log) - start
+            calls = list(token_log)[-added:] if added else []
+            usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + sum(call["prompt_tokens"] for call in calls)
+            usage["completion_tokens"] = usage.get("completion_tokens", 0) + sum(call["completion_tokens"] for call in calls)
+            usage["cached_tokens"] = usage.get("cached_tokens", 0) + sum(call["cached_tokens"] for call in calls)
+            gate.record_result(decision, tsukkomi is not None)
+            return tsukkomi
+
+        def transcribe(audio_bytes, usage):
+            stats = []
+            text = self.transcribe_audio(audio_bytes, stats_log=stats)
+            audio_log.extend(stats)
+            for item in stats:
+                usage["upload_bytes"] = usage.get("upload_bytes", 0) + item["bytes_out"]
+                usage["audio_seconds"] = usage.get("audio_seconds", 0.0) + item["billed_seconds"]
+            return text
+
+        return ChunkPipeline(transcribe, comment, on_transcript)
@@ -0,0 +1,148 @@
+"""会議要約の段階的（map-reduce）生成
+
+チャンクが届くたびに一定数ごとの区間をバックグラウンドで部分要約（map）し、
+区間テキストのハッシュでキャッシュする。要約ボタンが押されたときは、
+キャッシュ済みの部分要約と未確定の末尾区間だけをまとめる（reduce）。
+区間の原文は部分要約が終わるまでしか持たない（失敗したときの再試行と代用のため）。
+"""
+
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def segment_hash(text):
+    """区間テキストのハッシュ"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IncrementalSummarizer:
+    """部分要約をキャッシュしながら会議要約を組み立てる
+
+    map_fn(text) は区間テキストの部分要約を返す（バックグラウンドスレッドで呼ばれる）。
+    reduce_fn(text) は部分要約をまとめた最終要約を返す。
+    """
+
+    def __init__(self, map_fn, reduce_fn, group_size=3, max_workers=2):
+        self.map_fn = map_fn
+        self.reduce_fn = reduce_fn
+        self.group_size = group_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary")
+        # add_chunkはパイプラインのワーカースレッドから呼ばれる
+        # （部分要約の完了時の処理は、submit 直後に完了していれば区間を確定したスレッドでそのまま走るので再入可能にする）
+        self._lock = threading.RLock()
+
+        self._partials = {}   # 区間ハッシュ -> 部分要約（完了前は Future）
+        self._segments = []   # 確定した区間のハッシュ
+        self._texts = {}      # 部分要約が済んでいない区間のハッシュ -> テキスト
+        self._buffer = []     # まだ区間にまとまっていないチャンク
+        self._final_key = None
+        self._final_result = None
+
+    def add_chunk(self, text):
+        """チャンクを追加し、区間が埋まったら部分要約をバックグラウンドで開始する"""
+        with self._lock:
+            self._buffer.append(text)
+            if len(self._buffer) >= self.group_size:
+                self._seal_buffer()
+
+    def _seal_buffer(self):
+        segment = "\n".join(self._buffer)
+        self._buffer = []
+        key = segment_hash(segment)
+        self._segments.append(key)
+        if key not in self._partials:
+            self._submit(key, segment)
+
+    def _submit(self, key, segment):
+        self._texts[key] = segment
+        future = self._executor.submit(self.map_fn, segment)
+        self._partials[key] = future
+        future.add_done_callback(lambda done: self._release_text(key, done))
+
+    def _release_text(self, key, future):
+        # 部分要約ができたら Future の代わりに結果の文字列だけを残し、原文は捨てる（失敗した区間は再試行のために残す）
+        if not future.cancelled() and future.exception() is None:
+            with self._lock:
+                self._partials[key] = future.result()
+                self._texts.pop(key, None)
+
+    def state(self):
+        """再開用に保存する状態（JSONに変換できる辞書）。部分要約が済んでいない区間は原文を持つ"""
+        with self._lock:
+            return {
+                "segments": list(self._segments),
+                "partials": {key: partial for key, partial in self._partials.items() if isinstance(partial, str)},
+                "texts": dict(self._texts),
+                "buffer": list(self._buffer),
+            }
+
+    def restore(self, state):
+        """state() の内容を読み込み、部分要約が済んでいない区間は要約し直す"""
+        with self._lock:
+            self._segments = list(state["segments"])
+            self._buffer = list(state["buffer"])
+            self._partials.update(state["partials"])
+            for key, segment in state["texts"].items():
+                if key not in self._partials:
+                    self._submit(key, segment)
+
+    def _partial_text(self, key):
+        """部分要約を取得する（失敗時は同期で再試行し、それも失敗したら原文を使う）"""
+        partial = self._partials[key]
+        if isinstance(partial, str):
+            return partial
+        try:
+            return partial.result()
+        except Exception:
+            segment = self._texts.get(key, "")
+            try:
+                result = self.map_fn(segment)
+            except Exception:
+                return segment
+            # 次回以降は再計算しないように成功結果を保存
+            with self._lock:
+                self._partials[key] = result
+                self._texts.pop(key, None)
+            return result
+
+    def pending_count(self):
+        """部分要約が未完了の区間数"""
+        # パイプラインのスレッドが区間を追加している最中でも数えられるように、ロックを取ってから数える
+        with self._lock:
+            partials = list(self._partials.values())
+        return sum(1 for partial in partials if not isinstance(partial, str) and not partial.done())
+
+    def summarize(self, reduce_fn=None):
+        """部分要約と末尾区間をまとめて最終要約を生成する（入力が同じならキャッシュを返す）
+
+        reduce_fn を渡すと、この呼び出しだけ既定の reduce_fn の代わりに使う（ストリーミング表示用など）。
+        """
+        with self._lock:
+            tail = "\n".join(self._buffer)
+            segments = list(self._segments)
+        final_key = segment_hash("|".join(segments) + "|" + tail)
+        if final_key == self._final_key and self._final_result:
+            return self._final_result
+
+        if segments:
+            parts = [
+                f"【部分要約 {i}】\n{self._partial_text(key)}"
+                for i, key in enumerate(segments, start=1)
+            ]
+            if tail:
+                parts.append(f"【直近の発言（未要約）】\n{tail}")
+            reduce_input = "以下は会議を時系列に区切った部分要約です。全体を一つの会議要約にまとめてください。\n\n" + "\n\n".join(parts)
+        else:
+            # 短い会議は部分要約を挟まずそのまま要約する
+            reduce_input = tail
+
+        result = (reduce_fn or self.reduce_fn)(reduce_input)
+        if result:
+            self._final_key = final_key
+            self._final_result = result
+        return result
+
+    def close(self):
+        """バックグラウンドスレッドを停止する"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,44 @@
+"""トークン数の見積もり"""
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:
+    # tiktokenが無い環境では文字種ごとの概算で代用する
+    _ENCODING = None
+
+
+def estimate_tokens(text):
+    """テキストのトークン数を見積もる"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+
+    # 概算: ASCIIは4文字で1トークン、それ以外（日本語など）は1文字1トークン
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def truncate_to_tokens(text, max_tokens, keep="head"):
+    """トークン数が上限に収まるようにテキストを切り詰める
+
+    keep="head" なら先頭を、keep="tail" なら末尾を残す。
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # 二分探索で収まる最大の文字数を求める
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        part = text[:mid] if keep == "head" else text[-mid:]
+        if estimate_tokens(part) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    if low == 0:
+        return ""
+    return text[:low] if keep == "head" else text[-low:]
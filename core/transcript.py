@@ -0,0 +1,76 @@
+"""追記専用の文字起こしストア
+
+チャンクごとの文字起こしを1回だけ保持し、表示用の文字列（新しい順）と
+文字数・トークン数を追記のたびに差分で更新する。再描画のたびに全文を組み立て直さない。
+max_segments を指定するとメモリ上には直近の件数だけを残す（全文は会議ジャーナル側に残る）。
+"""
+
+import threading
+from collections import deque
+
+from core.tokens import estimate_tokens
+
+
+class Segment:
+    """1チャンク分の文字起こし"""
+
+    __slots__ = ("chunk", "time", "text", "line", "tokens")
+
+    def __init__(self, chunk, time, text):
+        self.chunk = chunk
+        self.time = time
+        self.text = text
+        self.line = f"[{time}] {text}"
+        self.tokens = estimate_tokens(self.line)
+
+
+class TranscriptStore:
+    """文字起こしの追記専用リストと、差分更新される表示用キャッシュ"""
+
+    def __init__(self, max_segments=None):
+        self._lock = threading.Lock()
+        self._segments = deque(maxlen=max_segments)
+        self._reversed = ""
+        # 件数・文字数・トークン数はメモリから追い出した分も含めた合計
+        self.total = 0
+        self.char_count = 0
+        self.token_count = 0
+        self.version = 0
+
+    def append(self, chunk, time, text):
+        """チャンクを追記し、表示用の文字列を更新する"""
+        segment = Segment(chunk, time, text)
+        with self._lock:
+            self._push(segment)
+            self.total += 1
+            self.char_count += len(segment.line)
+            self.token_count += segment.tokens
+            self.version += 1
+        return segment
+
+    def _push(self, segment):
+        """表示用の文字列を差分で更新する（ロック保持中に呼ぶ）"""
+        if len(self._segments) == self._segments.maxlen:
+            # 上限に達していれば最も古い行を末尾から切り落とす
+            oldest = self._segments[0]
+            self._reversed = self._reversed[:-(len(oldest.line) + 2)] if len(self._segments) > 1 else ""
+        self._segments.append(segment)
+        # 新しい行を先頭に置き、空行で区切る
+        self._reversed = f"{segment.line}\n\n{self._reversed}" if self._reversed else segment.line
+
+    def restore(self, rows, total, char_count, token_count):
+        """会議ジャーナルから直近の行と合計値を読み込む（rows は chunk/time/text を持つ辞書、古い順）"""
+        with self._lock:
+            for row in rows:
+                self._push(Segment(row["chunk"], row["time"], row["text"]))
+            self.total = total
+            self.char_count = char_count
+            self.token_count = token_count
+            self.version += 1
+
+    def __bool__(self):
+        return self.total > 0
+
+    def reversed_text(self):
+        """新しいものが先頭に来るテキスト（画面表示用）"""
+        return self._reversed
@@ -0,0 +1,45 @@
+"""音声区間検出（VAD）
+
+フレームごとのエネルギーを雑音レベルと比較する簡易VAD。NumPyでまとめて計算し、
+録音の前後の無音を切り詰め、発話の無いチャンクはAPIに送る前に捨てる。
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def speech_bounds(samples, rate, frame_ms=30, margin_db=12.0, floor_db=-50.0, max_noise_db=-40.0,
+                  min_speech_ms=300, pad_ms=200, hangover_ms=300):
+    """発話区間の (開始サンプル, 終了サンプル) を返す（発話が無ければNone）
+
+    samples は [-1, 1] のモノラルfloat配列（NumPy必須）。雑音レベル（フレームエネルギーの10パーセンタイル）より
+    margin_db 以上大きく、かつ floor_db を超えるフレームを発話とみなす。
+    全体が発話で埋まっている録音で雑音レベルを高く見積もりすぎないよう、雑音レベルは max_noise_db で頭打ちにする。
+    """
+    frame = max(1, int(rate * frame_ms / 1000))
+    count = len(samples) // frame
+    if count == 0:
+        return None
+
+    frames = samples[:count * frame].reshape(count, frame)
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    noise_db = min(float(np.percentile(energy_db, 10)), max_noise_db)
+    active = energy_db > max(noise_db + margin_db, floor_db)
+
+    # 合計の発話時間が短すぎるもの（咳やクリック音など）は無音扱い
+    if active.sum() * frame_ms < min_speech_ms:
+        return None
+
+    # 語尾や息継ぎで切れないように前後にハングオーバーを付ける
+    hangover = int(hangover_ms / frame_ms)
+    if hangover:
+        active = np.convolve(active, np.ones(2 * hangover + 1), mode="same") > 0
+
+    indices = np.flatnonzero(active)
+    pad = int(rate * pad_ms / 1000)
+    start = max(0, int(indices[0]) * frame - pad)
+    end = min(len(samples), (int(indices[-1]) + 1) * frame + pad)
+    return start, end
+
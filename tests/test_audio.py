@@ -0,0 +1,70 @@
+"""core/audio.py の変換・分割のテスト"""
+
+import struct
+
+import numpy as np
+
+from core.audio import MAX_UPLOAD_BYTES, preprocess_audio, read_wav, split_wav, to_mono_wav, write_wav
+
+
+def float_wav(seconds=1.0, rate=16000):
+    """wave モジュールでは読めない32bit浮動小数点（フォーマット3）のWAV"""
+    data = (0.3 * np.sin(np.arange(int(seconds * rate)) / 5)).astype("<f4").tobytes()
+    fmt = struct.pack("<HHIIHH", 3, 1, rate, rate * 4, 4, 32)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def tone_wav(seconds, rate=16000, channels=1, quiet=()):
+    """16bit PCMの正弦波。quiet の (開始秒, 終了秒) の区間だけ無音にする"""
+    t = np.arange(int(seconds * rate)) / rate
+    samples = 0.5 * np.sin(2 * np.pi * 440 * t)
+    for start, end in quiet:
+        samples[int(start * rate):int(end * rate)] = 0.0
+    pcm = (samples * 32767).astype("<i2")
+    return write_wav(np.repeat(pcm, channels).tobytes(), channels, 2, rate)
+
+
+def test_split_wav_keeps_small_input_whole():
+    audio = tone_wav(5.0)
+    assert split_wav(audio, max_bytes=len(audio)) == [(0.0, audio)]
+
+
+def test_split_wav_cuts_at_quiet_positions():
+    # 20秒分が上限。探索範囲（上限直前10秒）の中の無音で区切られる
+    audio = tone_wav(50.0, quiet=[(15.0, 15.5), (32.0, 32.5)])
+    max_bytes = 44 + 20 * 16000 * 2
+    segments = split_wav(audio, max_bytes=max_bytes)
+
+    starts = [start for start, _ in segments]
+    assert len(segments) == 3
+    assert starts[0] == 0.0
+    assert 15.0 <= starts[1] <= 15.5
+    assert 32.0 <= starts[2] <= 32.5
+    assert all(len(wav) <= max_bytes for _, wav in segments)
+    # 区切っても音声は欠けも重なりもしない
+    assert b"".join(read_wav(wav)[1] for _, wav in segments) == read_wav(audio)[1]
+
+
+def test_split_wav_fits_upload_budget():
+    # 48kHzステレオは約131秒で24MBを超える
+    audio = tone_wav(300.0, rate=48000, channels=2, quiet=[(125.0, 126.0), (250.0, 251.0)])
+    segments = split_wav(audio)
+
+    assert len(audio) > 2 * MAX_UPLOAD_BYTES
+    starts = [start for start, _ in segments]
+    assert len(segments) == 3
+    assert 125.0 <= starts[1] <= 126.0
+    assert 250.0 <= starts[2] <= 251.0
+    assert all(len(wav) <= MAX_UPLOAD_BYTES for _, wav in segments)
+    assert sum(len(read_wav(wav)[1]) for _, wav in segments) == len(read_wav(audio)[1])
+
+
+def test_unreadable_wav_is_uploaded_unchanged(monkeypatch):
+    monkeypatch.setattr("core.audio.FFMPEG", None)
+    audio = float_wav()
+    assert to_mono_wav(audio) is None
+
+    uploads, stats = preprocess_audio(audio)
+    assert uploads == [(0.0, audio, "audio.wav")]
+    assert not stats["dropped"]
@@ -0,0 +1,18 @@
+"""batch.py の録音の分割のテスト"""
+
+from batch import split_recording
+from bench.run import synthetic_chunk
+from tests.test_audio import float_wav
+
+
+def test_split_recording_splits_wav_near_chunk_length():
+    chunks, duration = split_recording(synthetic_chunk(25.0, seed=1), chunk_seconds=10)
+    assert duration == 25.0
+    assert [round(offset) for offset, _ in chunks][0] == 0
+    assert 3 <= len(chunks) <= 4
+
+
+def test_split_recording_keeps_unreadable_wav_as_one_chunk(monkeypatch):
+    monkeypatch.setattr("core.audio.FFMPEG", None)
+    audio = float_wav(3.0)
+    assert split_recording(audio, chunk_seconds=1) == ([(0.0, audio)], None)
@@ -0,0 +1,56 @@
+"""core/pipeline.py のテスト"""
+
+import threading
+import time
+
+from core.pipeline import ChunkPipeline
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_on_transcript_runs_in_chunk_order():
+    # 後のチャンクほど文字起こしが速くても、会議コンテキストへの反映はチャンク順
+    order = []
+
+    def transcribe(audio, usage):
+        time.sleep(audio)
+        return f"text {audio}"
+
+    def on_transcript(job):
+        order.append(job.chunk)
+        return job.transcript
+
+    pipeline = ChunkPipeline(transcribe, lambda context, prompt_type: None, on_transcript, transcribe_workers=4)
+    jobs = [pipeline.submit(chunk, "00:00", 0.04 - chunk * 0.01, "otokomae") for chunk in range(4)]
+    wait_until(lambda: all(job.finished for job in jobs))
+    assert order == [0, 1, 2, 3]
+    assert [job.chunk for job in pipeline.collect()] == [0, 1, 2, 3]
+    pipeline.close()
+
+
+def test_collect_does_not_wait_for_on_transcript():
+    entered, release = threading.Event(), threading.Event()
+
+    def on_transcript(job):
+        entered.set()
+        release.wait(5)
+        return job.transcript
+
+    pipeline = ChunkPipeline(lambda audio, usage: "text", lambda context, prompt_type: None, on_transcript)
+    job = pipeline.submit(1, "00:00", b"", "otokomae")
+    try:
+        assert entered.wait(5)
+        started = time.perf_counter()
+        assert pipeline.collect() == []
+        assert pipeline.active_jobs() == [job]
+        assert time.perf_counter() - started < 0.5
+    finally:
+        release.set()
+    wait_until(lambda: job.finished)
+    assert pipeline.collect() == [job]
+    pipeline.close()
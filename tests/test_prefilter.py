@@ -0,0 +1,71 @@
+"""core/prefilter.py のツッコミ判定のテスト"""
+
+import random
+
+from core.prefilter import TsukkomiGate
+
+AGENDA = ["今日は決済画面のリニューアルの進め方を決めます", "決済画面のデザイン案を三つ比べて決めましょう"]
+
+
+def test_calling_the_character_always_sends():
+    gate = TsukkomiGate(threshold=2.0, audit_rate=0.0)
+    for text in AGENDA:
+        assert not gate.evaluate(text, now=0.0)["send"]
+
+    for text in ["男前くん、どう思う？", "オトメちゃんにも聞いてみよう", "OTOKO MAEの意見は"]:
+        decision = gate.evaluate(text, now=0.0)
+        assert decision["called"] and decision["send"] and not decision["audit"]
+    assert gate.counts["sent"] == 3
+
+
+def test_drift_from_agenda_raises_score():
+    gate = TsukkomiGate(time_weight=0.0)
+    for text in AGENDA:
+        gate.evaluate(text, now=0.0)
+    on_topic = gate.evaluate("決済画面のデザイン案はB案が良さそうです", now=0.0)
+    off_topic = gate.evaluate("昨日の野球の試合は延長戦までもつれました", now=0.0)
+    assert off_topic["drift"] > on_topic["drift"]
+    assert off_topic["score"] > on_topic["score"]
+
+
+def test_audit_rate_controls_sampling():
+    never = TsukkomiGate(threshold=2.0, audit_rate=0.0)
+    always = TsukkomiGate(threshold=2.0, audit_rate=1.0)
+    for i in range(20):
+        assert not never.evaluate(f"発言{i}", now=0.0)["audit"]
+        assert always.evaluate(f"発言{i}", now=0.0)["audit"]
+    assert never.counts["audited"] == 0
+    assert always.counts["audited"] == 20
+
+
+def test_audit_sampling_follows_rng():
+    def audits(seed):
+        gate = TsukkomiGate(threshold=2.0, audit_rate=0.3, rng=random.Random(seed))
+        return [gate.evaluate(f"発言{i}", now=0.0)["audit"] for i in range(200)]
+
+    assert audits(1) == audits(1)
+    assert 30 < sum(audits(1)) < 90
+
+
+def test_recall_estimate_from_audits():
+    gate = TsukkomiGate(threshold=2.0, audit_rate=0.5, rng=random.Random(0))
+    for i in range(10):
+        gate.record_result(gate.evaluate(f"男前くん{i}", now=0.0), spoke=True)
+    for i in range(100):
+        decision = gate.evaluate(f"発言{i}", now=0.0)
+        if decision["audit"]:
+            gate.record_result(decision, spoke=True)
+
+    stats = gate.stats()
+    audited = gate.counts["audited"]
+    assert stats["sent"] == 10 and stats["skipped"] == 100
+    assert stats["avoided"] == 100 - audited
+    # 監査したチャンクがすべて発話したので、送らなかった100件すべてを取りこぼしと見積もる
+    assert stats["recall_estimate"] == 10 / (10 + 100)
+
+
+def test_term_table_stays_bounded():
+    gate = TsukkomiGate(max_terms=100)
+    for i in range(300):
+        gate.evaluate(f"話題{i}番について{i * 7}件の確認", now=0.0)
+    assert len(gate._doc_freq) <= 100
@@ -0,0 +1,69 @@
+"""core/scheduler.py のチャンク長調整のテスト"""
+
+from core.scheduler import ChunkScheduler
+
+
+def run_chunks(scheduler, latencies, backlog=0):
+    """処理時間 latencies のチャンクを順に完了させ、各回のチャンク長を返す"""
+    lengths = []
+    for chunk, latency in enumerate(latencies, start=1):
+        scheduler.submitted(chunk, now=0.0)
+        lengths.append(scheduler.finished(chunk, backlog=backlog, now=latency))
+    return lengths
+
+
+def steps(start, lengths):
+    previous = [start] + lengths[:-1]
+    return [length - before for before, length in zip(previous, lengths)]
+
+
+def test_fast_processing_grows_toward_target_in_limited_steps():
+    scheduler = ChunkScheduler(min_seconds=30, max_seconds=180, target_delay=90.0, smoothing=1.0)
+    lengths = run_chunks(scheduler, [5.0] * 6)
+    assert lengths == [45, 60, 75, 85, 85, 85]
+    assert all(abs(step) <= 15 for step in steps(30, lengths))
+    assert scheduler.expected_delay() == 90.0
+
+
+def test_slow_processing_shrinks_in_limited_steps():
+    scheduler = ChunkScheduler(min_seconds=30, max_seconds=180, target_delay=240.0, smoothing=1.0)
+    run_chunks(scheduler, [5.0] * 20)
+    assert scheduler.chunk_seconds == 180
+
+    scheduler.target_delay = 90.0
+    lengths = run_chunks(scheduler, [40.0] * 10)
+    # 処理時間 / max_utilization = 50秒 より短くはしない
+    assert lengths[-1] == 50
+    assert all(-15 <= step <= 0 for step in steps(180, lengths))
+
+
+def test_length_stays_within_bounds():
+    scheduler = ChunkScheduler(min_seconds=30, max_seconds=60, target_delay=240.0, smoothing=1.0)
+    assert max(run_chunks(scheduler, [1.0] * 10)) == 60
+
+    scheduler = ChunkScheduler(min_seconds=60, max_seconds=180, target_delay=30.0, smoothing=1.0)
+    assert run_chunks(scheduler, [1.0] * 5) == [60] * 5
+
+
+def test_backlog_lengthens_chunks():
+    scheduler = ChunkScheduler(min_seconds=30, max_seconds=180, target_delay=40.0, smoothing=1.0)
+    assert run_chunks(scheduler, [5.0] * 3) == [35, 35, 35]
+    assert run_chunks(scheduler, [5.0] * 3, backlog=3) == [50, 65, 80]
+
+
+def test_set_bounds_clamps_current_length():
+    scheduler = ChunkScheduler(min_seconds=30, max_seconds=180, target_delay=240.0, smoothing=1.0)
+    run_chunks(scheduler, [5.0] * 10)
+    assert scheduler.chunk_seconds == 180
+
+    scheduler.set_bounds(30, 120)
+    assert scheduler.chunk_seconds == 120
+    scheduler.set_bounds(150, 180, target_delay=90.0)
+    assert scheduler.chunk_seconds == 150
+    assert scheduler.target_delay == 90.0
+
+
+def test_unknown_chunk_keeps_length():
+    scheduler = ChunkScheduler()
+    assert scheduler.finished(1) == 30
+    assert scheduler.latency is None and scheduler.expected_delay() is None
@@ -0,0 +1,127 @@
+"""core/search.py の転置インデックスのテスト"""
+
+import json
+
+from core.search import TranscriptIndex, _decode, _encode
+
+
+def encode_docs(docs):
+    """通し番号の昇順リストを TranscriptIndex と同じ差分の可変長バイト列にする"""
+    out = bytearray()
+    previous = 0
+    for doc in docs:
+        _encode(doc - previous, out)
+        previous = doc
+    return out
+
+
+def build_index(texts, **kwargs):
+    index = TranscriptIndex(**kwargs)
+    for chunk, text in enumerate(texts, start=1):
+        index.add(chunk, f"00:{chunk:02d}:00", text)
+    return index
+
+
+def test_varint_round_trip():
+    docs = [0, 1, 127, 128, 300, 16383, 16384, 2 ** 21, 2 ** 32 - 1]
+    assert list(_decode(encode_docs(docs))) == docs
+
+
+def test_varint_sizes():
+    for value, size in [(0, 1), (127, 1), (128, 2), (16383, 2), (16384, 3), (2 ** 32 - 1, 5)]:
+        out = bytearray()
+        _encode(value, out)
+        assert len(out) == size
+
+
+def test_postings_survive_many_chunks():
+    index = TranscriptIndex()
+    for chunk in range(1, 1001):
+        index.add(chunk * 3, "00:00:00", "決済の話" if chunk % 7 == 0 else "雑談")
+    results = index.search("決済", limit=1000)
+    assert [result["chunk"] for result in results] == [chunk * 3 for chunk in range(1000, 0, -1) if chunk % 7 == 0]
+
+
+TEXTS = [
+    "決済画面のテストを来週までに終わらせます",
+    "決済の画面はデザインを見直します",
+    "ログイン画面のテストは完了しました",
+    "決済画面のテスト環境がまだ用意できていません",
+    "ＡＰＩの仕様変更について確認します",
+]
+
+
+def test_search_requires_all_terms_newest_first():
+    index = build_index(TEXTS)
+    results = index.search("決済 テスト")
+    assert [result["chunk"] for result in results] == [4, 1]
+    assert results[0]["text"] == TEXTS[3]
+    assert results[0]["score"] == 2
+
+
+def test_search_matches_phrases_exactly():
+    index = build_index(TEXTS)
+    # 「決済画面」のbigramはすべて2番にも含まれるが、語句としては含まれない
+    assert [result["chunk"] for result in index.search("決済画面")] == [4, 1]
+    assert index.search("決済画面 ログイン") == []
+
+
+def test_search_normalizes_width_and_case():
+    index = build_index(TEXTS)
+    assert [result["chunk"] for result in index.search("api")] == [5]
+    assert [result["chunk"] for result in index.search("API 仕様")] == [5]
+
+
+def test_search_single_character_term():
+    index = build_index(TEXTS)
+    assert [result["chunk"] for result in index.search("決済 来")] == [1]
+
+
+def test_search_reads_texts_through_fetch():
+    texts = {chunk: (f"00:{chunk:02d}:00", text) for chunk, text in enumerate(TEXTS, start=1)}
+    requested = []
+
+    def fetch(chunks):
+        requested.append(chunks)
+        return {chunk: texts[chunk] for chunk in chunks if chunk in texts}
+
+    index = TranscriptIndex(fetch=fetch)
+    for chunk, (time, text) in texts.items():
+        index.add(chunk, time, text)
+    assert [result["chunk"] for result in index.search("テスト")] == [4, 3, 1]
+    assert requested == [[4, 3, 1]]
+
+
+RELATED_TEXTS = [
+    "朝会の進め方を話しました",
+    "決済代行会社の審査が通りました",
+    "懇親会の場所を決めます",
+    "決済代行会社の審査書類と手数料の見積もりを確認します",
+    "来月の採用面接の日程を調整します",
+    "オフィスの座席表を更新しました",
+    "議事録は共有フォルダに置きます",
+]
+
+
+def test_related_orders_by_shared_rare_grams():
+    index = build_index(RELATED_TEXTS)
+    results = index.related("決済代行会社の審査書類と手数料", limit=3)
+    assert [result["chunk"] for result in results] == [4, 2]
+    assert results[0]["score"] > results[1]["score"]
+
+
+def test_related_excludes_recent_chunks():
+    index = build_index(RELATED_TEXTS)
+    results = index.related("決済代行会社の審査書類と手数料", exclude_recent=4)
+    assert [result["chunk"] for result in results] == [2]
+    assert index.related("決済代行会社", exclude_recent=len(RELATED_TEXTS)) == []
+
+
+def test_state_round_trip():
+    index = build_index(TEXTS)
+    restored = TranscriptIndex()
+    restored.restore(json.loads(json.dumps(index.state())))
+    assert len(restored) == len(index)
+    assert restored.search("決済 テスト") == index.search("決済 テスト")
+    restored.add(6, "00:06:00", "決済画面のテストを再開します")
+    assert [result["chunk"] for result in restored.search("決済画面 テスト")] == [6, 4, 1]
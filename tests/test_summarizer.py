@@ -0,0 +1,36 @@
+"""core/summarizer.py のテスト"""
+
+import threading
+
+from core.summarizer import IncrementalSummarizer
+
+
+def test_pending_count_while_segments_are_added():
+    release = threading.Event()
+
+    def slow_map(text):
+        release.wait(5)
+        return "部分要約"
+
+    summarizer = IncrementalSummarizer(slow_map, lambda text: text, group_size=1, max_workers=1)
+    errors = []
+
+    def add_chunks():
+        for i in range(2000):
+            summarizer.add_chunk(f"発言{i}")
+
+    writer = threading.Thread(target=add_chunks)
+    try:
+        writer.start()
+        while writer.is_alive():
+            try:
+                summarizer.pending_count()
+            except RuntimeError as e:
+                errors.append(e)
+                break
+        writer.join()
+        assert not errors
+        assert summarizer.pending_count() == 2000
+    finally:
+        summarizer.close()
+        release.set()